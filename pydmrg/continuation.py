@@ -0,0 +1,165 @@
+import numpy as np
+import copy
+from dmrg import *
+
+VERBOSE = 10
+
+############################################################################
+# Parameter continuation for scans over the bias s
+#
+# Each point of the scan starts from the states of the previous points,
+# extrapolated linearly in s, with only the environments (which depend on
+# the new mpo) refreshed. The step in s follows the curvature of the energy
+# (and the change in the gap), so smooth regions are crossed in large
+# steps with only one or two sweeps per point.
+###########################################################################
+
+def extrapolate_mps(mpsL,mpsLprev,t,gaugeSite):
+    # Linear extrapolation psi + t*(psi-psiPrev) of each state (the secant
+    # through the last two points). It is done within the basis of psi, so
+    # only the gauge site changes, with the previous state projected onto
+    # that basis through the overlap environments.
+    guess = copy.deepcopy(mpsL)
+    for state in range(len(mpsL)):
+        C = mpsL[state][gaugeSite]
+        prev = init_deflate(mpsL[state],[mpsLprev[state]],0.,gaugeSite=gaugeSite)
+        P,_,_ = deflate_vecs(mpsL[state],prev,gaugeSite)
+        Cprev = np.reshape(P[:,0],C.shape)
+        # Remove the arbitrary phase of the previous eigenvector
+        ovlp = np.sum(np.conj(C)*Cprev)
+        if np.abs(ovlp) > 0.: Cprev = Cprev*np.conj(ovlp)/np.abs(ovlp)
+        Cnew = C+t*(C-Cprev)
+        guess[state][gaugeSite] = Cnew/np.linalg.norm(Cnew)
+    return guess
+
+def continuation_env(guess,mpo,mbd,gaugeSite,calcLeftState=False,twoSided=False,
+                     env=None,mpoPrev=None):
+    # Environments of the guess for the new mpo. The environments of the
+    # previous point (env for mpoPrev) stay valid for the guess, which only
+    # differs at the gauge site, so only their blocks depending on changed
+    # mpo sites are recomputed.
+    if calcLeftState:
+        if env is not None:
+            return [refresh_env(guess[0][0],mpoPrev,mpo,env[0],gaugeSite=gaugeSite),
+                    refresh_env(guess[1][0],mpo_conj_trans(mpoPrev),mpo_conj_trans(mpo),env[1],gaugeSite=gaugeSite)]
+        env = calc_env(guess[0][0],mpo,mbd,gaugeSite=gaugeSite)
+        envl = calc_env(guess[1][0],mpo_conj_trans(mpo),mbd,gaugeSite=gaugeSite)
+        return [env,envl]
+    elif twoSided:
+        M = guess[0][0]
+    else:
+        M = guess[0]
+    if env is not None:
+        return refresh_env(M,mpoPrev,mpo,env,gaugeSite=gaugeSite)
+    return calc_env(M,mpo,mbd,gaugeSite=gaugeSite)
+
+def adapt_step(sVec,E,gap,ds,dsMin,dsMax,extrapTol=1e-3,gapTol=0.1):
+    # Choose the next step so the error of a linear prediction of E,
+    # 0.5*|E''|*ds^2, is about extrapTol (changing ds by at most a factor
+    # of two), and halve it if the relative change in the gap is above gapTol
+    if len(sVec) < 3: return ds
+    s0,s1,s2 = sVec[-3:]
+    E0,E1,E2 = np.real(E[-3:])
+    curv = 2.*((E2-E1)/(s2-s1)-(E1-E0)/(s1-s0))/(s2-s0)
+    err = 0.5*np.abs(curv)*ds**2
+    if err > 0.:
+        factor = min(2.,max(0.5,np.sqrt(extrapTol/err)))
+    else:
+        factor = 2.
+    if (gapTol is not None) and (gap[-1] is not None) and (gap[-2] is not None):
+        if np.abs(gap[-1]-gap[-2]) > gapTol*np.abs(gap[-1]): factor = min(factor,0.5)
+    return min(max(ds*factor,dsMin),dsMax)
+
+def run_continuation(mpoFun,s0,sF,ds=0.01,dsMin=1e-4,dsMax=0.1,
+                     extrap='linear',extrapTol=1e-3,gapTol=0.1,
+                     mbd=10,tol=1e-5,maxIter=10,minIter=0,
+                     nStates=1,targetState=0,alg='davidson',
+                     oneSite=True,truncTol=None,expand=None,
+                     calcLeftState=False,twoSided=False,
+                     midSweepStop=True,precond='auto',
+                     gaugeSiteSave=None,fname=None,returnState=False):
+    # Scan s from s0 to sF, with mpoFun(s) returning the mpo at s.
+    # The first point is run at all bond dimensions in mbd, the rest at
+    # the last one, starting from the previous states (extrapolated if
+    # extrap is 'linear', reused as they are if it is None)
+    # Returns s, E, EE, gap & the number of half sweeps at each point
+    # (and the states if returnState)
+    if hasattr(mbd,'__len__'):
+        mbdCont = mbd[-1]
+    else:
+        mbdCont = mbd
+    direction = np.sign(sF-s0)
+    sVec,Evec,EEvec,gapVec,nSweeps,states = [],[],[],[],[],[]
+    env,mpoPrev = None,None
+    s = s0
+    while True:
+        mpo = mpoFun(s)
+        N = len(mpo[0])
+        if gaugeSiteSave is None: gaugeSiteSave = int(N/2)+1
+        # Warm start from the previous states
+        initGuess,initEnv,Eguess,mbdi = None,None,None,mbd
+        if len(states) > 0:
+            mbdi = mbdCont
+            initGuess = states[-1]
+            Eguess = Evec[-1]
+            if (extrap == 'linear') and (len(states) > 1):
+                t = (s-sVec[-1])/(sVec[-1]-sVec[-2])
+                Eguess = Evec[-1]+t*(Evec[-1]-Evec[-2])
+                if calcLeftState or twoSided:
+                    initGuess = [extrapolate_mps(states[-1][i],states[-2][i],t,gaugeSiteSave) for i in range(2)]
+                else:
+                    initGuess = extrapolate_mps(states[-1],states[-2],t,gaugeSiteSave)
+            initEnv = continuation_env(initGuess,mpo,mbdCont,gaugeSiteSave,
+                                       calcLeftState=calcLeftState,
+                                       twoSided=twoSided,
+                                       env=env,
+                                       mpoPrev=mpoPrev)
+        fname_s = None
+        if fname is not None: fname_s = fname+'s'+str(len(sVec))
+        if VERBOSE > 0: print('Continuation Point s = {}'.format(s))
+        E,EE,gap,state,env,hist = run_dmrg(mpo,
+                                           initGuess=initGuess,
+                                           initEnv=initEnv,
+                                           guessGaugeSite=gaugeSiteSave,
+                                           Eguess=Eguess,
+                                           mbd=mbdi,
+                                           tol=tol,
+                                           maxIter=maxIter,
+                                           minIter=minIter,
+                                           fname=fname_s,
+                                           nStates=nStates,
+                                           targetState=targetState,
+                                           alg=alg,
+                                           gaugeSiteSave=gaugeSiteSave,
+                                           returnState=True,
+                                           returnEnv=True,
+                                           returnConv=True,
+                                           oneSite=oneSite,
+                                           truncTol=truncTol,
+                                           expand=expand,
+                                           calcLeftState=calcLeftState,
+                                           twoSided=twoSided,
+                                           midSweepStop=midSweepStop,
+                                           precond=precond)
+        # Keep results of the final bond dimension
+        if calcLeftState: hist = hist[0]
+        if hasattr(mbdi,'__len__') and (len(mbdi) > 1):
+            E,EE,gap = E[-1],EE[-1],gap[-1]
+        sVec.append(s)
+        Evec.append(E)
+        EEvec.append(EE)
+        gapVec.append(gap)
+        nSweeps.append(len(hist[-1]['E']))
+        states.append(state)
+        mpoPrev = mpo
+        # Only the last two points are needed for the guess
+        if not returnState and (len(states) > 2): states[-3] = None
+        if VERBOSE > 0: print('\ts = {}, E = {}, Half Sweeps = {}'.format(s,E,nSweeps[-1]))
+        if direction*(sF-s) <= 0.: break
+        # Take the next step, ending exactly at sF
+        if len(sVec) > 1: ds = adapt_step(sVec,Evec,gapVec,ds,dsMin,dsMax,extrapTol=extrapTol,gapTol=gapTol)
+        s = s+direction*ds
+        if direction*(sF-s) < 0.: s = sF
+    output = [np.array(sVec),np.array(Evec),np.array(EEvec),np.array(gapVec),np.array(nSweeps)]
+    if returnState: output.append(states)
+    return output
@@ -9,205 +9,660 @@ from tools.mpo_tools import *
 from tools.diag_tools import *
 from tools.env_tools import *
 from tools.contract import *
+from tools.qn_tools import *
+from tools.einsum_tools import einsum_cached
 import warnings
+import time
 
 VERBOSE = 10
 
-def calcRDM(M,swpDir):
-    if swpDir == 'right':
-        (n1,n2,n3) = M.shape
-        M = np.swapaxes(M,0,1)
-        M = np.reshape(M,(n2*n1,n3))
-        return einsum('ij,kj->ik',M,np.conj(M))
-    elif swpDir == 'left':
-        (n1,n2,n3) = M.shape
-        M = np.swapaxes(M,0,1)
-        M = np.reshape(M,(n2,n1*n3))
-        return einsum('ij,ik->jk',M,np.conj(M))
-
-def calc_ent_right(M,v,site):
-    (n1,n2,n3) = M[site].shape
-    Mtmp = np.reshape(v,(n1,n2,n3))
-    M_reshape = np.reshape(Mtmp,(n1*n2,n3))
-    (_,S,_) = np.linalg.svd(M_reshape,full_matrices=False)
-    EE,EEs = calc_entanglement(S)
-    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
-    return EE, EEs
-
-def calc_ent_left(M,v,site):
-    (n1,n2,n3) = M[site].shape
-    Mtmp = np.reshape(v,(n1,n2,n3))
-    M_reshape = np.swapaxes(Mtmp,0,1)
-    M_reshape = np.reshape(M_reshape,(n2,n1*n3))
-    (_,S,_) = np.linalg.svd(M_reshape,full_matrices=False)
-    EE,EEs = calc_entanglement(S)
-    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
-    return EE, EEs
+def expand_subspaceR(v,W,F,site,shape,nStates=1,alpha=1e-4):
+    # Projected action of the mpo on the optimized site, used to
+    # enrich the left basis kept at site (subspace expansion)
+    (n1,n2,n3) = shape
+    _,nStatesCalc = v.shape
+    nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    P = []
+    for i in range(nStatesAvg):
+        vReshape = np.reshape(v[:,i],(n1,n2,n3))
+        for mpoInd in range(len(W)):
+            if W[mpoInd][site] is None:
+                Pi = einsum_cached('pnm,omk->ponk',env_dense(F[mpoInd][site]),vReshape)
+            else:
+                Pi = einsum_cached('pnm,njol,lmk->pojk',env_dense(F[mpoInd][site]),W[mpoInd][site],vReshape)
+            P.append(alpha*np.sqrt(w)*np.reshape(Pi,(n2*n1,-1)))
+    return np.concatenate(P,axis=1)
+
+def expand_subspaceL(v,W,F,site,shape,nStates=1,alpha=1e-4):
+    # Projected action of the mpo on the optimized site, used to
+    # enrich the right basis kept at site (subspace expansion)
+    (n1,n2,n3) = shape
+    _,nStatesCalc = v.shape
+    nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    P = []
+    for i in range(nStatesAvg):
+        vReshape = np.reshape(v[:,i],(n1,n2,n3))
+        for mpoInd in range(len(W)):
+            if W[mpoInd][site] is None:
+                Pi = einsum_cached('ijk,lmk->jmli',env_dense(F[mpoInd][site+1]),vReshape)
+            else:
+                Pi = einsum_cached('ijk,njol,lmk->nmoi',env_dense(F[mpoInd][site+1]),W[mpoInd][site],vReshape)
+            P.append(alpha*np.sqrt(w)*np.reshape(Pi,(-1,n1*n3)))
+    return np.concatenate(P,axis=0)
 
-def renormalizeR(mpsL,v,site,nStates=1,targetState=0):
+def renormalizeR(mpsL,v,site,nStates=1,targetState=0,qn=None,P=None,mbd=None):
     (n1,n2,n3) = mpsL[0][site].shape
-    # Try to calculate Entanglement?
-    EE,EEs = calc_ent_right(mpsL[0],v[:,targetState],site)
-    # Calculate the reduced density matrix
+    # The bond dimension can only grow when the basis is expanded
+    nKeep = n3
+    if (P is not None) and (mbd is not None):
+        (n4,_,n6) = mpsL[0][site+1].shape
+        nKeep = min(mbd,n4*n6)
+    # Put all states into matrices, weighting them equally
     _,nStatesCalc = v.shape
     nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    psiL = []
     for i in range(nStatesAvg):
-        if nStatesAvg != 1: 
-            vtmp = v[:,i]
-        else:
-            vtmp  = v
-        vReshape = np.reshape(vtmp,(n1,n2,n3))
-        w = 1./float(nStatesAvg)
-        if i == 0:
-            rdm = w*calcRDM(vReshape,'right')
-        else:
-            rdm +=w*calcRDM(vReshape,'right')
-    # Take eigenvalues of the rdm
-    vals,vecs = np.linalg.eig(rdm)
-    # Sort Inds
-    inds = np.argsort(vals)[::-1]
-    # Keep only maxBondDim eigenstates
-    inds = inds[:n3]
-    vals = vals[inds]
-    vecs = vecs[:,inds]
-    # Make sure vecs are orthonormal
-    vecs = sla.orth(vecs)
+        vReshape = np.reshape(v[:,i],(n1,n2,n3))
+        vReshape = np.swapaxes(vReshape,0,1)
+        psiL.append(np.sqrt(w)*np.reshape(vReshape,(n2*n1,n3)))
+    # Stacking states gives the same basis as the averaged rdm
+    psi = np.concatenate(psiL,axis=1)
+    if qn is not None:
+        rowQ = (qn[site][:,None]+np.arange(n1)[None,:]).ravel()
+        colQ = np.tile(qn[site+1],nStatesAvg)
+    # Add expansion terms to the states
+    if P is not None:
+        if qn is not None:
+            P,PQ = qn_split_cols(P,rowQ)
+            colQ = np.append(colQ,PQ)
+        psi = np.concatenate([psi,P],axis=1)
+    # Keep only maxBondDim singular vectors
+    if qn is None:
+        U,S,V,truncErr = truncated_svd(psi,nKeep)
+    else:
+        # Do svd within each particle number block & update bond labels
+        U,S,V,truncErr,qn[site+1] = qn_svd(psi,rowQ,colQ,nKeep)
+    if VERBOSE > 4: print('\t\tTruncation Error = {}'.format(truncErr))
+    # Calculate entanglement of target state (without the expansion terms)
+    if (nStatesAvg == 1) and (P is None):
+        St = S.copy()
+    else:
+        St = sla.svdvals(np.dot(np.conj(U.T),psiL[min(targetState,nStatesAvg-1)]))
+    EE,EEs = calc_entanglement(St)
+    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
     # Loop through all MPS in list
     for state in range(nStates):
         # Put resulting vectors into MPS
-        mpsL[state][site] = np.reshape(vecs,(n2,n1,n3))
+        mpsL[state][site] = np.reshape(U,(n2,n1,-1))
         mpsL[state][site] = np.swapaxes(mpsL[state][site],0,1)
-        if not np.all(np.isclose(einsum('ijk,ijl->kl',mpsL[state][site],np.conj(mpsL[state][site])),np.eye(n3),atol=1e-6)):
-            if VERBOSE > 4: print('\t\tNormalization Problem')
         # Calculate next site for guess
-        if nStates != 1:
-            vReshape = np.reshape(v[:,min(nStatesAvg-1,state)],(n1,n2,n3))
-        else:
-            vReshape = np.reshape(v,(n1,n2,n3))
+        vReshape = np.reshape(v[:,min(nStatesAvg-1,state)],(n1,n2,n3))
         # PH - This next line is incorrect!!!
         mpsL[state][site+1] = einsum('lmn,lmk,ikj->inj',np.conj(mpsL[state][site]),vReshape,mpsL[state][site+1])
-    return mpsL,EE,EEs
+    return mpsL,EE,EEs,truncErr
 
-def renormalizeL(mpsL,v,site,nStates=1,targetState=0):
+def renormalizeL(mpsL,v,site,nStates=1,targetState=0,qn=None,P=None,mbd=None):
     (n1,n2,n3) = mpsL[0][site].shape
-    # Try to calculate Entanglement?
-    EE,EEs = calc_ent_left(mpsL[0],v[:,targetState],site)
-    # Calculate the reduced density matrix
+    # The bond dimension can only grow when the basis is expanded
+    nKeep = n2
+    if (P is not None) and (mbd is not None):
+        (n4,n5,_) = mpsL[0][site-1].shape
+        nKeep = min(mbd,n4*n5)
+    # Put all states into matrices, weighting them equally
     _,nStatesCalc = v.shape
     nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    psiL = []
     for i in range(nStatesAvg):
-        if nStatesAvg != 1: 
-            vtmp = v[:,i]
-        else: 
-            vtmp = v
-        vReshape = np.reshape(vtmp,(n1,n2,n3))
-        w = 1./float(nStatesAvg)
-        if i == 0:
-            rdm = w*calcRDM(vReshape,'left') 
-        else:
-            rdm +=w*calcRDM(vReshape,'left')
-    # Take eigenvalues of the rdm
-    vals,vecs = np.linalg.eig(rdm) 
-    # Sort inds
-    inds = np.argsort(vals)[::-1]
-    # Keep only maxBondDim eigenstates
-    inds = inds[:n2]
-    vals = vals[inds]
-    vecs = vecs[:,inds]
-    # Make sure vecs are orthonormal
-    vecs = sla.orth(vecs)
-    vecs = vecs.T
+        vReshape = np.reshape(v[:,i],(n1,n2,n3))
+        vReshape = np.swapaxes(vReshape,0,1)
+        psiL.append(np.sqrt(w)*np.reshape(vReshape,(n2,n1*n3)))
+    # Stacking states gives the same basis as the averaged rdm
+    psi = np.concatenate(psiL,axis=0)
+    if qn is not None:
+        rowQ = np.tile(qn[site],nStatesAvg)
+        colQ = (qn[site+1][None,:]-np.arange(n1)[:,None]).ravel()
+    # Add expansion terms to the states
+    if P is not None:
+        if qn is not None:
+            Pt,PQ = qn_split_cols(P.T,colQ)
+            P = Pt.T
+            rowQ = np.append(rowQ,PQ)
+        psi = np.concatenate([psi,P],axis=0)
+    # Keep only maxBondDim singular vectors
+    if qn is None:
+        U,S,V,truncErr = truncated_svd(psi,nKeep)
+    else:
+        # Do svd within each particle number block & update bond labels
+        Vt,S,Ut,truncErr,qn[site] = qn_svd(psi.T,colQ,rowQ,nKeep)
+        U,V = Ut.T,Vt.T
+    if VERBOSE > 4: print('\t\tTruncation Error = {}'.format(truncErr))
+    # Calculate entanglement of target state (without the expansion terms)
+    if (nStatesAvg == 1) and (P is None):
+        St = S.copy()
+    else:
+        St = sla.svdvals(np.dot(psiL[min(targetState,nStatesAvg-1)],np.conj(V.T)))
+    EE,EEs = calc_entanglement(St)
+    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
     # Loops through all MPSs in list
     for state in range(nStates):
         # Put resulting vectors into MPS
-        mpsL[state][site] = np.reshape(vecs,(n2,n1,n3))
+        mpsL[state][site] = np.reshape(V,(-1,n1,n3))
         mpsL[state][site] = np.swapaxes(mpsL[state][site],0,1)
-        if not np.all(np.isclose(einsum('ijk,ilk->jl',mpsL[state][site],np.conj(mpsL[state][site])),np.eye(n2),atol=1e-6)):
-            if VERBOSE > 4: print('\t\tNormalization Problem')
         # Calculate next site's guess
-        if nStates != 1:
-            vReshape = np.reshape(v[:,min(nStatesAvg-1,state)],(n1,n2,n3))
-        else:
-            vReshape = np.reshape(v,(n1,n2,n3))
+        vReshape = np.reshape(v[:,min(nStatesAvg-1,state)],(n1,n2,n3))
         # Push gauge onto next site
         mpsL[state][site-1] = einsum('ijk,lkm,lnm->ijn',mpsL[state][site-1],vReshape,np.conj(mpsL[state][site]))
-    return mpsL,EE,EEs
+    return mpsL,EE,EEs,truncErr
+
+def renormalizeR_twoSite(mpsL,v,site,nStates=1,targetState=0,mbd=None,truncTol=None,qn=None):
+    (n1,n2,n3) = mpsL[0][site].shape
+    (n4,_,n6) = mpsL[0][site+1].shape
+    # Keep the current bond dimension if no maximum is given
+    if mbd is None: mbd = n3
+    # Put all states into matrices, weighting them equally
+    _,nStatesCalc = v.shape
+    nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    psiL = []
+    for i in range(nStatesAvg):
+        vReshape = np.reshape(v[:,i],(n1,n4,n2,n6))
+        vReshape = np.transpose(vReshape,(2,0,1,3))
+        psiL.append(np.sqrt(w)*np.reshape(vReshape,(n2*n1,n4*n6)))
+    psi = np.concatenate(psiL,axis=1)
+    # Keep at most mbd singular vectors, fewer if allowed by truncTol
+    if qn is None:
+        U,S,V,truncErr = truncated_svd(psi,mbd,truncTol=truncTol)
+    else:
+        rowQ = (qn[site][:,None]+np.arange(n1)[None,:]).ravel()
+        colQ = np.tile((qn[site+2][None,:]-np.arange(n4)[:,None]).ravel(),nStatesAvg)
+        U,S,V,truncErr,qn[site+1] = qn_svd(psi,rowQ,colQ,mbd,truncTol=truncTol)
+    (_,nKeep) = U.shape
+    if VERBOSE > 4: print('\t\tTruncation Error = {}, Bond Dim = {}'.format(truncErr,nKeep))
+    # Calculate entanglement of target state
+    if nStatesAvg == 1:
+        EE,EEs = calc_entanglement(S.copy())
+    else:
+        St = sla.svdvals(np.dot(np.conj(U.T),psiL[min(targetState,nStatesAvg-1)]))
+        EE,EEs = calc_entanglement(St)
+    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
+    # Loop through all MPS in list
+    for state in range(nStates):
+        # Put resulting vectors into MPS
+        mpsL[state][site] = np.swapaxes(np.reshape(U,(n2,n1,nKeep)),0,1)
+        # Project state onto new basis for next site
+        psiState = np.dot(np.conj(U.T),psiL[min(nStatesAvg-1,state)])/np.sqrt(w)
+        mpsL[state][site+1] = np.swapaxes(np.reshape(psiState,(nKeep,n4,n6)),0,1)
+    return mpsL,EE,EEs,truncErr
+
+def renormalizeL_twoSite(mpsL,v,site,nStates=1,targetState=0,mbd=None,truncTol=None,qn=None):
+    (n1,n2,n3) = mpsL[0][site-1].shape
+    (n4,_,n6) = mpsL[0][site].shape
+    # Keep the current bond dimension if no maximum is given
+    if mbd is None: mbd = n3
+    # Put all states into matrices, weighting them equally
+    _,nStatesCalc = v.shape
+    nStatesAvg = min(nStates,nStatesCalc)
+    w = 1./float(nStatesAvg)
+    psiL = []
+    for i in range(nStatesAvg):
+        vReshape = np.reshape(v[:,i],(n1,n4,n2,n6))
+        vReshape = np.transpose(vReshape,(2,0,1,3))
+        psiL.append(np.sqrt(w)*np.reshape(vReshape,(n2*n1,n4*n6)))
+    psi = np.concatenate(psiL,axis=0)
+    # Keep at most mbd singular vectors, fewer if allowed by truncTol
+    if qn is None:
+        U,S,V,truncErr = truncated_svd(psi,mbd,truncTol=truncTol)
+    else:
+        rowQ = np.tile((qn[site-1][:,None]+np.arange(n1)[None,:]).ravel(),nStatesAvg)
+        colQ = (qn[site+1][None,:]-np.arange(n4)[:,None]).ravel()
+        Vt,S,Ut,truncErr,qn[site] = qn_svd(psi.T,colQ,rowQ,mbd,truncTol=truncTol)
+        U,V = Ut.T,Vt.T
+    (nKeep,_) = V.shape
+    if VERBOSE > 4: print('\t\tTruncation Error = {}, Bond Dim = {}'.format(truncErr,nKeep))
+    # Calculate entanglement of target state
+    if nStatesAvg == 1:
+        EE,EEs = calc_entanglement(S.copy())
+    else:
+        St = sla.svdvals(np.dot(psiL[min(targetState,nStatesAvg-1)],np.conj(V.T)))
+        EE,EEs = calc_entanglement(St)
+    if VERBOSE > 2: print('\t\tEE = {}'.format(EE))
+    # Loop through all MPS in list
+    for state in range(nStates):
+        # Put resulting vectors into MPS
+        mpsL[state][site] = np.swapaxes(np.reshape(V,(nKeep,n4,n6)),0,1)
+        # Project state onto new basis for next site
+        psiState = np.dot(psiL[min(nStatesAvg-1,state)],np.conj(V.T))/np.sqrt(w)
+        mpsL[state][site-1] = np.swapaxes(np.reshape(psiState,(n2,n1,nKeep)),0,1)
+    return mpsL,EE,EEs,truncErr
+
+def recycle_subspaceR(eigOpts,mpsL,Mnext,site,oneSite=True):
+    # Move the ritz vectors kept by the krylov solver into the basis of the
+    # next site with the new left isometry at site, as done for the guess
+    if (eigOpts is None) or ('krylovSpace' not in eigOpts): return
+    A = np.conj(mpsL[0][site])
+    for key in eigOpts['krylovSpace']:
+        S = eigOpts['krylovSpace'][key]
+        if Mnext is None:
+            eigOpts['krylovSpace'][key] = None
+            continue
+        Snew = []
+        for i in range(S.shape[1]):
+            if oneSite:
+                s = np.reshape(S[:,i],(A.shape[0],A.shape[1],Mnext.shape[1]))
+                Snew.append(np.reshape(einsum('lmn,lmk,ikj->inj',A,s,Mnext),-1))
+            else:
+                s = np.reshape(S[:,i],(A.shape[0],-1,A.shape[1],Mnext.shape[1]))
+                Snew.append(np.reshape(einsum('iak,ijac,lcd->jlkd',A,s,Mnext),-1))
+        eigOpts['krylovSpace'][key] = np.array(Snew).T
+
+def recycle_subspaceL(eigOpts,mpsL,Mnext,site,oneSite=True):
+    # Move the ritz vectors kept by the krylov solver into the basis of the
+    # next site with the new right isometry at site, as done for the guess
+    if (eigOpts is None) or ('krylovSpace' not in eigOpts): return
+    B = np.conj(mpsL[0][site])
+    for key in eigOpts['krylovSpace']:
+        S = eigOpts['krylovSpace'][key]
+        if Mnext is None:
+            eigOpts['krylovSpace'][key] = None
+            continue
+        Snew = []
+        for i in range(S.shape[1]):
+            if oneSite:
+                s = np.reshape(S[:,i],(B.shape[0],Mnext.shape[2],B.shape[2]))
+                Snew.append(np.reshape(einsum('ijk,lkm,lnm->ijn',Mnext,s,B),-1))
+            else:
+                s = np.reshape(S[:,i],(-1,B.shape[0],Mnext.shape[2],B.shape[2]))
+                Snew.append(np.reshape(einsum('hza,ijac,jkc->hizk',Mnext,s,B),-1))
+        eigOpts['krylovSpace'][key] = np.array(Snew).T
+
+def init_deflate(mps,lowStates,weight,gaugeSite=0,lowStatesLeft=None):
+    # Lower (right) states to project out, their left states & the overlap
+    # environments of both with mps, each keeping its own bond dimensions.
+    # Without left states the lower states are used as their own left
+    # states, which only keeps the other eigenvectors of a hermitian H.
+    if len(lowStates) == 0: return None
+    if lowStatesLeft is None: lowStatesLeft = lowStates
+    deflate = {'mps':[],'lmps':[],'env':[],'lenv':[],'norm':[],'weight':weight}
+    for lowMps,lowMpsl in zip(lowStates,lowStatesLeft):
+        deflate['mps'].append(lowMps)
+        deflate['lmps'].append(lowMpsl)
+        deflate['norm'].append(full_contract(mps=[lowMps],lmps=conj_mps([lowMpsl])))
+        deflate['env'].append(calc_ovlp_env(lowMps,mps,gaugeSite=gaugeSite))
+        if lowMpsl is lowMps:
+            deflate['lenv'].append(deflate['env'][-1])
+        else:
+            deflate['lenv'].append(calc_ovlp_env(lowMpsl,mps,gaugeSite=gaugeSite))
+    return deflate
+
+def local_proj(Mj,Fj,site,oneSite=True):
+    # Project a state onto the local basis of mps at site (site & site+1
+    # for two site updates) with their overlap environments
+    if oneSite:
+        p = einsum('xia,nab,zjb->nxz',Fj[site],Mj[site],Fj[site+1])
+    else:
+        p = einsum('xia,nab,mbc,zjc->nmxz',Fj[site],Mj[site],Mj[site+1],Fj[site+2])
+    return np.reshape(p,-1)
+
+def deflate_vecs(mps,deflate,site,oneSite=True):
+    # Local projections of the lower states (P) & of their left states,
+    # scaled by 1/<l_j|r_j> (Q), so that P Q^dagger is the projector
+    # sum_j |r_j><l_j|/<l_j|r_j> in the local basis of mps at site
+    P,Q = [],[]
+    for j in range(len(deflate['mps'])):
+        P.append(local_proj(deflate['mps'][j],deflate['env'][j][0],site,oneSite=oneSite))
+        Q.append(local_proj(deflate['lmps'][j],deflate['lenv'][j][0],site,oneSite=oneSite)/np.conj(deflate['norm'][j]))
+    return np.array(P).T,np.array(Q).T,deflate['weight']
+
+def update_deflate_envR(mps,deflate,site):
+    if deflate is None: return
+    for j in range(len(deflate['mps'])):
+        update_ovlp_envR(deflate['mps'][j],mps,deflate['env'][j],site)
+        if deflate['lenv'][j] is not deflate['env'][j]:
+            update_ovlp_envR(deflate['lmps'][j],mps,deflate['lenv'][j],site)
+
+def update_deflate_envL(mps,deflate,site):
+    if deflate is None: return
+    for j in range(len(deflate['mps'])):
+        update_ovlp_envL(deflate['mps'][j],mps,deflate['env'][j],site)
+        if deflate['lenv'][j] is not deflate['env'][j]:
+            update_ovlp_envL(deflate['lmps'][j],mps,deflate['lenv'][j],site)
 
 def rightStep(mpsL,W,F,site,
               nStates=1,alg='davidson',
-              preserveState=False,orthonormalize=False):
-    E,v,ovlp = calc_eigs(mpsL,W,F,site,
-                         nStates,
-                         alg=alg,
-                         preserveState=preserveState,
-                         orthonormalize=orthonormalize)
-    mpsL,EE,EEs = renormalizeR(mpsL,v,site,nStates=nStates)
-    F = update_envR(mpsL[0],W,F,site)
-    return E,mpsL,F,EE,EEs
+              preserveState=False,orthonormalize=False,
+              qn=None,oneSite=True,mbd=None,truncTol=None,
+              expand=None,eigOpts=None,twoSided=False,deflate=None):
+    # A left & right state sharing one basis are stored as 2*nStates states
+    nVec = nStates
+    if twoSided: nVec = 2*nStates
+    # Project out lower states in the local problem
+    if deflate is not None:
+        if eigOpts is None: eigOpts = {}
+        eigOpts['deflate'] = deflate_vecs(mpsL[0],deflate,site,oneSite=oneSite)
+    if oneSite:
+        qnMask = None
+        if qn is not None: qnMask = site_mask(qn,site).ravel()
+        t0 = time.time()
+        E,v,ovlp = calc_eigs(mpsL,W,F,site,
+                             nStates,
+                             alg=alg,
+                             preserveState=preserveState,
+                             orthonormalize=orthonormalize,
+                             qnMask=qnMask,
+                             eigOpts=eigOpts,
+                             twoSided=twoSided)
+        t1 = time.time()
+        # Enrich the kept basis with the projected mpo action
+        P = None
+        if expand is not None:
+            P = expand_subspaceR(v,W,F,site,mpsL[0][site].shape,nStates=nVec,alpha=expand)
+        t2 = time.time()
+        Mnext = mpsL[0][site+1]
+        mpsL,EE,EEs,truncErr = renormalizeR(mpsL,v,site,nStates=nVec,qn=qn,P=P,mbd=mbd)
+        recycle_subspaceR(eigOpts,mpsL,Mnext,site)
+        t3 = time.time()
+        if (expand is not None) and (VERBOSE > 3):
+            print('\t\tEig Time = {:f} s, Expansion Time = {:f} s, Renorm Time = {:f} s'.format(t1-t0,t2-t1,t3-t2))
+    else:
+        # Optimize site & site+1 together, then split with an svd
+        qnMask = None
+        if qn is not None: qnMask = two_site_mask(qn,site).ravel()
+        E,v,ovlp = calc_eigs(mpsL,W,F,site,
+                             nStates,
+                             alg=alg,
+                             preserveState=preserveState,
+                             orthonormalize=orthonormalize,
+                             oneSite=False,
+                             qnMask=qnMask,
+                             eigOpts=eigOpts,
+                             twoSided=twoSided)
+        mpsL,EE,EEs,truncErr = renormalizeR_twoSite(mpsL,v,site,nStates=nVec,
+                                             mbd=mbd,truncTol=truncTol,qn=qn)
+        Mnext = None
+        if site+2 < len(mpsL[0]): Mnext = mpsL[0][site+2]
+        recycle_subspaceR(eigOpts,mpsL,Mnext,site,oneSite=False)
+    F = update_envR(mpsL[0],W,F,site,qn=qn)
+    update_deflate_envR(mpsL[0],deflate,site)
+    return E,mpsL,F,EE,EEs,truncErr
 
 def rightSweep(mpsL,W,F,iterCnt,
                nStates=1,alg='davidson',
                preserveState=False,startSite=None,
-               endSite=None,orthonormalize=False):
+               endSite=None,orthonormalize=False,
+               qn=None,oneSite=True,mbd=None,truncTol=None,
+               expand=None,monitor=None,twoSided=False,
+               deflate=None,solverOpts=None):
     N = len(mpsL[0])
     if startSite is None: startSite = 0
     if endSite is None: endSite = N-1
     Ereturn = None
     EE = None
     EEs = None
+    # Local eigensolver settings for this sweep
+    eigOpts = sweep_eig_opts(solverOpts,monitor)
     if VERBOSE > 1: print('Right Sweep {}'.format(iterCnt))
     for site in range(startSite,endSite):
-        E,mpsL,F,_EE,_EEs = rightStep(mpsL,W,F,site,
+        E,mpsL,F,_EE,_EEs,truncErr = rightStep(mpsL,W,F,site,
                                       nStates,
                                       alg=alg,
                                       preserveState=preserveState,
-                                      orthonormalize=orthonormalize)
+                                      orthonormalize=orthonormalize,
+                                      qn=qn,
+                                      oneSite=oneSite,
+                                      mbd=mbd,
+                                      truncTol=truncTol,
+                                      expand=expand,
+                                      eigOpts=eigOpts,
+                                      twoSided=twoSided,
+                                      deflate=deflate)
         if VERBOSE > 2: print('\tEnergy at Site {}: {}'.format(site,E))
         if site == int(N/2):
             Ereturn = E
             EE = _EE
             EEs= _EEs
+        # Stop once all bonds have converged
+        if (monitor is not None) and update_monitor(monitor,site,E,truncErr,nMatvec=eigOpts.get('nMatvec',0)):
+            if VERBOSE > 1: print('\tAll bonds converged, stopping at site {}'.format(site))
+            monitor['gaugeSite'] = site+1
+            if Ereturn is None: Ereturn,EE,EEs = E,_EE,_EEs
+            break
+    if monitor is not None: end_half_sweep(monitor)
     return Ereturn,mpsL,F,EE,EEs
 
 def leftStep(mpsL,W,F,site,
              nStates=1,alg='davidson',
-             preserveState=False,orthonormalize=False):
-    E,v,ovlp = calc_eigs(mpsL,W,F,site,
-                         nStates,
-                         alg=alg,
-                         preserveState=preserveState,
-                         orthonormalize=orthonormalize)
-    mpsL,EE,EEs = renormalizeL(mpsL,v,site,nStates=nStates)
-    F = update_envL(mpsL[0],W,F,site)
-    return E,mpsL,F,EE,EEs
+             preserveState=False,orthonormalize=False,
+             qn=None,oneSite=True,mbd=None,truncTol=None,
+             expand=None,eigOpts=None,twoSided=False,deflate=None):
+    # A left & right state sharing one basis are stored as 2*nStates states
+    nVec = nStates
+    if twoSided: nVec = 2*nStates
+    # Project out lower states in the local problem
+    if deflate is not None:
+        if eigOpts is None: eigOpts = {}
+        eigOpts['deflate'] = deflate_vecs(mpsL[0],deflate,site-int(not oneSite),oneSite=oneSite)
+    if oneSite:
+        qnMask = None
+        if qn is not None: qnMask = site_mask(qn,site).ravel()
+        t0 = time.time()
+        E,v,ovlp = calc_eigs(mpsL,W,F,site,
+                             nStates,
+                             alg=alg,
+                             preserveState=preserveState,
+                             orthonormalize=orthonormalize,
+                             qnMask=qnMask,
+                             eigOpts=eigOpts,
+                             twoSided=twoSided)
+        t1 = time.time()
+        # Enrich the kept basis with the projected mpo action
+        P = None
+        if expand is not None:
+            P = expand_subspaceL(v,W,F,site,mpsL[0][site].shape,nStates=nVec,alpha=expand)
+        t2 = time.time()
+        Mnext = mpsL[0][site-1]
+        mpsL,EE,EEs,truncErr = renormalizeL(mpsL,v,site,nStates=nVec,qn=qn,P=P,mbd=mbd)
+        recycle_subspaceL(eigOpts,mpsL,Mnext,site)
+        t3 = time.time()
+        if (expand is not None) and (VERBOSE > 3):
+            print('\t\tEig Time = {:f} s, Expansion Time = {:f} s, Renorm Time = {:f} s'.format(t1-t0,t2-t1,t3-t2))
+    else:
+        # Optimize site-1 & site together, then split with an svd
+        qnMask = None
+        if qn is not None: qnMask = two_site_mask(qn,site-1).ravel()
+        E,v,ovlp = calc_eigs(mpsL,W,F,site-1,
+                             nStates,
+                             alg=alg,
+                             preserveState=preserveState,
+                             orthonormalize=orthonormalize,
+                             oneSite=False,
+                             qnMask=qnMask,
+                             eigOpts=eigOpts,
+                             twoSided=twoSided)
+        mpsL,EE,EEs,truncErr = renormalizeL_twoSite(mpsL,v,site,nStates=nVec,
+                                             mbd=mbd,truncTol=truncTol,qn=qn)
+        Mnext = None
+        if site-2 >= 0: Mnext = mpsL[0][site-2]
+        recycle_subspaceL(eigOpts,mpsL,Mnext,site,oneSite=False)
+    F = update_envL(mpsL[0],W,F,site,qn=qn)
+    update_deflate_envL(mpsL[0],deflate,site)
+    return E,mpsL,F,EE,EEs,truncErr
 
 def leftSweep(mpsL,W,F,iterCnt,
               nStates=1,alg='davidson',
               preserveState=False,startSite=None,
-              endSite=None,orthonormalize=False):
+              endSite=None,orthonormalize=False,
+              qn=None,oneSite=True,mbd=None,truncTol=None,
+              expand=None,monitor=None,twoSided=False,
+              deflate=None,solverOpts=None):
     N = len(mpsL[0])
     if startSite is None: startSite = N-1
     if endSite is None: endSite = 0
     Ereturn = None
     EE = None
     EEs = None
+    # Local eigensolver settings for this sweep
+    eigOpts = sweep_eig_opts(solverOpts,monitor)
     if VERBOSE > 1: print('Left Sweep {}'.format(iterCnt))
     for site in range(startSite,endSite,-1):
-        E,mpsL,F,_EE,_EEs = leftStep(mpsL,W,F,site,
+        E,mpsL,F,_EE,_EEs,truncErr = leftStep(mpsL,W,F,site,
                                      nStates,
                                      alg=alg,
                                      preserveState=preserveState,
-                                     orthonormalize=orthonormalize)
+                                     orthonormalize=orthonormalize,
+                                     qn=qn,
+                                     oneSite=oneSite,
+                                     mbd=mbd,
+                                     truncTol=truncTol,
+                                     expand=expand,
+                                     eigOpts=eigOpts,
+                                     twoSided=twoSided,
+                                     deflate=deflate)
         if VERBOSE > 2: print('\tEnergy at Site {}: {}'.format(site,E))
         if site == int(N/2):
             Ereturn = E
             EE = _EE
             EEs= _EEs
+        # Stop once all bonds have converged
+        if (monitor is not None) and update_monitor(monitor,site,E,truncErr,nMatvec=eigOpts.get('nMatvec',0)):
+            if VERBOSE > 1: print('\tAll bonds converged, stopping at site {}'.format(site))
+            monitor['gaugeSite'] = site-1
+            if Ereturn is None: Ereturn,EE,EEs = E,_EE,_EEs
+            break
+    if monitor is not None: end_half_sweep(monitor)
     return Ereturn,mpsL,F,EE,EEs
 
-def checkConv(E_prev,E,tol,iterCnt,maxIter,minIter,nStates=1,targetState=0,EE=None,EEspec=[None]):
+def init_monitor(N,tol,errTol=None,spreadTol=None,ovlpTol=None,
+                 midSweepStop=False,nStates=1,targetState=0,
+                 adaptiveTol=False,eigTolMin=1e-14,eigTolMax=1e-4,
+                 eigTolFactor=1e-2,Eguess=None):
+    # Set up a dictionary to track convergence during the sweeps
+    monitor = {'N':N,'tol':tol,'errTol':errTol,'spreadTol':spreadTol,
+               'ovlpTol':ovlpTol,'midSweepStop':midSweepStop,
+               'allowStop':False,'stopped':False,'gaugeSite':0,
+               'nStates':nStates,'targetState':targetState,
+               'adaptiveTol':adaptiveTol,'eigTolMin':eigTolMin,
+               'eigTolMax':eigTolMax,'eigTolFactor':eigTolFactor,
+               # Latest local energy at each site
+               'Esite':np.nan*np.ones(N,dtype=np.complex_),
+               # Number of consecutive converged steps
+               'nConv':0,
+               # Results of the current half sweep
+               'sweepE':[],'sweepErr':[],'sweepMatvec':np.zeros(N,dtype=int),
+               'eigTol':None,
+               # History of each half sweep
+               'E':[],'maxTruncErr':[],'Espread':[],'nMatvec':[],'eigTolHist':[],
+               # History of each full sweep
+               'ovlp':[],
+               'prevMPS':None}
+    # An expected energy of the initial guess stands in for the local
+    # energies of a previous sweep
+    if Eguess is not None: monitor['Esite'][:] = Eguess
+    return monitor
+
+def update_monitor(monitor,site,E,truncErr,nMatvec=0):
+    # Record results of a single step, returning True when every bond
+    # has been below tolerance for a full half sweep (& stopping is allowed)
+    if monitor['nStates'] != 1:
+        E = E[monitor['targetState']]
+    else:
+        E = np.atleast_1d(E)[0]
+    dE = np.abs(E-monitor['Esite'][site])
+    monitor['Esite'][site] = E
+    monitor['sweepE'].append(E)
+    monitor['sweepErr'].append(truncErr)
+    monitor['sweepMatvec'][site] += nMatvec
+    converged = (dE < monitor['tol'])
+    if monitor['errTol'] is not None: converged = converged and (truncErr < monitor['errTol'])
+    if converged:
+        monitor['nConv'] += 1
+    else:
+        monitor['nConv'] = 0
+    stop = monitor['midSweepStop'] and monitor['allowStop'] and (monitor['nConv'] >= monitor['N']-1)
+    monitor['stopped'] = stop
+    return stop
+
+def end_half_sweep(monitor):
+    # Add results from a half sweep to the history
+    if len(monitor['sweepE']) > 0:
+        Es = np.real(np.array(monitor['sweepE']))
+        monitor['E'].append(monitor['sweepE'][-1])
+        monitor['maxTruncErr'].append(np.max(monitor['sweepErr']))
+        monitor['Espread'].append(np.max(Es)-np.min(Es))
+        monitor['nMatvec'].append(monitor['sweepMatvec'])
+        monitor['eigTolHist'].append(monitor['eigTol'])
+        if VERBOSE > 2: print('\tMax Truncation Error = {}, Energy Spread = {}'.format(monitor['maxTruncErr'][-1],monitor['Espread'][-1]))
+        if VERBOSE > 2: print('\tTotal Matvecs = {}'.format(np.sum(monitor['sweepMatvec'])))
+    monitor['sweepE'],monitor['sweepErr'] = [],[]
+    monitor['sweepMatvec'] = np.zeros(monitor['N'],dtype=int)
+
+def solver_opts(precond='auto',krylovDim=None,recycleDim=None):
+    # Local eigensolver options used in every sweep (see calc_eigs)
+    opts = {'precond':precond}
+    if krylovDim is not None: opts['krylovDim'] = krylovDim
+    if recycleDim is not None: opts['recycleDim'] = recycleDim
+    return opts
+
+def sweep_eig_opts(solverOpts,monitor=None,final=False):
+    # Local eigensolver settings for a sweep. With an adaptive tolerance (in
+    # the monitor) it follows the energy change & truncation error of the
+    # last half sweeps, so environments that are still changing are only
+    # solved loosely
+    if (solverOpts is None) and (monitor is None): return None
+    eigOpts = {}
+    if solverOpts is not None: eigOpts.update(solverOpts)
+    if (monitor is not None) and monitor['adaptiveTol']:
+        if final:
+            eigTol = monitor['eigTolMin']
+        elif len(monitor['E']) < 2:
+            eigTol = monitor['eigTolMax']
+        else:
+            err = max(np.abs(monitor['E'][-1]-monitor['E'][-2]),monitor['maxTruncErr'][-1])
+            eigTol = monitor['eigTolFactor']*err
+            eigTol = min(max(eigTol,monitor['eigTolMin']),monitor['eigTolMax'])
+        # Allow more iterations for tighter tolerances
+        eigOpts['tol'] = eigTol
+        eigOpts['max_cycle'] = int(min(1000,20*max(1.,-np.log10(eigTol))))
+        if VERBOSE > 2: print('\tLocal Eigensolver Tolerance = {}'.format(eigTol))
+    if monitor is not None: monitor['eigTol'] = eigOpts.get('tol',None)
+    return eigOpts
+
+def calc_sweep_ovlp(monitor,mps):
+    # Fidelity between the target state and its value after the last full sweep
+    mps = [[M.copy() for M in mps]]
+    if monitor['prevMPS'] is not None:
+        prev = monitor['prevMPS']
+        ovlp = full_contract(mps=mps,lmps=conj_mps(prev))
+        norm = full_contract(mps=mps)*full_contract(mps=prev)
+        monitor['ovlp'].append(np.abs(ovlp)/np.sqrt(np.abs(norm)))
+        if VERBOSE > 2: print('\tOverlap with previous sweep = {}'.format(monitor['ovlp'][-1]))
+    monitor['prevMPS'] = mps
+
+def return_history(monitor):
+    # Convergence history without the internal tracking data
+    return {'E':np.array(monitor['E']),
+            'maxTruncErr':np.array(monitor['maxTruncErr']),
+            'Espread':np.array(monitor['Espread']),
+            'ovlp':np.array(monitor['ovlp']),
+            'nMatvec':np.array(monitor['nMatvec']),
+            'eigTol':monitor['eigTolHist'],
+            'finalEigTol':monitor['eigTol']}
+
+def checkConv(E_prev,E,tol,iterCnt,maxIter,minIter,nStates=1,targetState=0,EE=None,EEspec=[None],monitor=None):
     if nStates != 1: E = E[targetState]
-    if (np.abs(E-E_prev) < tol) and (iterCnt > minIter):
+    # Additional convergence criteria from the monitor
+    monConv = True
+    if monitor is not None:
+        if (monitor['errTol'] is not None) and (len(monitor['maxTruncErr']) > 0):
+            monConv = monConv and (monitor['maxTruncErr'][-1] < monitor['errTol'])
+        if (monitor['spreadTol'] is not None) and (len(monitor['Espread']) > 0):
+            monConv = monConv and (monitor['Espread'][-1] < monitor['spreadTol'])
+        if monitor['ovlpTol'] is not None:
+            monConv = monConv and (len(monitor['ovlp']) > 0) and (1.-monitor['ovlp'][-1] < monitor['ovlpTol'])
+    if (np.abs(E-E_prev) < tol) and monConv and (iterCnt > minIter):
         cont = False
         conv = True
     elif iterCnt > maxIter - 1:
@@ -239,55 +694,172 @@ def run_sweeps(mpsL,W,F,initGuess=None,maxIter=0,minIter=None,
                preserveState=False,gaugeSiteLoad=0,
                gaugeSiteSave=0,returnState=False,
                returnEnv=False,returnEntSpec=False,
-               orthonormalize=False):
+               orthonormalize=False,qn=None,
+               oneSite=True,mbd=None,truncTol=None,
+               expand=None,errTol=None,spreadTol=None,
+               ovlpTol=None,midSweepStop=False,returnConv=False,
+               adaptiveTol=False,eigTolMin=1e-14,eigTolMax=1e-4,
+               eigTolFactor=1e-2,precond='auto',twoSided=False,
+               krylovDim=None,recycleDim=None,deflate=None,
+               deflateLeft=None,deflateWeight=100.,Eguess=None):
     cont = True
     iterCnt = 0
     E_prev = 0
+    N = len(mpsL[0])
+    # Track convergence of each bond during the sweeps
+    monitor = init_monitor(N,tol,errTol=errTol,spreadTol=spreadTol,
+                           ovlpTol=ovlpTol,midSweepStop=midSweepStop,
+                           nStates=nStates,targetState=targetState,
+                           adaptiveTol=adaptiveTol,eigTolMin=eigTolMin,
+                           eigTolMax=eigTolMax,eigTolFactor=eigTolFactor,
+                           Eguess=Eguess)
+    # Local eigensolver options, kept apart from the convergence tracking
+    solverOpts = solver_opts(precond=precond,krylovDim=krylovDim,recycleDim=recycleDim)
+    # Compare preconditioners afresh for each bond dimension
+    clear_precond_stats()
+    # Overlap environments for projecting out lower states
+    if deflate is not None:
+        deflate = init_deflate(mpsL[0],deflate,deflateWeight,gaugeSite=gaugeSiteLoad,
+                               lowStatesLeft=deflateLeft)
     if gaugeSiteLoad != 0:
+        # A guess whose energy is known (Eguess) can stop in these sweeps
+        monitor['allowStop'] = (minIter <= 0)
         E,mpsL,F,EE,EEs = rightSweep(mpsL,W,F,iterCnt,
                                      nStates=nStates,
                                      alg=alg,
                                      preserveState=preserveState,
                                      startSite=gaugeSiteLoad,
-                                     orthonormalize=orthonormalize)
-        E,mpsL,F,EE,EEs = leftSweep(mpsL,W,F,iterCnt,
-                                    nStates=nStates,
-                                    alg=alg,
-                                    preserveState=preserveState,
-                                    orthonormalize=orthonormalize)
-    while cont:
+                                     orthonormalize=orthonormalize,
+                                     qn=qn,
+                                     oneSite=oneSite,
+                                     mbd=mbd,
+                                     truncTol=truncTol,
+                                     expand=expand,
+                                     monitor=monitor,
+                                     twoSided=twoSided,
+                                     deflate=deflate,
+                                     solverOpts=solverOpts)
+        if not monitor['stopped']:
+            E,mpsL,F,EE,EEs = leftSweep(mpsL,W,F,iterCnt,
+                                        nStates=nStates,
+                                        alg=alg,
+                                        preserveState=preserveState,
+                                        orthonormalize=orthonormalize,
+                                        qn=qn,
+                                        oneSite=oneSite,
+                                        mbd=mbd,
+                                        truncTol=truncTol,
+                                        expand=expand,
+                                        monitor=monitor,
+                                        twoSided=twoSided,
+                                        deflate=deflate,
+                                        solverOpts=solverOpts)
+        # For a warm start these count as the first sweep
+        if (Eguess is not None) and (not monitor['stopped']):
+            E_prev = E
+            if nStates != 1: E_prev = E[targetState]
+    while cont and (not monitor['stopped']):
+        monitor['allowStop'] = (iterCnt >= minIter)
         E,mpsL,F,EE,EEs = rightSweep(mpsL,W,F,iterCnt,
                                      nStates=nStates,
                                      alg=alg,
                                      preserveState=preserveState,
-                                     orthonormalize=orthonormalize)
+                                     orthonormalize=orthonormalize,
+                                     qn=qn,
+                                     oneSite=oneSite,
+                                     mbd=mbd,
+                                     truncTol=truncTol,
+                                     expand=expand,
+                                     monitor=monitor,
+                                     twoSided=twoSided,
+                                     deflate=deflate,
+                                     solverOpts=solverOpts)
+        if monitor['stopped']: break
         E,mpsL,F,EE,EEs = leftSweep(mpsL,W,F,iterCnt,
                                     nStates=nStates,
                                     alg=alg,
                                     preserveState=preserveState,
-                                    orthonormalize=orthonormalize)
-        cont,conv,E_prev,iterCnt = checkConv(E_prev,E,tol,iterCnt,maxIter,minIter,nStates=nStates,targetState=targetState)
-    if gaugeSiteSave != 0:
+                                    orthonormalize=orthonormalize,
+                                    qn=qn,
+                                    oneSite=oneSite,
+                                    mbd=mbd,
+                                    truncTol=truncTol,
+                                    expand=expand,
+                                    monitor=monitor,
+                                    twoSided=twoSided,
+                                    deflate=deflate,
+                                    solverOpts=solverOpts)
+        if monitor['stopped']: break
+        if ovlpTol is not None: calc_sweep_ovlp(monitor,mpsL[targetState])
+        cont,conv,E_prev,iterCnt = checkConv(E_prev,E,tol,iterCnt,maxIter,minIter,nStates=nStates,targetState=targetState,monitor=monitor)
+    # Sweeps end with the gauge at site 0 unless stopped part way
+    gSite = 0
+    if monitor['stopped']:
+        conv = True
+        gSite = monitor['gaugeSite']
+    _E = None
+    if gSite < gaugeSiteSave:
         _E,mpsL,F,_EE,_EEs = rightSweep(mpsL,W,F,iterCnt+1,
                                         nStates=nStates,
                                         alg=alg,
                                         preserveState=preserveState,
+                                        startSite=gSite,
                                         endSite=gaugeSiteSave,
-                                        orthonormalize=orthonormalize)
+                                        orthonormalize=orthonormalize,
+                                        qn=qn,
+                                        oneSite=oneSite,
+                                        mbd=mbd,
+                                        truncTol=truncTol,
+                                        expand=expand,
+                                        twoSided=twoSided,
+                                        deflate=deflate,
+                                        solverOpts=solverOpts)
+    elif gSite > gaugeSiteSave:
+        _E,mpsL,F,_EE,_EEs = leftSweep(mpsL,W,F,iterCnt+1,
+                                       nStates=nStates,
+                                       alg=alg,
+                                       preserveState=preserveState,
+                                       startSite=gSite,
+                                       endSite=gaugeSiteSave,
+                                       orthonormalize=orthonormalize,
+                                       qn=qn,
+                                       oneSite=oneSite,
+                                       mbd=mbd,
+                                       truncTol=truncTol,
+                                       expand=expand,
+                                       twoSided=twoSided,
+                                       deflate=deflate,
+                                       solverOpts=solverOpts)
+    if gaugeSiteSave != 0:
         # Do final calculation 
+        qnMask = None
+        if qn is not None: qnMask = site_mask(qn,gaugeSiteSave).ravel()
+        eigOpts = sweep_eig_opts(solverOpts,monitor,final=True)
+        if deflate is not None: eigOpts['deflate'] = deflate_vecs(mpsL[0],deflate,gaugeSiteSave)
         _,v,_ = calc_eigs(mpsL,W,F,gaugeSiteSave,
                          nStates,
                          alg=alg,
                          preserveState=preserveState,
-                         orthonormalize=orthonormalize)
+                         orthonormalize=orthonormalize,
+                         qnMask=qnMask,
+                         eigOpts=eigOpts,
+                         twoSided=twoSided)
         # Put final result into mpsL
         (n1,n2,n3) = mpsL[0][gaugeSiteSave].shape
-        for state in range(nStates):
+        for state in range(len(mpsL)):
             mpsL[state][gaugeSiteSave] = np.reshape(v[:,state],(n1,n2,n3))
         # Check if we got to the center site
         if _E is not None:
             E,EE,EEs = _E,_EE,_EEs
-    save_mps(mpsL,fname,gaugeSite=gaugeSiteSave)
+    # Schmidt values of the final state, gauged at gaugeSiteSave (only saved
+    # for a single state, as several states share one basis)
+    spec = None
+    if (fname is not None) and (nStates == 1) and (not twoSided): spec = center_spectra(mpsL[0],gaugeSiteSave)
+    if twoSided:
+        save_mps(mpsL[:nStates],fname,gaugeSite=gaugeSiteSave,qn=qn,spec=spec)
+        if fname is not None: save_mps(mpsL[nStates:],fname+'_left',gaugeSite=gaugeSiteSave,qn=qn)
+    else:
+        save_mps(mpsL,fname,gaugeSite=gaugeSiteSave,qn=qn,spec=spec)
     #EE,EEs = observable_sweep(M,F)
     if nStates != 1: 
         gap = E[0]-E[1]
@@ -302,6 +874,8 @@ def run_sweeps(mpsL,W,F,initGuess=None,maxIter=0,minIter=None,
         output.append(mpsL)
     if returnEnv:
         output.append(F)
+    if returnConv:
+        output.append(return_history(monitor))
     return output
 
 def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
@@ -310,10 +884,53 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
              constant_mbd=False,alg='davidson',
              preserveState=False,gaugeSiteSave=None,
              returnState=False,returnEnv=False,returnEntSpec=False,
-             orthonormalize=False,calcLeftState=False):
+             orthonormalize=False,calcLeftState=False,
+             nParticles=None,oneSite=True,truncTol=None,
+             expand=None,checkpoint=True,errTol=None,
+             spreadTol=None,ovlpTol=None,midSweepStop=False,
+             returnConv=False,fuseMPO=False,adaptiveTol=False,
+             eigTolMin=1e-14,eigTolMax=1e-4,eigTolFactor=1e-2,
+             precond='auto',twoSided=False,krylovDim=None,
+             recycleDim=None,deflation=False,deflateWeight=100.,
+             lowStates=None,lowStatesLeft=None,guessGaugeSite=None,Eguess=None):
     # Determine number of sites from length of mpo operators
     N = len(mpo[0])
 
+    # Merge all mpo terms into a single compressed mpo
+    if fuseMPO:
+        mpo = fuse_mpo(mpo)
+        if VERBOSE > 1: print('Fused MPO Bond Dimensions = {}'.format(mpo_bond_dims(mpo)))
+
+    # Find each state as its own mps, projecting out the lower ones
+    if deflation:
+        assert((initEnv is None) and (not calcLeftState) and (not twoSided))
+        return run_dmrg_deflation(mpo,initGuess=initGuess,mbd=mbd,
+                                  tol=tol,maxIter=maxIter,minIter=minIter,
+                                  fname=fname,nStates=nStates,
+                                  targetState=targetState,
+                                  constant_mbd=constant_mbd,alg=alg,
+                                  preserveState=preserveState,
+                                  gaugeSiteSave=gaugeSiteSave,
+                                  returnState=returnState,
+                                  returnEnv=returnEnv,
+                                  returnEntSpec=returnEntSpec,
+                                  orthonormalize=orthonormalize,
+                                  nParticles=nParticles,oneSite=oneSite,
+                                  truncTol=truncTol,expand=expand,
+                                  checkpoint=checkpoint,errTol=errTol,
+                                  spreadTol=spreadTol,ovlpTol=ovlpTol,
+                                  midSweepStop=midSweepStop,
+                                  returnConv=returnConv,
+                                  adaptiveTol=adaptiveTol,
+                                  eigTolMin=eigTolMin,eigTolMax=eigTolMax,
+                                  eigTolFactor=eigTolFactor,
+                                  precond=precond,krylovDim=krylovDim,
+                                  recycleDim=recycleDim,
+                                  deflateWeight=deflateWeight,
+                                  lowStates=lowStates,
+                                  lowStatesLeft=lowStatesLeft,
+                                  guessGaugeSite=guessGaugeSite)
+
     # Set to save MPS at center site as default
     if gaugeSiteSave is None: gaugeSiteSave = int(N/2)+1
     
@@ -332,6 +949,9 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
     else:
         assert(len(minIter) == len(mbd))
 
+    # The two sided calculation finds the left state with the right state
+    if twoSided: calcLeftState = False
+
     # Get mpo for calculating left state
     if calcLeftState: mpol = mpo_conj_trans(mpo)
 
@@ -340,63 +960,111 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
     EEvec = np.zeros(len(mbd),dtype=np.complex_)
     gapvec= np.zeros(len(mbd),dtype=np.complex_)
     if calcLeftState: EEvecl = np.zeros(len(mbd),dtype=np.complex_)
+    convHist = [None]*len(mbd)
+    if calcLeftState: convHistl = [None]*len(mbd)
+
+    # Particle number labels of the bonds
+    qn,qnl = None,None
 
     # Loop over all maximum bond dimensions, running dmrg for each one
     for mbdInd,mbdi in enumerate(mbd):
         if VERBOSE > 1: print('Starting Calc for MBD = {}'.format(mbdi))
 
         # Set up initial MPS
-        if initGuess is None:
-            if (mbdInd != 0) and (fname is not None):
-                # Load mps guess from previous bond dimension and increase to current mbd
-                mpsList,gSite = load_mps(fname+'_mbd'+str(mbdInd-1))
+        guessFname = None
+        if mbdInd != 0:
+            # Start from the previous bond dimension's results (the sweeps
+            # update mpsList & env in place), left in the gauge they were saved in
+            gSite = gaugeSiteSave
+            if calcLeftState: glSite = gaugeSiteSave
+            # Increase to current mbd, zero padding the affected environments
+            # (two site updates & subspace expansion grow the bond dimension themselves,
+            # and charge block environments are recalculated below instead)
+            if oneSite and (expand is None):
                 mpsList = increase_all_mbd(mpsList,mbdi)
-                # Repeat for left eigenstate
+                if not is_block_env(env[0][0]): env = pad_env(mpsList[0],mpo,env)
                 if calcLeftState:
-                    mpslList,glSite = load_mps(fname+'_mbd'+str(mbdInd-1)+'_left')
                     mpslList = increase_all_mbd(mpslList,mbdi)
+                    if not is_block_env(envl[0][0]): envl = pad_env(mpslList[0],mpol,envl)
+        elif initGuess is None:
+            # Make random or constant MPS initial guess
+            mpsList = create_all_mps(N,mbdi,nStates)
+            mpsList = make_all_mps_right(mpsList)
+            # PH - constant_mbd not currently working
+            if constant_mbd: mps = increase_mbd(mpsList,mbdi,constant=True)
+            # Right canonical, so set gauge site at 0
+            gSite = 0
+            # Left states start as copies of the right states (sharing their basis)
+            if twoSided: mpsList = mpsList+copy.deepcopy(mpsList)
+
+            # Repeat for left eigenstate
+            if calcLeftState:
+                mpslList = create_all_mps(N,mbdi,nStates)
+                mpslList = make_all_mps_right(mpslList)
+                if constant_mbd: mps = increase_mbd(mpslList,mbdi,constant=True)
+                glSite = 0
+        elif not isinstance(initGuess,str):
+            # Start from states already in memory (as returned by run_dmrg
+            # with returnState), gauged at guessGaugeSite. The particle number
+            # labels are only kept with saved states.
+            assert(nParticles is None)
+            if guessGaugeSite is None: guessGaugeSite = gaugeSiteSave
+            gSite = guessGaugeSite
+            if twoSided:
+                mpsList = copy.deepcopy(initGuess[0]+initGuess[1])
+            elif calcLeftState:
+                mpsList,mpslList = copy.deepcopy(initGuess[0]),copy.deepcopy(initGuess[1])
+                glSite = guessGaugeSite
             else:
-                # Make random or constant MPS initial guess
-                mpsList = create_all_mps(N,mbdi,nStates)
-                mpsList = make_all_mps_right(mpsList)
-                # PH - constant_mbd not currently working
-                if constant_mbd: mps = increase_mbd(mpsList,mbdi,constant=True)
-                # Right canonical, so set gauge site at 0
-                gSite = 0
-
-                # Repeat for left eigenstate
+                mpsList = copy.deepcopy(initGuess)
+        else:
+            # Load user provided MPS Guess
+            guessFname = initGuess+'_mbd'+str(mbdInd)
+            mpsList,gSite = load_mps(initGuess+'_mbd'+str(mbdInd))
+            if twoSided: mpsList = mpsList+load_mps(initGuess+'_mbd'+str(mbdInd)+'_left')[0]
+            # Repeat for left eigenstate
+            if calcLeftState: mpslList,glSite = load_mps(initGuess+'_mbd'+str(mbdInd)+'_left')
+
+        # Restrict calculation to a fixed particle number sector
+        if nParticles is not None:
+            if mbdInd != 0:
+                # Label any indices added to the bonds
+                qn = pad_qn(qn,mpsList[0],nParticles)
+                if calcLeftState: qnl = pad_qn(qnl,mpslList[0],nParticles)
+            elif guessFname is None:
+                mpsList,qn = setup_all_qn(mpsList,nParticles)
+                mpsList = make_all_mps_right_qn(mpsList,qn)
                 if calcLeftState:
-                    mpslList = create_all_mps(N,mbdi,nStates)
-                    mpslList = make_all_mps_right(mpsList)
-                    if constant_mbd: mps = increase_mbd(mpslList,mbdi,constant=True)
-                    glSite = 0
-        else: # PH - Should check if it is a sting here and add the additional possibility that the input is an mpsList
-            # Load user provided MPS guess    
-            if mbdInd == 0:
-                # Load user provided MPS Guess
-                mpsList,gSite = load_mps(initGuess+'_mbd'+str(mbdInd))
-                # Repeat for left eigenstate
-                if calcLeftState: mpslList,glSite = load_mps(initGuess+'_mbd'+str(mbdInd)+'_left')
+                    mpslList,qnl = setup_all_qn(mpslList,nParticles)
+                    mpslList = make_all_mps_right_qn(mpslList,qnl)
             else:
-                # Load mps guess from previous bond dimension and increase to current mbd
-                mpsList,gSite = load_mps(initGuess+'_mbd'+str(mbdInd-1))
-                mpsList = increase_all_mbd(mpsList,mbdi)
-                # Repeat for left eigenstate
-                if calcLeftState:
-                    mpslList,glSite = load_mps(initGuess+'_mbd'+str(mbdInd-1)+'_left')
-                    mpslList = increase_all_mbd(mpslList,mbdi)
+                mpsList,qn = setup_all_qn(mpsList,nParticles,qn=load_qn(guessFname))
+                if calcLeftState: mpslList,qnl = setup_all_qn(mpslList,nParticles,qn=load_qn(guessFname+'_left'))
 
         # Calc environment (or load if provided)
-        if initEnv is None: 
-            env = calc_env(mpsList[0],mpo,mbdi,gaugeSite=gSite)
-            if calcLeftState: envl = calc_env(mpslList[0],mpol,mbdi,gaugeSite=glSite)
+        if mbdInd != 0:
+            # Charge block environments need the labels of the added indices
+            if oneSite and (expand is None):
+                if is_block_env(env[0][0]): env = calc_env(mpsList[0],mpo,mbdi,gaugeSite=gSite,qn=qn)
+                if calcLeftState and is_block_env(envl[0][0]):
+                    envl = calc_env(mpslList[0],mpol,mbdi,gaugeSite=glSite,qn=qnl)
+        elif initEnv is None: 
+            env = calc_env(mpsList[0],mpo,mbdi,gaugeSite=gSite,qn=qn)
+            if calcLeftState: envl = calc_env(mpslList[0],mpol,mbdi,gaugeSite=glSite,qn=qnl)
         else:
             env = initEnv
             if calcLeftState: env,envl = initEnv[0],initEnv[1]
 
         # Add an index to the MPS filename saving to indicate its bond dimension
+        # (only the final bond dimension is saved if checkpoint is False)
         fname_mbd = None
-        if fname is not None: fname_mbd = fname + '_mbd' + str(mbdInd)
+        if (fname is not None) and (checkpoint or (mbdInd == len(mbd)-1)):
+            fname_mbd = fname + '_mbd' + str(mbdInd)
+
+        # The expected energy only applies to the initial guess (the left
+        # eigenvalues are its complex conjugate)
+        Eguess_mbd,Eguessl_mbd = None,None
+        if (mbdInd == 0) and (Eguess is not None): Eguess_mbd,Eguessl_mbd = Eguess,np.conj(Eguess)
 
         # Run DMRG Sweeps (right eigenvector)
         if VERBOSE > 0: print('Calculating Right Eigenstate')
@@ -414,7 +1082,29 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
                               returnState=returnState,
                               returnEnv=returnEnv,
                               returnEntSpec=returnEntSpec,
-                              orthonormalize=orthonormalize)
+                              orthonormalize=orthonormalize,
+                              qn=qn,
+                              oneSite=oneSite,
+                              mbd=mbdi,
+                              truncTol=truncTol,
+                              expand=expand,
+                              errTol=errTol,
+                              spreadTol=spreadTol,
+                              ovlpTol=ovlpTol,
+                              midSweepStop=midSweepStop,
+                              returnConv=returnConv,
+                              adaptiveTol=adaptiveTol,
+                              eigTolMin=eigTolMin,
+                              eigTolMax=eigTolMax,
+                              eigTolFactor=eigTolFactor,
+                              precond=precond,
+                              twoSided=twoSided,
+                              krylovDim=krylovDim,
+                              recycleDim=recycleDim,
+                              deflate=lowStates,
+                              deflateLeft=lowStatesLeft,
+                              deflateWeight=deflateWeight,
+                              Eguess=Eguess_mbd)
         # Extract Results
         E = output[0]
         EE = output[1]
@@ -423,34 +1113,29 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
         EEvec[mbdInd] = output[1]
         gapvec[mbdInd]= output[2]
         # Extract Extra results
-        if returnEntSpec and returnState and returnEnv:
-            EEs = output[3]
-            mpsList = output[4]
-            env = output[5]
-        elif returnEntSpec and returnState:
-            EEs = output[3]
-            mpsList = output[4]
-        elif returnEntSpec and returnEnv:
-            EEs = output[3]
-            env = output[4]
-        elif returnState and returnEnv:
-            mpsList = output[3]
-            env = output[4]
-        elif returnEntSpec:
-            EEs = output[3]
-        elif returnState:
-            mpsList = output[3]
-        elif returnEnv:
-            env = output[3]
+        ind = 3
+        if returnEntSpec:
+            EEs = output[ind]
+            ind += 1
+        if returnState:
+            mpsList = output[ind]
+            ind += 1
+        if returnEnv:
+            env = output[ind]
+            ind += 1
+        if returnConv:
+            convHist[mbdInd] = output[ind]
 
         if calcLeftState:
             # Run DMRG Sweeps (left eigenvector)
             if VERBOSE > 0: print('Calculating Left Eigenstate')
+            fname_mbdl = None
+            if fname_mbd is not None: fname_mbdl = fname_mbd+'_left'
             output = run_sweeps(mpslList,mpol,envl,
                                   maxIter=maxIter[mbdInd],
                                   minIter=minIter[mbdInd],
                                   tol=tol[mbdInd],
-                                  fname=fname_mbd+'_left',
+                                  fname=fname_mbdl,
                                   nStates=nStates,
                                   alg=alg,
                                   targetState=targetState,
@@ -460,37 +1145,54 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
                                   returnState=returnState,
                                   returnEnv=returnEnv,
                                   returnEntSpec=returnEntSpec,
-                                  orthonormalize=orthonormalize)
+                                  orthonormalize=orthonormalize,
+                                  qn=qnl,
+                                  oneSite=oneSite,
+                                  mbd=mbdi,
+                                  truncTol=truncTol,
+                                  expand=expand,
+                                  errTol=errTol,
+                                  spreadTol=spreadTol,
+                                  ovlpTol=ovlpTol,
+                                  midSweepStop=midSweepStop,
+                                  returnConv=returnConv,
+                                  adaptiveTol=adaptiveTol,
+                                  eigTolMin=eigTolMin,
+                                  eigTolMax=eigTolMax,
+                                  eigTolFactor=eigTolFactor,
+                                  precond=precond,
+                                  krylovDim=krylovDim,
+                                  recycleDim=recycleDim,
+                                  deflate=lowStatesLeft if lowStatesLeft is not None else lowStates,
+                                  deflateLeft=lowStates,
+                                  deflateWeight=deflateWeight,
+                                  Eguess=Eguessl_mbd)
             # Extract left state specific Results
             EEl = output[1]
             EEvecl[mbdInd]  = output[1]
             # Extra potential extra data
-            if returnEntSpec and returnState and returnEnv:
-                EEsl = output[3]
-                mpslList = output[4]
-                envl = output[5]
-            elif returnEntSpec and returnState:
-                EEsl = output[3]
-                mpslList = output[4]
-            elif returnEntSpec and returnEnv:
-                EEsl = output[3]
-                envl = output[4]
-            elif returnState and returnEnv:
-                mpslList = output[3]
-                envl = output[4]
-            elif returnEntSpec:
-                EEsl = output[3]
-            elif returnState:
-                mpslList = output[3]
-            elif returnEnv:
-                envl = output[3]
+            ind = 3
+            if returnEntSpec:
+                EEsl = output[ind]
+                ind += 1
+            if returnState:
+                mpslList = output[ind]
+                ind += 1
+            if returnEnv:
+                envl = output[ind]
+                ind += 1
+            if returnConv:
+                convHistl[mbdInd] = output[ind]
 
     # Lump right and left results
     if calcLeftState:
         EE = [EE,EEl]
+        EEvec = [EEvec,EEvecl]
         if returnEntSpec: EEs = [EEs,EEsl]
         if returnState: mpsList = [mpsList,mpslList]
         if returnEnv: env = [env,envl]
+        if returnConv: convHist = [convHist,convHistl]
+    if twoSided and returnState: mpsList = [mpsList[:nStates],mpsList[nStates:]]
 
     # Return Results
     if len(Evec) == 1:
@@ -503,4 +1205,68 @@ def run_dmrg(mpo,initEnv=None,initGuess=None,mbd=[2,4,8,16],
         output.append(mpsList)
     if returnEnv:
         output.append(env)
+    if returnConv:
+        output.append(convHist)
+    return output
+
+def run_dmrg_deflation(mpo,initGuess=None,fname=None,nStates=2,targetState=0,
+                       returnState=False,returnEnv=False,returnEntSpec=False,
+                       returnConv=False,lowStates=None,lowStatesLeft=None,
+                       **kwargs):
+    # Find the states one at a time, each as a single state mps optimized
+    # with the states found before it projected out. Unlike the state
+    # averaged calculation, each state only needs its own bond dimension.
+    # deflateWeight must be larger than the gaps to the targeted states.
+    # As H is not hermitian, the left state of each state is found with it,
+    # so that the lower states are removed without changing the
+    # eigenvectors of the later states (given lowStates need their left
+    # states in lowStatesLeft, unless H is hermitian). All other keyword
+    # arguments are passed on to run_dmrg.
+    if lowStates is None: lowStates = []
+    lowStates = list(lowStates)
+    if lowStatesLeft is None: lowStatesLeft = lowStates
+    lowStatesLeft = list(lowStatesLeft)
+    stateOutput = []
+    for state in range(nStates):
+        if VERBOSE > 0: print('Calculating State {} by Deflation'.format(state))
+        fname_state,guess_state = None,None
+        if fname is not None: fname_state = fname+'_state'+str(state)
+        if isinstance(initGuess,str):
+            guess_state = initGuess+'_state'+str(state)
+        elif initGuess is not None:
+            guess_state = [[initGuess[state]],[initGuess[state]]]
+        output = run_dmrg(mpo,initGuess=guess_state,
+                          fname=fname_state,nStates=1,
+                          returnState=True,
+                          returnEnv=returnEnv,
+                          returnEntSpec=returnEntSpec,
+                          returnConv=returnConv,
+                          calcLeftState=True,
+                          lowStates=lowStates,
+                          lowStatesLeft=lowStatesLeft,
+                          **kwargs)
+        # The state & its left state are projected out of all later
+        # calculations, only the right state results are returned
+        stateInd = 4 if returnEntSpec else 3
+        lowStates.append(output[stateInd][0][0])
+        lowStatesLeft.append(output[stateInd][1][0])
+        stateOutput.append([output[0],output[1][0],output[2]]+[out[0] for out in output[3:]])
+
+    # Return Results, as for the state averaged calculation
+    target = stateOutput[targetState]
+    gap = None
+    if nStates > 1: gap = stateOutput[0][0]-stateOutput[1][0]
+    output = [target[0],target[1],gap]
+    ind = 3
+    if returnEntSpec:
+        output.append(target[ind])
+        ind += 1
+    if returnState:
+        output.append([stateOutput[state][ind][0] for state in range(nStates)])
+    ind += 1
+    if returnEnv:
+        output.append(target[ind])
+        ind += 1
+    if returnConv:
+        output.append(target[ind])
     return output
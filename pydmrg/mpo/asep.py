@@ -328,3 +328,33 @@ def periodic_act(N,hamParams):
         tmp_op1[0] = np.array([[Sp]])
         mpoL.append(tmp_op1)
     return mpoL
+
+# LOCAL OPERATORS ---------------------------------------------------------
+# Terms for tools.contract.measure_profile (open chains), each a dict
+# {site:op} or a list of these to be summed
+
+def density_terms(N):
+    # Occupation of each site
+    return [{site:n} for site in range(N)]
+
+def curr_terms(N,hamParams):
+    # Current over each of the N+1 bonds (into the first site, between
+    # sites & out of the last site)
+    return bond_terms(N,hamParams,-1.)
+
+def act_terms(N,hamParams):
+    # Activity over each of the N+1 bonds
+    return bond_terms(N,hamParams,1.)
+
+def bond_terms(N,hamParams,sign):
+    if not isinstance(hamParams[0],(collections.Sequence,np.ndarray)):
+        hamParams = val2vecParams(N,hamParams)
+    else:
+        hamParams = extractParams(N,hamParams)
+    (ea,eg,ep,eq,eb,ed) = exponentiateBias(hamParams)
+    terms = [{0:ea[0]*Sm + sign*eg[0]*Sp}]
+    for site in range(N-1):
+        terms.append([{site:Sp,site+1:ep[site]*Sm},
+                      {site:Sm,site+1:sign*eq[site+1]*Sp}])
+    terms.append({N-1:eb[-1]*Sp + sign*ed[-1]*Sm})
+    return terms
@@ -1573,3 +1573,66 @@ def periodic_y_act_y(Nx,Ny,hamParams):
                 op1[inds[0]] = np.array([[Sm]])
                 mpoL.append(op1)
     return mpoL
+
+##########################################################################
+# Local Operators
+##########################################################################
+# Terms for tools.contract.measure_profile (open lattices), each a dict
+# {site:op} or a list of these to be summed, with site = xi*Ny+yi
+
+def density_terms(N):
+    # Occupation of each site
+    if hasattr(N,'__len__'):
+        Nx = N[0]
+        Ny = N[1]
+    else:
+        Nx = N
+        Ny = N
+    return [{site:n} for site in range(Nx*Ny)]
+
+def curr_terms(N,hamParams,orientation='horz'):
+    # Current over each horizontal ((Nx+1)*Ny, from the left boundary) or
+    # vertical (Nx*(Ny+1), from the top boundary) bond, in order of xi
+    return bond_terms(N,hamParams,orientation,-1.)
+
+def act_terms(N,hamParams,orientation='horz'):
+    # Activity over each horizontal or vertical bond (as curr_terms)
+    return bond_terms(N,hamParams,orientation,1.)
+
+def bond_terms(N,hamParams,orientation,sign):
+    if hasattr(N,'__len__'):
+        Nx = N[0]
+        Ny = N[1]
+    else:
+        Nx = N
+        Ny = N
+    # Convert hamParams all to matrices
+    if not isinstance(hamParams[0],(collections.Sequence,np.ndarray)):
+        hamParams = val2matParams(Nx,Ny,hamParams)
+    else:
+        hamParams = extractParams(hamParams)
+    (ejr,ejl,eju,ejd,ecr,ecl,ecu,ecd,edr,edl,edu,edd) = exponentiateBias(hamParams)
+    terms = []
+    if orientation == 'horz':
+        for xi in range(-1,Nx):
+            for yi in range(Ny):
+                site = xi*Ny+yi
+                if xi == -1:
+                    terms.append({yi:ecr[0,yi]*Sm + sign*edl[0,yi]*Sp})
+                elif xi == Nx-1:
+                    terms.append({site:edr[-1,yi]*Sp + sign*ecl[-1,yi]*Sm})
+                else:
+                    terms.append([{site:Sp,site+Ny:ejr[xi,yi]*Sm},
+                                  {site:Sm,site+Ny:sign*ejl[xi+1,yi]*Sp}])
+    elif orientation == 'vert':
+        for xi in range(Nx):
+            for yi in range(-1,Ny):
+                site = xi*Ny+yi
+                if yi == -1:
+                    terms.append({site+1:edu[xi,0]*Sp + sign*ecd[xi,0]*Sm})
+                elif yi == Ny-1:
+                    terms.append({site:ecu[xi,-1]*Sm + sign*edd[xi,-1]*Sp})
+                else:
+                    terms.append([{site:Sp,site+1:sign*ejd[xi,yi]*Sm},
+                                  {site:Sm,site+1:eju[xi,yi+1]*Sp}])
+    return terms
@@ -64,22 +64,17 @@ for i in range(len(s)):#-1,0,-1):
             print('rho',rho[i,:])
             rhoOrth[i,:] = 0.5*(calc_density_all(mps_fname,lmps_fname,orth=True,state=0) + calc_density_all(mps_fname,lmps_fname,orth=True,state=1))
             print('rhoOrth',rhoOrth[i,:])
-            # Calculate Activities
-            """
-            for site in range(N-1):
-                mpo = act_mpo(N,hamParams,singleBond=True,bond=site)
-                act    [i,site] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-                actOrth[i,site] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True )/contract(mps=mps_fname,lmps=lmps_fname,orth=True )
-            #print('act',act[i,:])
-            #print('actOrth',actOrth[i,:])
-            # Calculate Current
-            for site in range(N-1):
-                mpo = curr_mpo(N,hamParams,singleBond=True,bond=site)
-                cur    [i,site] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-                curOrth[i,site] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True )/contract(mps=mps_fname,lmps=lmps_fname,orth=True )
-            #print('cur',cur[i,:])
-            #print('curOrth',curOrth[i,:])
-            """
+            # Calculate Activities & Currents over the bonds between sites
+            termDict = {'act':act_terms(N,hamParams)[1:-1],
+                        'cur':curr_terms(N,hamParams)[1:-1]}
+            prof     = measure_profile(termDict,mps=mps_fname,lmps=lmps_fname,orth=False)
+            profOrth = measure_profile(termDict,mps=mps_fname,lmps=lmps_fname,orth=True)
+            act    [i,:] = np.real(prof['act'])
+            actOrth[i,:] = np.real(profOrth['act'])
+            cur    [i,:] = np.real(prof['cur'])
+            curOrth[i,:] = np.real(profOrth['cur'])
+            print('act',act[i,:])
+            print('cur',cur[i,:])
     except:
         print('Something didnt work with {}/{}'.format(i+1,len(s)))
 # Save Results
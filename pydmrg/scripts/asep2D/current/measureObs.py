@@ -93,88 +93,24 @@ for i in range(len(s)):#-1,-1,-1):
     rhoOrth[i,:,:] = np.reshape(rhoOrthVec,(Nx,Ny))
     print('rhoOrth',rhoOrth[i,:,:])
     
-    """
-    # Calculate Total Vertical Activity
-    mpo = act_mpo((Nx,Ny),hamParams,includex=False)
-    print('Vertical Total Activity = {}'.format(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)))
-    # Calculate Total Horizontal Activity
-    mpo = act_mpo((Nx,Ny),hamParams,includey=False)
-    print('Horizontal Total Activity = {}'.format(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)))
-    # Calculate Total Vertical Current
-    mpo = curr_mpo((Nx,Ny),hamParams,includex=False)
-    print('Vertical Total Current = {}'.format(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)))
-    # Calculate Total Horizontal Current
-    mpo = curr_mpo((Nx,Ny),hamParams,includey=False)
-    print('Horizontal Total Current = {}'.format(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)))
+    # Calculate Activities & Currents over all bonds (open lattices)
+    if not periodicx:
+        termDict = {'actHorz':act_terms ((Nx,Ny),hamParams,orientation='horz'),
+                    'actVert':act_terms ((Nx,Ny),hamParams,orientation='vert'),
+                    'curHorz':curr_terms((Nx,Ny),hamParams,orientation='horz'),
+                    'curVert':curr_terms((Nx,Ny),hamParams,orientation='vert')}
+        prof = measure_profile(termDict,mps=mps_fname,lmps=lmps_fname,orth=False)
+        profOrth = [measure_profile(termDict,mps=mps_fname,lmps=lmps_fname,orth=True,state=state) for state in range(2)]
+        for name,res,resOrth in [('actHorz',actHorz,actHorzOrth),
+                                 ('actVert',actVert,actVertOrth),
+                                 ('curHorz',curHorz,curHorzOrth),
+                                 ('curVert',curVert,curVertOrth)]:
+            res    [i,:,:] = np.reshape(np.real(prof[name]),res.shape[1:])
+            resOrth[i,:,:] = np.reshape(0.5*np.real(profOrth[0][name]+profOrth[1][name]),res.shape[1:])
+            print(name,res[i,:,:])
+            print(name+'Orth',resOrth[i,:,:])
+            print('Single Site Total {} = {}'.format(name,np.sum(res[i,:,:])))
 
-    # Calculate Horizontal Activities
-    for xind in range(Nx+1):
-        for yind in range(Ny):
-            if xind == 0:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,ybond=yind,xbond='left',orientation='horz')
-                print('Left Side')
-            elif xind == Nx:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,ybond=yind,xbond='right',orientation='horz')
-                print('Right Side')
-            else:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,ybond=yind,xbond=xind-1,orientation='horz')
-                print('Site {}'.format(xind-1))
-            actHorz    [i,xind,yind] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-            actHorzOrth[i,xind,yind] = 0.5*(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=0)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=0) +\
-                                            contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=1)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=1))
-            print(actHorz[i,xind,yind])
-    print('actHorz',actHorz[i,:,:])
-    print('actHorzOrth',actHorzOrth[i,:,:])
-    print('Single Site Activity Horz = {}'.format(np.sum(np.sum(actHorz[i,:,:]))))
-
-    # Calculate Vertical Activities
-    for xind in range(Nx):
-        for yind in range(Ny+1):
-            if yind == 0:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond='bottom',orientation='vert')
-            elif yind == Ny:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond='top',orientation='vert')
-            else:
-                mpo = act_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond=yind-1,orientation='vert')
-            actVert    [i,xind,yind] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-            actVertOrth[i,xind,yind] = 0.5*(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=0)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=0) + \
-                                            contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=1)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=1))
-    print('actVert',actVert[i,:,:])
-    print('actVertOrth',actVertOrth[i,:,:])
-    print('Single Site Activity Vert = {}'.format(np.sum(np.sum(actVert[i,:,:]))))
-
-    # Calculate Vertical Currents
-    for xind in range(Nx):
-        for yind in range(Ny+1):
-            if yind == 0:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond='bottom',orientation='vert')
-            elif yind == Ny:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond='top',orientation='vert')
-            else:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind,ybond=yind-1,orientation='vert')
-            curVert    [i,xind,yind] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-            curVertOrth[i,xind,yind] = 0.5*(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=0)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=0) +\
-                                            contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=1)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=1))
-    print('curVert',curVert[i,:,:])
-    print('curVertOrth',curVertOrth[i,:,:])
-    print('Single Site Current Vert = {}'.format(np.sum(np.sum(curVert[i,:,:]))))
-
-    # Calculate Horizontal Currents
-    for xind in range(Nx+1):
-        for yind in range(Ny):
-            if xind == 0:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,ybond=yind,xbond='left',orientation='horz')
-            elif xind == Nx:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,ybond=yind,xbond='right',orientation='horz')
-            else:
-                mpo = curr_mpo((Nx,Ny),hamParams,singleBond=True,xbond=xind-1,ybond=yind,orientation='horz')
-            curHorz    [i,xind,yind] = contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=False)/contract(mps=mps_fname,lmps=lmps_fname,orth=False)
-            curHorzOrth[i,xind,yind] = 0.5*(contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=0)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=0) +\
-                                            contract(mps=mps_fname,lmps=lmps_fname,mpo=mpo,orth=True,state=1)/contract(mps=mps_fname,lmps=lmps_fname,orth=True,state=1))
-    print('curHorz',curHorz[i,:,:])
-    print('curHorzOrth',curHorz[i,:,:])
-    print('Single Site Current Horz = {}'.format(np.sum(np.sum(curHorz[i,:,:]))))
-    """
     # Save Results
     np.savez(folder+'observables.npz',s=s,
                                       E=E,
@@ -183,12 +119,12 @@ for i in range(len(s)):#-1,-1,-1):
                                       EEl=EEl,
                                       EElorth=EElorth,
                                       rho=rho,
-                                      rhoOrth=rhoOrth)
-                                      #actVert=actVert,
-                                      #actVertOrth=actVertOrth,
-                                      #actHorz=actHorz,
-                                      #actHorzOrth=actHorzOrth,
-                                      #curVert=curVert,
-                                      #curVertOrth=curVertOrth,
-                                      #curHorz=curHorz,
-                                      #curHorzOrth=curHorzOrth)
+                                      rhoOrth=rhoOrth,
+                                      actVert=actVert,
+                                      actVertOrth=actVertOrth,
+                                      actHorz=actHorz,
+                                      actHorzOrth=actHorzOrth,
+                                      curVert=curVert,
+                                      curVertOrth=curVertOrth,
+                                      curHorz=curHorz,
+                                      curHorzOrth=curHorzOrth)
@@ -1,6 +1,6 @@
 from dmrg import *
 from mpo.asep2D import return_mpo as return_mpo_asep2D
-from tools.contract import full_contract as contract
+from tools.contract import measure_obs
 import time
 from sys import argv
 import os
@@ -29,59 +29,21 @@ print('s\tCurr\t\tCurrx\t\t\tCurry\t\tAct\t\tActx\t\tActy')
 for i in range(len(s)):
     fname = folder + 'MPS_s'+str(i)+'_mbd0'
     hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,s[i]])
-    # Calculate Currents & Activities =======================
-    # xy current
-    currMPO = curr_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=True,includey=True)
-    opCurr = contract(mpo = currMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    curr=np.append(curr,opCurr/opNorm)
-    #print('Current = {}'.format(curr[-1]))
-    # x current
-    currMPO = curr_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=True,includey=False)
-    opCurr = contract(mpo = currMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    currx=np.append(currx,opCurr/opNorm)
-    #print('Current (x dir) = {}'.format(currx[-1]))
-    # y current
-    currMPO = curr_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=False,includey=True)
-    opCurr = contract(mpo = currMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    curry=np.append(curry,opCurr/opNorm)
-    #print('Current (y dir) = {}'.format(curry[-1]))
-    # xy activity
-    actMPO = act_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=True,includey=True)
-    opAct = contract(mpo = actMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    act=np.append(act,opAct/opNorm)
-    #print('Activity = {}'.format(act[-1]))
-    # x activity
-    actMPO = act_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=True,includey=False)
-    opAct = contract(mpo = actMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    actx=np.append(actx,opAct/opNorm)
-    #print('Activity (x dir) = {}'.format(actx[-1]))
-    # y activity
-    actMPO = act_mpo((Nx,Ny),hamParams,periodicy=False,periodicx=False,includex=False,includey=True)
-    opAct = contract(mpo = actMPO,
-                        mps = fname,
-                        lmps= fname+'_left')
-    opNorm = contract(mps = fname,
-                        lmps= fname+'_left')
-    acty=np.append(acty,opAct/opNorm)
-    #print('Activity (y dir) = {}'.format(acty[-1]))
+    # Calculate Currents & Activities (in a single sweep) ===
+    kwargs = {'periodicy':False,'periodicx':False}
+    mpoDict = {'curr' :curr_mpo((Nx,Ny),hamParams,includex=True ,includey=True ,**kwargs),
+               'currx':curr_mpo((Nx,Ny),hamParams,includex=True ,includey=False,**kwargs),
+               'curry':curr_mpo((Nx,Ny),hamParams,includex=False,includey=True ,**kwargs),
+               'act'  :act_mpo ((Nx,Ny),hamParams,includex=True ,includey=True ,**kwargs),
+               'actx' :act_mpo ((Nx,Ny),hamParams,includex=True ,includey=False,**kwargs),
+               'acty' :act_mpo ((Nx,Ny),hamParams,includex=False,includey=True ,**kwargs)}
+    obs = measure_obs(mpoDict,
+                      mps = fname,
+                      lmps= fname+'_left')
+    curr=np.append(curr,obs['curr'])
+    currx=np.append(currx,obs['currx'])
+    curry=np.append(curry,obs['curry'])
+    act=np.append(act,obs['act'])
+    actx=np.append(actx,obs['actx'])
+    acty=np.append(acty,obs['acty'])
     print('{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(s[i],np.real(curr[-1]),np.real(currx[-1]),np.real(curry[-1]),np.real(act[-1]),np.real(actx[-1]),np.real(acty[-1])))
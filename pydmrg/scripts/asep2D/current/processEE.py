@@ -12,14 +12,23 @@ N = int(npzfile['Nx']*npzfile['Ny'])
 nStates = 2
 p = 0.1
 
-# Allocate data to hold orthonormalized EE
+# Allocate data to hold orthonormalized EE & schmidt values
 EEorth = np.zeros((len(s),2,N-1))
+specOrth = [None]*len(s)
 
 for i in range(len(s)):
     mps_fname = folder + 'MPS_s'+str(i)+'_mbd0'
     hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,s[i]])
     #mpo = return_mpo(N,hamParams)
-    EEtmp = calc_entanglement_all(mps_fname,orth=True)
+    EEtmp,specOrth[i] = calc_entanglement_spectra(mps_fname,orth=True)
     EEorth[i,:,:] = EEtmp
     print('s = {}, EE = {}'.format(s[i],EEorth[i,:,int(N/2)-1]))
-np.savez(folder+'results_OrthEE.npz',s=s,EE=EEorth)
+# Pad schmidt values with zeros to the largest bond dimension
+maxD = max([len(S) for specS in specOrth for specState in specS for S in specState])
+spec = np.zeros((len(s),2,N-1,maxD))
+for i in range(len(s)):
+    for state in range(2):
+        for bond in range(N-1):
+            S = specOrth[i][state][bond]
+            spec[i,state,bond,:len(S)] = S
+np.savez(folder+'results_OrthEE.npz',s=s,EE=EEorth,spec=spec)
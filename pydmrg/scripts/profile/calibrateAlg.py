@@ -0,0 +1,69 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Time the dense, davidson & arnoldi local solvers at the center of an
+# open asep chain for a range of bond dimensions & numbers of states and
+# save the thresholds used by alg='auto' (to fname, by default AUTO_ALG_FILE
+# in the user cache directory, which alg='auto' loads when first used)
+# Usage: python calibrateAlg.py [nRep] [fname]
+
+# Set Benchmark Parameters
+if len(argv) > 1:
+    nRep = int(argv[1])
+else:
+    nRep = 3
+fname = None
+if len(argv) > 2: fname = argv[2]
+Dvec = [1,2,3,4,6,8,12,16,24,32,48,64]
+nStatesVec = [1,2,4]
+algs = ['exact','davidson','arnoldi']
+hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+
+def time_solver(mps,mpo,env,site,nStates,alg):
+    t0 = time.time()
+    for i in range(nRep):
+        calc_eigs(mps,mpo,env,site,nStates,alg=alg)
+    return (time.time()-t0)/nRep
+
+times = np.zeros((len(nStatesVec),len(Dvec),len(algs)))
+dims = np.zeros(len(Dvec),dtype=int)
+for Dind,D in enumerate(Dvec):
+    # Chain long enough for the center bond to reach D
+    N = 2*int(np.ceil(np.log2(max(D,2))))+2
+    site = int(N/2)
+    mpo = return_mpo(N,hamParams)
+    for nInd,nStates in enumerate(nStatesVec):
+        np.random.seed(0)
+        mps = create_all_mps(N,D,nStates)
+        mps = make_all_mps_right(mps)
+        # Gauge on the benchmark site so both environments are orthonormal
+        mps = [move_gauge(mps[state],0,site) for state in range(nStates)]
+        env = calc_env(mps[0],mpo,D,gaugeSite=site)
+        dims[Dind] = mps[0][site].size
+        for algInd,alg in enumerate(algs):
+            if (alg != 'exact') and (nStates+2 >= dims[Dind]):
+                times[nInd,Dind,algInd] = np.inf
+            elif (alg == 'exact') and (Dind > 0) and (times[nInd,Dind-1,0] > 10.*np.min(times[nInd,Dind-1,1:])):
+                # Dense solves are already far slower
+                times[nInd,Dind,algInd] = np.inf
+            else:
+                times[nInd,Dind,algInd] = time_solver(mps,mpo,env,site,nStates,alg)
+    print('D = {}, dim = {}'.format(D,dims[Dind]))
+    for nInd,nStates in enumerate(nStatesVec):
+        print('\tnStates = {}: '.format(nStates)+', '.join(['{} {:f} s'.format(alg,times[nInd,Dind,algInd]) for algInd,alg in enumerate(algs)]))
+
+# Dense solves are used up to the largest dimension where they are
+# fastest, the faster iterative solver is used above that
+denseDim,iterAlg = [],[]
+for nInd,nStates in enumerate(nStatesVec):
+    best = np.argmin(times[nInd],axis=1)
+    denseDim.append(int(dims[best == 0].max()) if np.any(best == 0) else 0)
+    iterTimes = np.sum(times[nInd][dims > denseDim[-1],1:],axis=0)
+    if np.all(dims <= denseDim[-1]): iterTimes = np.sum(times[nInd][-1:,1:],axis=0)
+    iterAlg.append(algs[1+np.argmin(iterTimes)])
+set_auto_alg(nStatesVec,denseDim,iterAlg)
+save_auto_alg(fname)
+print('Dense Dims = {}, Iterative Solvers = {}'.format(denseDim,iterAlg))
+print('Saved to {}'.format(AUTO_ALG_FILE if fname is None else fname))
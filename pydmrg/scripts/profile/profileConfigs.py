@@ -0,0 +1,49 @@
+import time
+import itertools
+from dmrg import *
+from tools.mps_tools import contract_configs
+from sys import argv
+
+# Compare calculating the amplitudes of a set of configurations one at a
+# time (as contract_config does) to contracting them all at once, sharing
+# common prefixes, for all configurations of a chain, all configurations
+# with k particles & random configurations
+# Usage: python profileConfigs.py [mbd]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 16
+
+def one_at_a_time(M,configs):
+    amp = np.zeros(len(configs),dtype=complex)
+    for i in range(len(configs)):
+        res = np.array([[1]])
+        for site in range(len(M)):
+            res = np.dot(res,M[site][configs[i,site],:,:])
+        amp[i] = res[0,0]
+    return amp
+
+def k_particle_configs(N,k):
+    inds = np.array(list(itertools.combinations(range(N),k)))
+    configs = np.zeros((len(inds),N),dtype=int)
+    configs[np.arange(len(inds))[:,None],inds] = 1
+    return configs
+
+np.random.seed(0)
+cases = [('All (N=14)',14,lambda N: (np.arange(2**N)[:,None] >> np.arange(N-1,-1,-1)[None,:]) & 1),
+         ('k=4 (N=24)',24,lambda N: k_particle_configs(N,4)),
+         ('Random (N=40)',40,lambda N: np.random.randint(2,size=(10000,N)))]
+print('Configurations\tM\tSeparate (s)\tBatched (s)\tRatio\tMax Diff')
+for name,N,make_configs in cases:
+    mps = make_all_mps_right(create_all_mps(N,mbd,1))
+    configs = make_configs(N)
+    t0 = time.time()
+    amp1 = one_at_a_time(mps[0],configs)
+    t1 = time.time()-t0
+    t0 = time.time()
+    amp2 = contract_configs(mps,configs)
+    t2 = time.time()-t0
+    maxDiff = np.max(np.abs(amp1-amp2))/np.max(np.abs(amp1))
+    print('{}\t{}\t{:f}\t{:f}\t{:.1f}\t{:e}'.format(name,len(configs),t1,t2,t1/t2,maxDiff))
@@ -0,0 +1,45 @@
+import time
+from continuation import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare a continuation scan over s for the open asep against
+# independent calculations (random initial guesses) at the same points.
+# Deep in the low current phase (s > 0) the independent calculations can
+# end up in an excited state, which the continuation does not.
+# Usage: python profileContinuation.py [mbd] [N]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 10
+if len(argv) > 2:
+    N = int(argv[2])
+else:
+    N = 10
+s0,sF = -0.5,0.5
+def mpoFun(s):
+    return return_mpo(N,np.array([0.5,0.5,0.2,0.8,0.8,0.5,s]))
+
+# Continuation
+np.random.seed(0)
+t0 = time.time()
+sVec,E,EE,gap,nSweeps = run_continuation(mpoFun,s0,sF,ds=0.02,mbd=mbd)
+tCont = time.time()-t0
+
+# Independent calculations
+Ecold,nSweepsCold = [],[]
+t0 = time.time()
+for s in sVec:
+    np.random.seed(0)
+    Es,_,_,hist = run_dmrg(mpoFun(s),mbd=mbd,midSweepStop=True,returnConv=True)
+    Ecold.append(Es)
+    nSweepsCold.append(len(hist[-1]['E']))
+tCold = time.time()-t0
+
+print('s\tE (continuation)\tHalf Sweeps\tE (independent)\tHalf Sweeps')
+for i in range(len(sVec)):
+    print('{:f}\t{:f}\t{}\t{:f}\t{}'.format(sVec[i],np.real(E[i]),nSweeps[i],np.real(Ecold[i]),nSweepsCold[i]))
+print('Points = {}, Continuation Time = {:f} s, Independent Time = {:f} s'.format(len(sVec),tCont,tCold))
+print('Max Energy Difference = {}'.format(np.max(np.abs(E-np.array(Ecold)))))
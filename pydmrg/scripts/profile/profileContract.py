@@ -0,0 +1,52 @@
+import time
+import numpy as np
+from pyscf.lib import einsum
+from tools.einsum_tools import einsum_cached,clear_einsum_cache
+
+# Compare the einsum chain previously used for the effective hamiltonian
+# matvec and environment updates with the planned & cached contractions
+# Usage: python profileContract.py
+
+# Set Benchmark Parameters
+Dvec = [32,64,128,256,512]
+mbdW = 6 # MPO bond dimension of the open asep mpo
+d = 2
+nRep = 10
+
+def old_matvec(FL,W,FR,x):
+    in_sum1 = einsum('ijk,lmk->ijlm',FR,x)
+    in_sum2 = einsum('njol,ijlm->noim',W,in_sum1)
+    return einsum('pnm,noim->opi',FL,in_sum2)
+
+def new_matvec(FL,W,FR,x):
+    return einsum_cached('pnm,njol,ijk,lmk->opi',FL,W,FR,x)
+
+def old_envR(F,Ml,W,M):
+    tmp1 = einsum('jlp,ijk->lpik',F,Ml)
+    tmp2 = einsum('lmin,lpik->mpnk',W,tmp1)
+    return einsum('npq,mpnk->kmq',M,tmp2)
+
+def new_envR(F,Ml,W,M):
+    return einsum_cached('jlp,ijk,lmin,npq->kmq',F,Ml,W,M)
+
+def time_func(func,*args):
+    func(*args)
+    t0 = time.time()
+    for i in range(nRep):
+        res = func(*args)
+    return (time.time()-t0)/nRep,res
+
+clear_einsum_cache()
+print('D\tOld Hx (s)\tNew Hx (s)\tOld Env (s)\tNew Env (s)\tMax Diff')
+for D in Dvec:
+    FL = np.random.rand(D,mbdW,D)+1.j*np.random.rand(D,mbdW,D)
+    FR = np.random.rand(D,mbdW,D)+1.j*np.random.rand(D,mbdW,D)
+    W = np.random.rand(mbdW,mbdW,d,d)
+    x = np.random.rand(d,D,D)+1.j*np.random.rand(d,D,D)
+    tOldHx,resOld = time_func(old_matvec,FL,W,FR,x)
+    tNewHx,resNew = time_func(new_matvec,FL,W,FR,x)
+    diff = np.max(np.abs(resOld-resNew))
+    tOldEnv,resOld = time_func(old_envR,FL,np.conj(x),W,x)
+    tNewEnv,resNew = time_func(new_envR,FL,np.conj(x),W,x)
+    diff = max(diff,np.max(np.abs(resOld-resNew)))
+    print('{}\t{:f}\t{:f}\t{:f}\t{:f}\t{:e}'.format(D,tOldHx,tNewHx,tOldEnv,tNewEnv,diff))
@@ -0,0 +1,50 @@
+import time
+from dmrg import *
+from mpo.ops import n
+from tools.contract import full_contract,measure_corr
+from sys import argv
+
+# Compare calculating the density correlation matrix <n_i n_j> of an
+# mps with one contraction per pair of sites to carrying the transfer
+# matrices from each site (for all pairs & within a window)
+# Usage: python profileCorr.py [mbd] [window]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    window = int(argv[2])
+else:
+    window = 4
+Nvec = [10,20,40]
+
+print('N\tSeparate (s)\tMatrix (s)\tRatio\tWindow (s)\tMax Diff')
+for N in Nvec:
+    np.random.seed(0)
+    mps = make_all_mps_right(create_all_mps(N,mbd,1))
+    lmps = make_all_mps_right(create_all_mps(N,mbd,1))
+    # One contraction per pair
+    t0 = time.time()
+    C1 = np.zeros((N,N),dtype=complex)
+    norm = full_contract(mps=mps,lmps=lmps)
+    for i in range(N):
+        for j in range(N):
+            mpo = [[None]*N]
+            if i == j:
+                mpo[0][i] = np.array([[n]])
+            else:
+                mpo[0][i] = np.array([[n]])
+                mpo[0][j] = np.array([[n]])
+            C1[i,j] = full_contract(mpo=mpo,mps=mps,lmps=lmps)/norm
+    t1 = time.time()-t0
+    # Transfer matrices carried from each site
+    t0 = time.time()
+    C2 = measure_corr(n,mps=mps,lmps=lmps)
+    t2 = time.time()-t0
+    t0 = time.time()
+    measure_corr(n,mps=mps,lmps=lmps,window=window)
+    t3 = time.time()-t0
+    maxDiff = np.max(np.abs(C1-C2)/np.abs(C1))
+    print('{}\t{:f}\t{:f}\t{:.1f}\t{:f}\t{:e}'.format(N,t1,t2,t1/t2,t3,maxDiff))
@@ -0,0 +1,41 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare the gap of the open asep from the state averaged calculation
+# and from deflation (each state its own mps) at several bond
+# dimensions against a large bond dimension reference
+# Usage: python profileDeflation.py [N] [mbdRef]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    N = int(argv[1])
+else:
+    N = 20
+if len(argv) > 2:
+    mbdRef = int(argv[2])
+else:
+    mbdRef = 40
+mbdVec = [4,6,8,12,16]
+hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+mpo = return_mpo(N,hamParams)
+
+# Reference gap
+np.random.seed(0)
+_,_,gapRef = run_dmrg(mpo,mbd=mbdRef,nStates=2,deflation=True,checkpoint=False)
+
+print('mbd\taverage gap err\taverage (s)\tdeflation gap err\tdeflation (s)')
+for mbd in mbdVec:
+    res = []
+    for deflation in [False,True]:
+        np.random.seed(0)
+        t0 = time.time()
+        _,_,gap = run_dmrg(mpo,
+                           mbd=mbd,
+                           nStates=2,
+                           deflation=deflation,
+                           checkpoint=False)
+        t = time.time()-t0
+        res.append('{:e}\t{:f}'.format(np.abs(gap-gapRef),t))
+    print('{}\t'.format(mbd)+'\t'.join(res))
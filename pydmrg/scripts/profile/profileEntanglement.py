@@ -0,0 +1,46 @@
+import time
+import copy
+from dmrg import *
+from tools.aux.process_states import calc_entanglement_spectra
+from sys import argv
+
+# Compare calculating the entanglement entropy at every bond of a set of
+# states by moving the gauge to each bond in turn (as previously done) to
+# a single canonicalizing sweep per state
+# Usage: python profileEntanglement.py [mbd] [nStates]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    nStates = int(argv[2])
+else:
+    nStates = 2
+Nvec = [10,20,40]
+
+def move_gauge_entanglement(mps):
+    # Previous approach, moving the gauge of each state through the chain
+    mps = copy.deepcopy(mps)
+    N = len(mps[0])
+    EE = np.zeros((len(mps),N-1))
+    for state in range(len(mps)):
+        for site in range(N-1):
+            mps[state],EE[state,site] = move_gauge_right(mps[state],site,returnEE=True)
+        for site in range(N-1,0,-1):
+            mps[state],EE[state,site-1] = move_gauge_left(mps[state],site,returnEE=True)
+    return EE
+
+print('N\tMove Gauge (s)\tOne Sweep (s)\tRatio\tMax Diff')
+for N in Nvec:
+    np.random.seed(0)
+    mps = make_all_mps_right(create_all_mps(N,mbd,nStates))
+    t0 = time.time()
+    EE1 = move_gauge_entanglement(mps)
+    t1 = time.time()-t0
+    t0 = time.time()
+    EE2,_ = calc_entanglement_spectra(mps)
+    t2 = time.time()-t0
+    maxDiff = np.max(np.abs(EE1-EE2))
+    print('{}\t{:f}\t{:f}\t{:.1f}\t{:e}'.format(N,t1,t2,t1/t2,maxDiff))
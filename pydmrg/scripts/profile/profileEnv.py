@@ -0,0 +1,42 @@
+import time
+from dmrg import *
+from mpo.asep2D import return_mpo
+from sys import argv
+
+# Compare the environment update cost when the full mps is
+# conjugated at every step (old behavior) to conjugating a single site
+# Usage: python profileEnv.py [mbd] [Ny]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 10
+if len(argv) > 2:
+    Ny = int(argv[2])
+else:
+    Ny = 10
+NxVec = [2,4,6,8,10]
+p = 0.1
+s = 0.5
+hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,s])
+
+print('N\tFull Conj (s)\tSite Conj (s)\tRatio')
+for Nx in NxVec:
+    N = Nx*Ny
+    mpo = return_mpo((Nx,Ny),hamParams)
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)
+    env = calc_env(mps[0],mpo,mbd)
+    # Right sweep conjugating the entire mps at each step
+    t0 = time.time()
+    for site in range(N-1):
+        env = update_envR(mps[0],mpo,env,site,Ml=conj_mps(mps[0]))
+    tFull = time.time()-t0
+    # Right sweep conjugating only the contracted site
+    env = calc_env(mps[0],mpo,mbd)
+    t0 = time.time()
+    for site in range(N-1):
+        env = update_envR(mps[0],mpo,env,site)
+    tSite = time.time()-t0
+    print('{}\t{:f}\t{:f}\t{:f}'.format(N,tFull,tSite,tFull/tSite))
@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+from dmrg import *
+from tools.einsum_tools import WORKSPACE,clear_workspace
+import tools.env_tools as env_tools
+from mpo.asep2D import return_mpo
+from sys import argv
+
+# Compare environment sweeps for the 2D asep with new arrays at every
+# update (old behavior) to writing into the existing blocks with
+# intermediates held in the einsum workspace, timing them & tracking the
+# memory allocated during a sweep (and the size of the workspace, which
+# is kept between sweeps)
+# Usage: python profileEnvBuffers.py [mbd] [Ny] [nSweeps]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    Ny = int(argv[2])
+else:
+    Ny = 4
+if len(argv) > 3:
+    nSweeps = int(argv[3])
+else:
+    nSweeps = 2
+NxVec = [2,4,6]
+p = 0.1
+s = 0.5
+hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,s])
+
+def run_sweeps(mps,mpo,env,N):
+    # Sweeps of environment updates (as in the dmrg sweeps, the blocks
+    # being updated were calculated in the previous sweep)
+    for sweep in range(nSweeps):
+        for site in range(N-1):
+            env = update_envR(mps,mpo,env,site)
+        for site in range(N-1,0,-1):
+            env = update_envL(mps,mpo,env,site)
+    return env
+
+print('N\tNew Arrays (s)\tBuffers (s)\tNew Arrays Peak (MB)\tBuffers Peak (MB)\tWorkspace (MB)')
+for Nx in NxVec:
+    N = Nx*Ny
+    mpo = return_mpo((Nx,Ny),hamParams)
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)[0]
+    # Make the mps complex, as after a sweep of the nonhermitian problem
+    mps = [M.astype(np.complex_) for M in mps]
+    results = []
+    for reuse in [False,True]:
+        env_tools.REUSE_ENV_BUFFERS = reuse
+        env = calc_env(mps,mpo,mbd)
+        run_sweeps(mps,mpo,env,N)
+        t0 = time.time()
+        env = run_sweeps(mps,mpo,env,N)
+        tSweep = time.time()-t0
+        tracemalloc.start()
+        run_sweeps(mps,mpo,env,N)
+        _,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append([tSweep,peak/1e6])
+    workspace = sum([buf.nbytes for buf in WORKSPACE.__dict__.values()])/1e6
+    clear_workspace()
+    print('{}\t{:f}\t{:f}\t{:f}\t{:f}\t{:f}'.format(N,results[0][0],results[1][0],results[0][1],results[1][1],workspace))
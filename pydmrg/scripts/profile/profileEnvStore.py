@@ -0,0 +1,50 @@
+import time
+import resource
+from dmrg import *
+import tools.env_store as env_store
+from mpo.asep2D import return_mpo
+from sys import argv
+
+# Run the 2D asep (right & left states) with the environments held in
+# memory or spilled to disk beyond a RAM budget, printing the run time,
+# the size of the environments, the most memory they held & the peak
+# RSS of the process (so run each budget in its own process)
+# Usage: python profileEnvStore.py [budget (MB, 0 for no budget)] [mbd] [Nx] [Ny] [scratchDir]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    budget = float(argv[1])
+else:
+    budget = 0.
+if len(argv) > 2:
+    mbd = int(argv[2])
+else:
+    mbd = 32
+if len(argv) > 3:
+    Nx = int(argv[3])
+else:
+    Nx = 8
+if len(argv) > 4:
+    Ny = int(argv[4])
+else:
+    Ny = 4
+scratchDir = None
+if len(argv) > 5: scratchDir = argv[5]
+p = 0.1
+s = 0.5
+hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,s])
+
+if budget > 0.: env_store.set_env_budget(int(budget*1e6),scratchDir=scratchDir)
+mpo = return_mpo((Nx,Ny),hamParams)
+np.random.seed(0)
+t0 = time.time()
+E,_,_,env = run_dmrg(mpo,mbd=mbd,maxIter=2,calcLeftState=True,returnEnv=True)
+tRun = time.time()-t0
+# Size of all blocks (read back if spilled)
+envSize = sum([F[site].nbytes for envi in env for F in envi for site in range(len(F))])
+if budget > 0.:
+    envPeak = env_store.ENV_PEAK_BYTES
+else:
+    envPeak = envSize
+print('Budget = {} MB, E = {}'.format(budget,E))
+print('Time = {:f} s, Env Size = {:f} MB, Env Peak = {:f} MB, Max RSS = {:f} MB'.format(tRun,envSize/1e6,envPeak/1e6,resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1e3))
@@ -0,0 +1,38 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare the time & energy of one site sweeps (zero padded mbd ladder),
+# one site sweeps with subspace expansion and two site sweeps
+# Usage: python profileExpansion.py [N] [alpha]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    N = int(argv[1])
+else:
+    N = 20
+if len(argv) > 2:
+    alpha = float(argv[2])
+else:
+    alpha = 1e-4
+mbd = [4,8,16,32]
+hamParams = np.array([0.5,0.5,0.2,0.8,0.5,0.5,-0.5])
+mpo = return_mpo(N,hamParams)
+alg = 'arnoldi'
+maxIter = 4
+
+t0 = time.time()
+E1,_,_ = run_dmrg(mpo,mbd=mbd,alg=alg,maxIter=maxIter,
+                  fname='saved_states/profile_oneSite')
+t1 = time.time()
+E2,_,_ = run_dmrg(mpo,mbd=mbd,alg=alg,maxIter=maxIter,expand=alpha,
+                  fname='saved_states/profile_expand')
+t2 = time.time()
+E3,_,_ = run_dmrg(mpo,mbd=mbd,alg=alg,maxIter=maxIter,oneSite=False,
+                  fname='saved_states/profile_twoSite')
+t3 = time.time()
+print('Method\t\tTime (s)\tEnergy')
+print('One Site\t{:f}\t{}'.format(t1-t0,np.real(E1[-1])))
+print('Expansion\t{:f}\t{}'.format(t2-t1,np.real(E2[-1])))
+print('Two Site\t{:f}\t{}'.format(t3-t2,np.real(E3[-1])))
@@ -0,0 +1,47 @@
+import time
+from dmrg import *
+from mpo.asep2D import return_mpo
+from sys import argv
+
+# Compare the cost of building the environment and applying the
+# effective hamiltonian at every site for the list of mpos of a
+# periodic 2D lattice and the same mpos fused into a single mpo
+# Usage: python profileFuse.py [mbd] [Ny]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 20
+if len(argv) > 2:
+    Ny = int(argv[2])
+else:
+    Ny = 4
+NxVec = [2,3,4]
+hamParams = np.array([0.5,0.5,0.2,0.8,0.3,0.1,0.5,0.5,0.2,0.3,0.5,0.5,0.1,0.4])
+
+def time_sweep(mps,mpo):
+    t0 = time.time()
+    env = calc_env(mps[0],mpo,mbd)
+    t1 = time.time()
+    for site in range(len(mps[0])-1):
+        Hfun,_ = make_ham_func(mps[0],mpo,env,site)
+        Hfun(np.reshape(mps[0][site],-1))
+        env = update_envR(mps[0],mpo,env,site)
+    t2 = time.time()
+    return t1-t0,t2-t1
+
+print('N\tTerms\tMax Bond\tFused Bond\tEnv (s)\tFused Env (s)\tSweep (s)\tFused Sweep (s)')
+for Nx in NxVec:
+    N = Nx*Ny
+    mpo = return_mpo((Nx,Ny),hamParams,periodicx=True,periodicy=True)
+    t = time.time()
+    mpoF = fuse_mpo(mpo)
+    tFuse = time.time()-t
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)
+    tEnv,tSweep = time_sweep(mps,mpo)
+    tEnvF,tSweepF = time_sweep(mps,mpoF)
+    print('{}\t{}\t{}\t\t{}\t\t{:f}\t{:f}\t{:f}\t{:f}'.format(N,len(mpo),np.max(mpo_bond_dims(mpo)),
+                                                          np.max(mpo_bond_dims(mpoF)),
+                                                          tEnv,tEnvF,tSweep,tSweepF))
@@ -0,0 +1,43 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare the matvecs per site in each half sweep for arnoldi, davidson
+# and the thick restart krylov solver with & without carrying its ritz
+# vectors between sites
+# Usage: python profileKrylov.py [mbd] [N]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 20
+if len(argv) > 2:
+    N = int(argv[2])
+else:
+    N = 20
+hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+mpo = return_mpo(N,hamParams)
+runs = [('arnoldi',{}),
+        ('davidson',{'precond':'none'}),
+        ('krylov',{'recycleDim':0}),
+        ('krylov',{})]
+
+results = []
+for alg,opts in runs:
+    np.random.seed(0)
+    t0 = time.time()
+    E,_,_,hist = run_dmrg(mpo,
+                          mbd=mbd,
+                          alg=alg,
+                          tol=1e-8,
+                          maxIter=6,
+                          returnConv=True,
+                          checkpoint=False,
+                          **opts)
+    t = time.time()-t0
+    results.append((alg,opts,E,t,hist[0]['nMatvec']))
+for alg,opts,E,t,nMatvec in results:
+    print('{} {}: E = {}, Time = {:f} s'.format(alg,opts,E,t))
+    print('\tMatvecs/Site = {}'.format(np.round(np.sum(nMatvec,axis=1)/float(N),1)))
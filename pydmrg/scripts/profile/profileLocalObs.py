@@ -0,0 +1,44 @@
+import time
+from dmrg import *
+from mpo.asep import curr_mpo,density_terms,curr_terms
+from tools.contract import full_contract,measure_profile
+from sys import argv
+
+# Compare measuring the density & bond current at every site of an open
+# asep chain with one contraction (and norm) per site to measuring them
+# all from a single set of left & right environments
+# Usage: python profileLocalObs.py [mbd]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+Nvec = [10,20,40,80]
+hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+
+print('N\tSeparate (s)\tProfile (s)\tRatio\tMax Diff')
+for N in Nvec:
+    np.random.seed(0)
+    mps = make_all_mps_right(create_all_mps(N,mbd,1))
+    lmps = make_all_mps_right(create_all_mps(N,mbd,1))
+    # One contraction per site & bond
+    t0 = time.time()
+    dens1,curr1 = np.zeros(N,dtype=complex),np.zeros(N-1,dtype=complex)
+    for site in range(N):
+        mpo = [[None]*N]
+        mpo[0][site] = np.array([[[[0.,0.],
+                                   [0.,1.]]]])
+        dens1[site] = full_contract(mpo=mpo,mps=mps,lmps=lmps)/full_contract(mps=mps,lmps=lmps)
+    for site in range(N-1):
+        mpo = curr_mpo(N,hamParams,singleBond=True,bond=site)
+        curr1[site] = full_contract(mpo=mpo,mps=mps,lmps=lmps)/full_contract(mps=mps,lmps=lmps)
+    t1 = time.time()-t0
+    # Single set of environments
+    t0 = time.time()
+    prof = measure_profile({'density':density_terms(N),
+                            'curr':curr_terms(N,hamParams)[1:-1]},mps=mps,lmps=lmps)
+    t2 = time.time()-t0
+    maxDiff = max(np.max(np.abs(dens1-prof['density'])/np.abs(dens1)),
+                  np.max(np.abs(curr1-prof['curr'])/np.abs(curr1)))
+    print('{}\t{:f}\t{:f}\t{:.1f}\t{:e}'.format(N,t1,t2,t1/t2,maxDiff))
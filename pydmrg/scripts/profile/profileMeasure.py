@@ -0,0 +1,52 @@
+import time
+from dmrg import *
+from mpo.asep2D import return_mpo,curr_mpo,act_mpo
+from tools.contract import full_contract,measure_obs
+from sys import argv
+
+# Compare measuring the currents & activities of a 2D asep mps (as in
+# scripts/asep2D/current/processActivity.py) one contraction (and norm)
+# at a time to measuring all of them in a single sweep
+# Usage: python profileMeasure.py [mbd] [nRep]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    nRep = int(argv[2])
+else:
+    nRep = 3
+NxVec = [4,6,8]
+p = 0.1
+hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.5,0.5,0.,0.,0.5,0.5,0.,-0.5])
+
+print('Nx x Ny\tSeparate (s)\tSingle Sweep (s)\tRatio\tMax Diff')
+for Nx in NxVec:
+    Ny = Nx
+    N = Nx*Ny
+    kwargs = {'periodicy':False,'periodicx':False}
+    mpoDict = {'curr' :curr_mpo((Nx,Ny),hamParams,includex=True ,includey=True ,**kwargs),
+               'currx':curr_mpo((Nx,Ny),hamParams,includex=True ,includey=False,**kwargs),
+               'curry':curr_mpo((Nx,Ny),hamParams,includex=False,includey=True ,**kwargs),
+               'act'  :act_mpo ((Nx,Ny),hamParams,includex=True ,includey=True ,**kwargs),
+               'actx' :act_mpo ((Nx,Ny),hamParams,includex=True ,includey=False,**kwargs),
+               'acty' :act_mpo ((Nx,Ny),hamParams,includex=False,includey=True ,**kwargs)}
+    np.random.seed(0)
+    mps = make_all_mps_right(create_all_mps(N,mbd,1))
+    lmps = make_all_mps_right(create_all_mps(N,mbd,1))
+    # One contraction per observable & norm
+    t0 = time.time()
+    for rep in range(nRep):
+        obs1 = {}
+        for name in mpoDict:
+            obs1[name] = full_contract(mpo=mpoDict[name],mps=mps,lmps=lmps)/full_contract(mps=mps,lmps=lmps)
+    t1 = (time.time()-t0)/nRep
+    # Single sweep
+    t0 = time.time()
+    for rep in range(nRep):
+        obs2 = measure_obs(mpoDict,mps=mps,lmps=lmps)
+    t2 = (time.time()-t0)/nRep
+    maxDiff = max([np.abs(obs1[name]-obs2[name])/np.abs(obs1[name]) for name in mpoDict])
+    print('{}x{}\t{:f}\t{:f}\t\t{:.2f}\t{:e}'.format(Nx,Ny,t1,t2,t1/t2,maxDiff))
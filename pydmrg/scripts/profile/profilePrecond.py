@@ -0,0 +1,39 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare the number of davidson matvecs per site without a
+# preconditioner, with the diagonal & block diagonal preconditioners
+# and with the automatic choice for the open asep at several s
+# Usage: python profilePrecond.py [mbd] [N]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 20
+if len(argv) > 2:
+    N = int(argv[2])
+else:
+    N = 20
+sVec = [-0.5,-0.1,0.,0.1,0.5]
+modes = ['none','diag','block','auto']
+
+print('s\t'+'\t'.join(['{} (matvec/site)\t{} (s)'.format(mode,mode) for mode in modes]))
+for s in sVec:
+    hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,s])
+    mpo = return_mpo(N,hamParams)
+    res = []
+    for mode in modes:
+        np.random.seed(0)
+        t0 = time.time()
+        _,_,_,hist = run_dmrg(mpo,
+                              mbd=mbd,
+                              alg='davidson',
+                              precond=mode,
+                              returnConv=True,
+                              checkpoint=False)
+        t = time.time()-t0
+        res.append('{:f}\t{:f}'.format(np.mean(hist[0]['nMatvec']),t))
+    print('{}\t'.format(s)+'\t'.join(res))
@@ -0,0 +1,86 @@
+import time
+from dmrg import *
+import dmrg
+import tools.diag_tools as diag_tools
+import tools.env_tools as env_tools
+from mpo.asep2D import return_mpo
+from sys import argv
+
+# Compare a scan over the bias of the 2D asep with closed boundaries
+# (no particles enter or leave, with the lattice periodic in the biased
+# y direction so the bias drives a current) at half filling, which
+# conserves particle number, using environments
+# stored as charge blocks to the dense environments with the local
+# problem restricted by a mask (old behavior), followed by the time of
+# single matvecs & environment updates at the center of random mps in
+# the sector for increasing bond dimension
+# Usage: python profileQN.py [mbd] [Nx] [Ny]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    Nx = int(argv[2])
+else:
+    Nx = 4
+if len(argv) > 3:
+    Ny = int(argv[3])
+else:
+    Ny = 4
+N = Nx*Ny
+nPart = N//2
+p = 0.1
+sVec = [-0.5,0.,0.5]
+mbdVec = [16,32,64,128]
+nRepeat = 5
+dmrg.VERBOSE = 0
+diag_tools.VERBOSE = 0
+
+def closed_mpo(s):
+    hamParams = np.array([0.5,0.5,p,1.-p,0.,0.,0.,0.,0.,0.,0.,0.,0.,s])
+    return return_mpo((Nx,Ny),hamParams,periodicy=True)
+
+print('Scan (N = {}, {} particles, mbd = {})'.format(N,nPart,mbd))
+print('s\tE (Dense)\tE (Blocks)\tDense (s)\tBlocks (s)\tRatio')
+for s in sVec:
+    mpo = closed_mpo(s)
+    results = []
+    for blocks in [False,True]:
+        env_tools.QN_BLOCK_ENV = blocks
+        np.random.seed(0)
+        t0 = time.time()
+        E,_,_ = run_dmrg(mpo,mbd=mbd,alg='davidson',nParticles=nPart)
+        results.append([np.real(E),time.time()-t0])
+    print('{}\t{:f}\t{:f}\t{:f}\t{:f}\t{:.1f}'.format(s,results[0][0],results[1][0],
+                                                     results[0][1],results[1][1],results[0][1]/results[1][1]))
+
+print('Center Site (N = {}, {} particles)'.format(N,nPart))
+print('M\tDim\tMatvec Dense (s)\tMatvec Blocks (s)\tRatio\tEnv Dense (s)\tEnv Blocks (s)\tRatio\tMax Diff')
+mpo = closed_mpo(sVec[0])
+site = N//2
+for mbdi in mbdVec:
+    np.random.seed(0)
+    mpsL,qn = setup_all_qn(create_all_mps(N,mbdi,1),nPart)
+    mpsL = make_all_mps_right_qn(mpsL,qn)
+    qnMask = site_mask(qn,site).ravel()
+    x = np.random.rand(np.sum(qnMask))
+    results,Hx = [],[]
+    for blocks in [False,True]:
+        env_tools.QN_BLOCK_ENV = blocks
+        F = calc_env(mpsL[0],mpo,mbdi,gaugeSite=site,qn=qn)
+        Hfun,_ = make_ham_func(mpsL[0],mpo,F,site,qnMask=qnMask)
+        Hx.append(Hfun(x))
+        t0 = time.time()
+        for i in range(nRepeat): Hfun(x)
+        tMatvec = (time.time()-t0)/nRepeat
+        t0 = time.time()
+        for i in range(nRepeat): update_envR(mpsL[0],mpo,F,site,qn=qn)
+        tEnv = (time.time()-t0)/nRepeat
+        results.append([tMatvec,tEnv])
+    maxDiff = np.max(np.abs(Hx[0]-Hx[1]))/np.max(np.abs(Hx[0]))
+    print('{}\t{}\t{:f}\t{:f}\t{:.1f}\t{:f}\t{:f}\t{:.1f}\t{:e}'.format(mbdi,len(x),
+          results[0][0],results[1][0],results[0][0]/results[1][0],
+          results[0][1],results[1][1],results[0][1]/results[1][1],maxDiff))
+env_tools.QN_BLOCK_ENV = True
@@ -0,0 +1,46 @@
+import time
+from dmrg import *
+from mpo.asep import return_mpo
+from sys import argv
+
+# Compare refreshing the environments of an open asep mps for new
+# parameters (only recomputing blocks that depend on changed mpo sites)
+# to recalculating them, for changes of the boundary rates & of s
+# Usage: python profileRefreshEnv.py [mbd] [nRep]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    nRep = int(argv[2])
+else:
+    nRep = 5
+Nvec = [10,20,40,80]
+hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+changes = [('alpha',np.array([0.7,0.5,0.2,0.8,0.8,0.5,-0.5])),
+           ('alpha & beta',np.array([0.7,0.5,0.2,0.8,0.3,0.5,-0.5])),
+           ('s',np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.4]))]
+
+print('N\tChange\tRefresh (s)\tRecalculate (s)\tRatio\tMax Diff')
+for N in Nvec:
+    gaugeSite = int(N/2)+1
+    mpo = return_mpo(N,hamParams)
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)
+    mps = move_gauge(mps[0],0,gaugeSite)
+    env = calc_env(mps,mpo,mbd,gaugeSite=gaugeSite)
+    for name,newParams in changes:
+        mpoNew = return_mpo(N,newParams)
+        envCopies = [copy.deepcopy(env) for i in range(nRep)]
+        t0 = time.time()
+        for i in range(nRep):
+            envNew = refresh_env(mps,mpo,mpoNew,envCopies[i],gaugeSite=gaugeSite)
+        tRefresh = (time.time()-t0)/nRep
+        t0 = time.time()
+        for i in range(nRep):
+            envCalc = calc_env(mps,mpoNew,mbd,gaugeSite=gaugeSite)
+        tCalc = (time.time()-t0)/nRep
+        diff = max([np.max(np.abs(envNew[0][site]-envCalc[0][site])) for site in range(N+1) if site != gaugeSite])
+        print('{}\t{}\t{:f}\t{:f}\t{:f}\t{}'.format(N,name,tRefresh,tCalc,tCalc/tRefresh,diff))
@@ -0,0 +1,35 @@
+import time
+from dmrg import *
+from mpo.asep import density_terms
+from tools.contract import measure_profile,sample_configs
+from sys import argv
+
+# Time drawing configurations directly from |psi|^2 of an mps for chains
+# far too long to enumerate all configurations, and compare the density
+# profile estimated from the samples to the one measured from the mps
+# Usage: python profileSampling.py [mbd] [nSamples]
+
+# Set Calculation Parameters
+if len(argv) > 1:
+    mbd = int(argv[1])
+else:
+    mbd = 32
+if len(argv) > 2:
+    nSamples = int(argv[2])
+else:
+    nSamples = 10000
+Nvec = [25,50,100,200]
+
+print('N\tSampling (s)\tPer Sample (ms)\tMax Density Diff (std. errors)')
+for N in Nvec:
+    np.random.seed(0)
+    mps = make_all_mps_right(create_all_mps(N,mbd,1))
+    t0 = time.time()
+    configs = sample_configs(nSamples,mps=mps,batchSize=1000)
+    t1 = time.time()-t0
+    # Compare sampled & measured density
+    dens = np.real(measure_profile({'dens':density_terms(N)},mps=mps)['dens'])
+    densSample = np.mean(configs,axis=0)
+    err = np.sqrt(np.maximum(dens*(1.-dens),1e-12)/nSamples)
+    maxDiff = np.max(np.abs(densSample-dens)/err)
+    print('{}\t{:f}\t{:f}\t{:.2f}'.format(N,t1,1e3*t1/nSamples,maxDiff))
@@ -28,6 +28,176 @@ class pydmrg_test(unittest.TestCase):
         self.assertTrue(np.isclose(Ed1[1],Ed2[1]),'Davidson Energies do not agree for d=4 ({},{})'.format(Ed1[1],Ed2[1]))
         self.assertTrue(np.isclose(Ed1[2],Ed2[2]),'Davidson Energies do not agree for d=6 ({},{})'.format(Ed1[2],Ed2[2]))
 
+    def test_twoSiteCheck(self):
+        import tests.asep.twoSiteCheck as twoSiteCheck
+        E1,E2 = twoSiteCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'One site ({}) and two site ({}) energies do not agree'.format(E1,E2))
+
+    def test_expansionCheck(self):
+        import tests.asep.expansionCheck as expandCheck
+        E1,E2 = expandCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Energies without ({}) and with ({}) subspace expansion do not agree'.format(E1,E2))
+
+    def test_convergenceCheck(self):
+        import tests.asep.convergenceCheck as convCheck
+        E1,E2,hist1,hist = convCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-6,rtol=1e-6),
+                        'Full sweep ({}) and bond convergence ({}) energies do not agree'.format(E1,E2))
+        self.assertTrue(len(hist['E']) < len(hist1['E']),
+                        'Bond convergence did not stop early ({} & {} half sweeps)'.format(len(hist['E']),len(hist1['E'])))
+        self.assertTrue(np.all(hist['maxTruncErr'] >= 0.))
+        self.assertTrue(len(hist['E']) == len(hist['Espread']))
+
+    def test_fuseCheck(self):
+        import tests.asep.fuseCheck as fuseCheck
+        matDiff,E1,E2 = fuseCheck.run_test()
+        self.assertTrue(np.isclose(matDiff,0.),'Fused MPO differs from MPO list by {}'.format(matDiff))
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'MPO list ({}) and fused MPO ({}) energies do not agree'.format(E1,E2))
+
+    def test_adaptiveTolCheck(self):
+        import tests.asep.adaptiveTolCheck as adaptiveTolCheck
+        E1,E2,hist,histFixed = adaptiveTolCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and adaptive tolerance ({}) energies do not agree'.format(E1,E2))
+        self.assertTrue(len(hist['nMatvec']) == len(hist['eigTol']))
+        self.assertTrue(hist['eigTol'][0] == 1e-4,'First tolerance is {}'.format(hist['eigTol'][0]))
+        self.assertTrue(hist['eigTol'][-1] < hist['eigTol'][0],'Tolerance was not tightened ({})'.format(hist['eigTol']))
+        self.assertTrue(hist['finalEigTol'] == 1e-14,'Final tolerance is {}'.format(hist['finalEigTol']))
+        nMatvec,nMatvecFixed = np.sum(hist['nMatvec']),np.sum(histFixed['nMatvec'])
+        self.assertTrue(nMatvec < nMatvecFixed,'Adaptive ({}) & fixed ({}) tolerance matvecs'.format(nMatvec,nMatvecFixed))
+
+    def test_precondCheck(self):
+        import tests.asep.precondCheck as precondCheck
+        E1,E2,E3 = precondCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and diagonal preconditioned ({}) energies do not agree'.format(E1,E2))
+        self.assertTrue(np.isclose(E1,E3,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and block preconditioned ({}) energies do not agree'.format(E1,E3))
+
+    def test_twoSidedCheck(self):
+        import tests.asep.twoSidedCheck as twoSidedCheck
+        E1,E2,El,curr1,curr2 = twoSidedCheck.run_test()
+        # The truncated states differ by up to ~1e-5 in energy & ~1e-3 in current
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Separate ({}) and two sided ({}) energies do not agree'.format(E1,E2))
+        self.assertTrue(np.isclose(E2,El,atol=1e-4,rtol=1e-4),
+                        'Two sided right ({}) and left ({}) energies do not agree'.format(E2,El))
+        self.assertTrue(np.isclose(curr1,curr2,atol=1e-2,rtol=1e-2),
+                        'Separate ({}) and two sided ({}) currents do not agree'.format(curr1,curr2))
+
+    def test_krylovCheck(self):
+        import tests.asep.krylovCheck as krylovCheck
+        E1,E2,E3 = krylovCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and krylov ({}) energies do not agree'.format(E1,E2))
+        self.assertTrue(np.isclose(E1,E3,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and two site krylov ({}) energies do not agree'.format(E1,E3))
+
+    def test_autoAlgCheck(self):
+        import tests.asep.autoAlgCheck as autoAlgCheck
+        E1,E2 = autoAlgCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Exact ({}) and auto ({}) energies do not agree'.format(E1,E2))
+
+    def test_deflationCheck(self):
+        import tests.asep.deflationCheck as deflationCheck
+        E1,E2,gap1,gap2,resid,Evec,EEvec,gapvec = deflationCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Averaged ({}) and deflation ({}) excited energies do not agree'.format(E1,E2))
+        self.assertTrue(np.isclose(gap1,gap2,atol=1e-4,rtol=1e-4),
+                        'Averaged ({}) and deflation ({}) gaps do not agree'.format(gap1,gap2))
+        self.assertTrue(resid < 1e-4,'Residual of the excited state is {}'.format(resid))
+        self.assertTrue(np.shape(Evec) == np.shape(EEvec) == np.shape(gapvec) == (2,),
+                        'Results for each bond dimension have shapes {}, {} & {}'.format(np.shape(Evec),np.shape(EEvec),np.shape(gapvec)))
+        self.assertTrue(np.isclose(Evec[-1],E2,atol=1e-4,rtol=1e-4),
+                        'Final bond dimension ({}) and single ({}) deflation energies do not agree'.format(Evec[-1],E2))
+
+    def test_continuationCheck(self):
+        import tests.asep.continuationCheck as continuationCheck
+        E1,E2,nSweeps = continuationCheck.run_test()
+        self.assertTrue(np.allclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Continuation ({}) and independent ({}) energies do not agree'.format(E1,E2))
+
+    def test_refreshEnvCheck(self):
+        import tests.asep.refreshEnvCheck as refreshEnvCheck
+        maxDiff,E1,E2,maxDiffQN = refreshEnvCheck.run_test()
+        self.assertTrue(maxDiff < 1e-10,'Refreshed environments differ from recalculated by {}'.format(maxDiff))
+        self.assertTrue(maxDiffQN < 1e-10,'Refreshed block environments differ from recalculated by {}'.format(maxDiffQN))
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Calculated ({}) and refreshed ({}) environment energies do not agree'.format(E1,E2))
+
+    def test_envBufferCheck(self):
+        import tests.asep.envBufferCheck as envBufferCheck
+        maxDiff,E1,E2 = envBufferCheck.run_test()
+        self.assertTrue(maxDiff < 1e-10,'Buffered environments differ from new arrays by {} (relative)'.format(maxDiff))
+        self.assertTrue(np.isclose(E1,E2,atol=1e-8,rtol=1e-8),
+                        'New array ({}) and buffered ({}) environment energies do not agree'.format(E1,E2))
+
+    def test_envStoreCheck(self):
+        import tests.asep.envStoreCheck as envStoreCheck
+        E1,E2,nSpilled,nRead,E3,E4,nSpilledQN = envStoreCheck.run_test()
+        self.assertTrue(nSpilled > 0,'No environment blocks were spilled to disk')
+        self.assertTrue(nRead <= 1,'{} spilled blocks were read back to be overwritten'.format(nRead))
+        self.assertTrue(np.isclose(E1,E2,atol=1e-8,rtol=1e-8),
+                        'In memory ({}) and disk backed ({}) environment energies do not agree'.format(E1,E2))
+        self.assertTrue(nSpilledQN > 0,'No charge block environments were spilled to disk')
+        self.assertTrue(np.isclose(E3,E4,atol=1e-8,rtol=1e-8),
+                        'In memory ({}) and disk backed ({}) block environment energies do not agree'.format(E3,E4))
+
+    def test_measureCheck(self):
+        import tests.asep.measureCheck as measureCheck
+        obs1,obs2 = measureCheck.run_test()
+        for name in obs1:
+            self.assertTrue(np.isclose(obs1[name],obs2[name],atol=1e-8,rtol=1e-8),
+                            'Separate ({}) and single sweep ({}) values of {} do not agree'.format(obs1[name],obs2[name],name))
+
+    def test_localObsCheck(self):
+        import tests.asep.localObsCheck as localObsCheck
+        maxDiff = localObsCheck.run_test()
+        self.assertTrue(maxDiff < 1e-8,'Local observables differ from full contractions by {}'.format(maxDiff))
+
+    def test_corrCheck(self):
+        import tests.asep.corrCheck as corrCheck
+        maxDiff,nWindow = corrCheck.run_test()
+        self.assertTrue(maxDiff < 1e-8,'Correlation matrix differs from full contractions by {}'.format(maxDiff))
+        self.assertTrue(nWindow == 6+2*5+2*4,'{} correlations calculated within the window'.format(nWindow))
+
+    def test_entanglementCheck(self):
+        import tests.asep.entanglementCheck as eeCheck
+        maxDiff,savedDiff = eeCheck.run_test()
+        self.assertTrue(maxDiff < 1e-8,'Schmidt values differ from the state vector by {}'.format(maxDiff))
+        self.assertTrue(savedDiff < 1e-10,'Saved entanglement differs by {}'.format(savedDiff))
+
+    def test_samplingCheck(self):
+        import tests.asep.samplingCheck as samplingCheck
+        probDiff,freqDiff = samplingCheck.run_test()
+        self.assertTrue(probDiff < 1e-8,'Sampled probabilities differ by {}'.format(probDiff))
+        self.assertTrue(freqDiff < 6.,'Sampled frequencies differ by {} standard errors'.format(freqDiff))
+
+    def test_configCheck(self):
+        import tests.asep.configCheck as configCheck
+        maxDiff,L1,L2 = configCheck.run_test()
+        self.assertTrue(maxDiff < 1e-12,'Batched amplitudes differ by {}'.format(maxDiff))
+        self.assertTrue(np.isclose(L1,1.),'L1 normalized amplitudes sum to {}'.format(L1))
+        self.assertTrue(np.isclose(L2,1.),'L2 normalized amplitudes sum to {}'.format(L2))
+
+    def test_qnBlocks(self):
+        import tests.asep.qnBlockCheck as qnBlockCheck
+        envDiff,hamDiff,E1,E2 = qnBlockCheck.run_test()
+        self.assertTrue(envDiff < 1e-12,'Charge block environments differ by {}'.format(envDiff))
+        self.assertTrue(hamDiff < 1e-12,'Charge block Hx differs by {}'.format(hamDiff))
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Sector ED ({}) and DMRG ({}) energies do not agree'.format(E1,E2))
+
+    def test_particleNumber(self):
+        import tests.asep.particleNumberCheck as qnCheck
+        E1,E2 = qnCheck.run_test()
+        self.assertTrue(np.isclose(E1,E2,atol=1e-4,rtol=1e-4),
+                        'Sector ED ({}) and DMRG ({}) energies do not agree'.format(E1,E2))
+
     def test_contract_calc(self):
         print('Running Contraction Calculation Test')
         import tests.asep.contractCheck as contractCheck
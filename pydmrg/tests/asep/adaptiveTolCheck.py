@@ -0,0 +1,32 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that the davidson tolerance starts loose, is tightened to
+# eigTolMin for the final solve & needs fewer matvecs than a fixed tight
+# tolerance, while converging to the exact solver result
+
+def run_test():
+    N = 8
+    mbd = 10
+    # Fixed parameters, so the matvec counts are reproducible
+    hamParams = np.array([0.5,0.5,0.2,0.8,0.8,0.5,-0.5])
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    np.random.seed(0)
+    _,_,_,histFixed = run_dmrg(mpo,
+                               mbd=mbd,
+                               alg='davidson',
+                               nStates=1,
+                               returnConv=True)
+    np.random.seed(0)
+    E2,_,_,hist = run_dmrg(mpo,
+                           mbd=mbd,
+                           alg='davidson',
+                           nStates=1,
+                           adaptiveTol=True,
+                           returnConv=True)
+    return E1,E2,hist[0],histFixed[0]
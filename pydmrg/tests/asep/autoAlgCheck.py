@@ -0,0 +1,27 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that choosing the local solver from each site's
+# dimension (alg='auto') agrees with the exact solver
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='auto',
+                      nStates=1)
+    return E1,E2
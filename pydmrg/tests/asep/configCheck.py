@@ -0,0 +1,38 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from tools.mps_tools import load_mps,contract_configs
+
+# Run a check that the amplitudes of a batch of configurations (with
+# repeats & in random order) agree with contracting each configuration
+# separately, and that both normalizations sum to one
+
+def run_test():
+    N = 6
+    mbd = 8
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    E,_,_ = run_dmrg(mpo,
+                     mbd=mbd,
+                     alg='exact',
+                     fname='saved_states/tests/config')
+    mps,_ = load_mps('saved_states/tests/config_mbd0')
+    M = mps[0]
+    configs = np.random.randint(2,size=(200,N))
+    amp = contract_configs(mps,configs)
+    maxDiff = 0.
+    for i in range(len(configs)):
+        res = np.array([[1]])
+        for site in range(N):
+            res = np.dot(res,M[site][configs[i,site],:,:])
+        maxDiff = max(maxDiff,np.abs(res[0,0]-amp[i]))
+    # Normalized amplitudes of all configurations
+    configs = (np.arange(2**N)[:,None] >> np.arange(N-1,-1,-1)[None,:]) & 1
+    L1 = np.sum(contract_configs('saved_states/tests/config_mbd0',configs,norm='L1'))
+    L2 = np.sum(np.abs(contract_configs('saved_states/tests/config_mbd0',configs,norm='L2'))**2)
+    return maxDiff,L1,L2
@@ -0,0 +1,31 @@
+from continuation import *
+from mpo.asep import return_mpo
+
+# Run a check that a continuation scan over s (warm starting each point
+# from the extrapolated previous states) gives the same energies as
+# independent calculations at each s
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          0.])
+    def mpoFun(s):
+        hamParams[-1] = s
+        return return_mpo(N,hamParams)
+
+    sVec,E1,_,_,nSweeps = run_continuation(mpoFun,-0.1,0.1,
+                                           ds=0.05,
+                                           mbd=mbd,
+                                           alg='exact')
+    E2 = np.zeros(len(sVec),dtype=np.complex_)
+    for i in range(len(sVec)):
+        E2[i],_,_ = run_dmrg(mpoFun(sVec[i]),
+                             mbd=mbd,
+                             alg='exact')
+    return E1,E2,nSweeps
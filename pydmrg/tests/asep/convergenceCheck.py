@@ -0,0 +1,38 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that stopping the sweeps once all bonds are converged
+# gives the same energy as converging full sweeps (from the same initial
+# guess), in fewer half sweeps
+
+def run_test():
+    N = 10
+    mbd = 10
+    # Fixed rates & initial guess, for which the bonds converge part way
+    # through a half sweep
+    np.random.seed(0)
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    np.random.seed(0)
+    E1,_,_,hist1 = run_dmrg(mpo,
+                            mbd=mbd,
+                            tol=1e-8,
+                            alg='exact',
+                            nStates=1,
+                            returnConv=True)
+    np.random.seed(0)
+    E2,_,_,hist = run_dmrg(mpo,
+                           mbd=mbd,
+                           tol=1e-8,
+                           alg='exact',
+                           nStates=1,
+                           midSweepStop=True,
+                           returnConv=True)
+    return E1,E2,hist1[0],hist[0]
@@ -0,0 +1,46 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from mpo.ops import n,Sp,Sm
+from tools.contract import full_contract as contract
+from tools.contract import measure_corr
+
+# Run a check that the density & hopping correlation matrices from
+# transfer matrices carried between sites agree with contracting an mpo
+# for each pair of sites, for the left & right states
+
+def run_test():
+    N = 6
+    mbd = 8
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    E,_,_ = run_dmrg(mpo,
+                     mbd=mbd,
+                     alg='exact',
+                     fname='saved_states/tests/corr',
+                     calcLeftState=True)
+    mps = 'saved_states/tests/corr_mbd0'
+    lmps= 'saved_states/tests/corr_mbd0_left'
+    norm = contract(mps=mps,lmps=lmps)
+    maxDiff = 0.
+    for opA,opB in [(n,n),(Sp,Sm)]:
+        C = measure_corr(opA,opB,mps=mps,lmps=lmps)
+        for i in range(N):
+            for j in range(N):
+                op = [[None]*N]
+                if i == j:
+                    op[0][i] = np.array([[np.dot(opA,opB)]])
+                else:
+                    op[0][i] = np.array([[opA]])
+                    op[0][j] = np.array([[opB]])
+                corr = contract(mpo=op,mps=mps,lmps=lmps)/norm
+                maxDiff = max(maxDiff,np.abs(corr-C[i,j]))
+    # Only pairs within the window are calculated
+    C = measure_corr(n,mps=mps,lmps=lmps,window=2)
+    nWindow = np.sum(~np.isnan(C))
+    return maxDiff,nWindow
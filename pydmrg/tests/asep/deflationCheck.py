@@ -0,0 +1,47 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from tools.mpo_tools import mpo2mat
+from tools.mps_tools import mps2state
+
+# Run a check that finding the first excited state by deflation (as its
+# own mps) gives the same energies & gap as the state averaged
+# calculation at full bond dimension, and that the returned excited
+# state is an eigenvector of the full (non-hermitian) matrix. With a list
+# of bond dimensions the energies, entanglement & gaps are returned for each.
+
+def run_test():
+    N = 8
+    mbd = 16
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,gap1 = run_dmrg(mpo,
+                         mbd=mbd,
+                         alg='exact',
+                         nStates=2,
+                         targetState=1)
+    E2,_,gap2,states = run_dmrg(mpo,
+                                mbd=mbd,
+                                alg='davidson',
+                                nStates=2,
+                                targetState=1,
+                                deflation=True,
+                                returnState=True)
+    # Residual of the excited state
+    psi = mps2state(states[1])
+    psi /= np.linalg.norm(psi)
+    H = mpo2mat(mpo)
+    resid = np.linalg.norm(np.dot(H,psi)-E2*psi)
+    Evec,EEvec,gapvec = run_dmrg(mpo,
+                                 mbd=[8,mbd],
+                                 alg='davidson',
+                                 nStates=2,
+                                 targetState=1,
+                                 deflation=True)
+    return E1,E2,gap1,gap2,resid,Evec,EEvec,gapvec
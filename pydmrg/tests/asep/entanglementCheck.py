@@ -0,0 +1,54 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from tools.mps_tools import load_mps,mps2state
+from tools.aux.process_states import calc_entanglement_spectra
+
+# Run a check that the schmidt values at every bond from a single sweep
+# (& those saved by dmrg, also for a truncated state) agree with decompositions of the full state vector
+
+def run_test():
+    N = 6
+    mbd = 8
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    maxDiff = 0.
+    for nStates in [1,2]:
+        fname = 'saved_states/tests/entanglement'+str(nStates)
+        E,_,_ = run_dmrg(mpo,
+                         mbd=mbd,
+                         alg='exact',
+                         nStates=nStates,
+                         fname=fname)
+        mps,_ = load_mps(fname+'_mbd0')
+        EE,spec = calc_entanglement_spectra(fname+'_mbd0',useSaved=False)
+        for state in range(nStates):
+            psi = mps2state(mps[state])
+            psi /= np.linalg.norm(psi)
+            for bond in range(N-1):
+                S = sla.svdvals(np.reshape(psi,(2**(bond+1),-1)))
+                S = S[:len(spec[state][bond])]
+                maxDiff = max(maxDiff,np.max(np.abs(S-spec[state][bond])))
+                maxDiff = max(maxDiff,np.abs(EE[state,bond]-np.real(calc_entanglement(S)[0])))
+    # Schmidt values saved by dmrg for a truncated state, with and without
+    # expanding the basis
+    N = 10
+    mbd = 4
+    mpo = return_mpo(N,hamParams)
+    savedDiff = 0.
+    for expand in [None,1e-2]:
+        fname = 'saved_states/tests/entanglementSaved'
+        run_dmrg(mpo,
+                 mbd=mbd,
+                 alg='exact',
+                 expand=expand,
+                 fname=fname)
+        EE,_ = calc_entanglement_spectra(fname+'_mbd0')
+        EEsweep,_ = calc_entanglement_spectra(fname+'_mbd0',useSaved=False)
+        savedDiff = max(savedDiff,np.max(np.abs(EE-EEsweep)))
+    return maxDiff,savedDiff
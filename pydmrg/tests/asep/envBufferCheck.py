@@ -0,0 +1,38 @@
+from dmrg import *
+import tools.env_tools as env_tools
+from mpo.asep import return_mpo
+
+# Run a check that writing the environment updates into reused buffers
+# gives the same environments & energy as creating new arrays
+
+def run_test():
+    N = 8
+    mbd = 8
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+    mpo = return_mpo(N,hamParams)
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)[0]
+    mps = [M+1.j*np.random.rand(*M.shape) for M in mps]
+
+    E,env = [],[]
+    for reuse in [False,True]:
+        env_tools.REUSE_ENV_BUFFERS = reuse
+        # Sweep the environments back & forth
+        F = calc_env(mps,mpo,mbd)
+        for site in range(N-1):
+            F = update_envR(mps,mpo,F,site)
+        for site in range(N-1,0,-1):
+            F = update_envL(mps,mpo,F,site)
+        env.append(F)
+        np.random.seed(0)
+        Ei,_,_ = run_dmrg(mpo,mbd=mbd)
+        E.append(Ei)
+    env_tools.REUSE_ENV_BUFFERS = True
+    maxDiff = max([np.max(np.abs(env[0][0][site]-env[1][0][site]))/np.max(np.abs(env[0][0][site])) for site in range(N+1)])
+    return maxDiff,E[0],E[1]
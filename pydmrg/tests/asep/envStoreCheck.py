@@ -0,0 +1,60 @@
+from dmrg import *
+import tools.env_store as env_store
+from mpo.asep import return_mpo
+
+# Run a check that spilling the environments to disk (with a budget small
+# enough that most blocks are spilled) gives the same energy as keeping
+# them in memory, and that recalculating spilled blocks does not read
+# their old values back from disk. The same energy check is made for the
+# charge block environments of the periodic asep in a fixed particle
+# number sector.
+
+def run_test():
+    N = 10
+    mbd = 8
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+    mpo = return_mpo(N,hamParams)
+
+    np.random.seed(0)
+    E1,_,_ = run_dmrg(mpo,mbd=mbd,calcLeftState=True)
+    Nqn = 8
+    mpoqn = return_mpo(Nqn,(0.,0.,np.random.rand(),np.random.rand(),0.,0.,-0.5),periodic=True)
+    np.random.seed(0)
+    E3,_,_ = run_dmrg(mpoqn,mbd=mbd,nParticles=4)
+
+    minSpill = env_store.ENV_MIN_SPILL
+    env_store.ENV_MIN_SPILL = 0
+    env_store.set_env_budget(1000)
+    np.random.seed(0)
+    E2,_,_,env = run_dmrg(mpo,mbd=mbd,calcLeftState=True,returnEnv=True)
+    # Count the blocks currently on disk
+    nSpilled = sum([env_store.spilled_path(list.__getitem__(F,site)) is not None for envi in env for F in envi for site in range(len(F))])
+    np.random.seed(0)
+    E4,_,_,env = run_dmrg(mpoqn,mbd=mbd,nParticles=4,returnEnv=True)
+    nSpilledQN = sum([env_store.spilled_path(list.__getitem__(F,site)) is not None for F in env for site in range(len(F))])
+    # Recalculate the right environment of a random state, counting the
+    # spilled blocks read back (without prefetching)
+    env_store.ENV_PREFETCH = 0
+    M = make_all_mps_right(create_all_mps(N,mbd,1))[0]
+    F = alloc_env(M,mpo,mbd)
+    for site in range(N-1,-1,-1):
+        F = update_envL(M,mpo,F,site)
+    nRead = [0]
+    read_block = env_store.read_block
+    def count_read(path):
+        nRead[0] += 1
+        return read_block(path)
+    env_store.read_block = count_read
+    for site in range(N-1,-1,-1):
+        F = update_envL(M,mpo,F,site)
+    env_store.read_block = read_block
+    env_store.ENV_PREFETCH = 2
+    env_store.set_env_budget(None)
+    env_store.ENV_MIN_SPILL = minSpill
+    return E1,E2,nSpilled,nRead[0],E3,E4,nSpilledQN
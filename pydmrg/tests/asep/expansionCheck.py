@@ -0,0 +1,30 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that one site sweeps with subspace expansion, which grow
+# the bond dimension themselves, give the same energy as without
+
+def run_test():
+    N = 10
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    # Start from a small bond dimension & let it grow up to mbd
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=[2,mbd],
+                      alg='exact',
+                      nStates=1,
+                      expand=1e-4,
+                      fname='saved_states/tests_expand')
+    return E1,E2[-1]
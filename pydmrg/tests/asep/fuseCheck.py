@@ -0,0 +1,31 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that merging the list of mpos for a periodic SEP into a
+# single compressed mpo leaves the hamiltonian & energy unchanged
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams,periodic=True)
+    # Compare the full hamiltonians
+    matDiff = np.max(np.abs(mpo2mat(mpo)-mpo2mat(fuse_mpo(mpo))))
+    # Compare energies
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1,
+                      fuseMPO=True)
+    return matDiff,E1,E2
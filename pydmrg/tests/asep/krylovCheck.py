@@ -0,0 +1,32 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that the thick restart krylov solver (carrying its ritz
+# vectors between sites) agrees with the exact solver
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='krylov',
+                      nStates=1)
+    E3,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='krylov',
+                      nStates=1,
+                      oneSite=False)
+    return E1,E2,E3
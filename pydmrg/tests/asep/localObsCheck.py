@@ -0,0 +1,50 @@
+from dmrg import *
+from mpo.asep import return_mpo,curr_mpo,act_mpo,density_terms,curr_terms,act_terms
+from tools.contract import full_contract as contract
+from tools.contract import measure_profile
+
+# Run a check that the density at each site from a single set of left &
+# right environments agrees with contracting a one site mpo at each site,
+# and that the bond currents & activities sum to the total current &
+# activity, for the right state & the left & right states
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    E,_,_ = run_dmrg(mpo,
+                     mbd=mbd,
+                     alg='exact',
+                     fname='saved_states/tests/localObs',
+                     calcLeftState=True)
+    termDict = {'density':density_terms(N),
+                'curr':curr_terms(N,hamParams),
+                'act':act_terms(N,hamParams)}
+    maxDiff = 0.
+    for lmps in [None,'saved_states/tests/localObs_mbd0_left']:
+        prof = measure_profile(termDict,
+                               mps = 'saved_states/tests/localObs_mbd0',
+                               lmps= lmps)
+        norm = contract(mps = 'saved_states/tests/localObs_mbd0',
+                        lmps= lmps)
+        for site in range(N):
+            op = [[None]*N]
+            op[0][site] = np.array([[[[0.,0.],
+                                      [0.,1.]]]])
+            dens = contract(mpo = op,
+                            mps = 'saved_states/tests/localObs_mbd0',
+                            lmps= lmps)/norm
+            maxDiff = max(maxDiff,np.abs(dens-prof['density'][site]))
+        for name,op in [('curr',curr_mpo(N,hamParams)),('act',act_mpo(N,hamParams))]:
+            tot = contract(mpo = op,
+                           mps = 'saved_states/tests/localObs_mbd0',
+                           lmps= lmps)/norm
+            maxDiff = max(maxDiff,np.abs(tot-np.sum(prof[name])))
+    return maxDiff
@@ -0,0 +1,42 @@
+from dmrg import *
+from mpo.asep import return_mpo,curr_mpo,act_mpo
+from tools.contract import full_contract as contract
+from tools.contract import measure_obs
+
+# Run a check that measuring the energy, current & activity of a left &
+# right state in a single sweep gives the same values as separate
+# contractions, each divided by the norm
+
+def run_test():
+    N = 10
+    mbd = 10
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    E,_,_ = run_dmrg(mpo,
+                     mbd=mbd,
+                     alg='exact',
+                     fname='saved_states/tests/measure',
+                     calcLeftState=True)
+    mpoDict = {'E':mpo,
+               'curr':curr_mpo(N,hamParams),
+               'currS':curr_mpo(N,hamParams,singleBond=True),
+               'act':act_mpo(N,hamParams)}
+    # Separate contractions
+    obs1 = {}
+    for name in mpoDict:
+        obs1[name] = contract(mpo = mpoDict[name],
+                              mps = 'saved_states/tests/measure_mbd0',
+                              lmps= 'saved_states/tests/measure_mbd0_left')
+        obs1[name] /= contract(mps = 'saved_states/tests/measure_mbd0',
+                               lmps= 'saved_states/tests/measure_mbd0_left')
+    # Single sweep
+    obs2 = measure_obs(mpoDict,
+                       mps = 'saved_states/tests/measure_mbd0',
+                       lmps= 'saved_states/tests/measure_mbd0_left')
+    return obs1,obs2
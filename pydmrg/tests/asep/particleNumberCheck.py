@@ -0,0 +1,29 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from tools.mpo_tools import mpo2mat
+
+# Run a check that restricting the calculation to a fixed number of
+# particles on a periodic (particle conserving) SEP gives the
+# ground state of that sector from exact diagonalization
+
+def run_test():
+    N = 8
+    nPart = 3
+    mbd = [4,16]
+    hamParams = (0.,0.,np.random.rand(),np.random.rand(),0.,0.,np.random.rand()-0.5)
+    mpo = return_mpo(N,hamParams,periodic=True)
+
+    # Exact diagonalization in the sector
+    H = mpo2mat(mpo)
+    occ = np.array([bin(i).count('1') for i in range(2**N)])
+    inds = np.where(occ == nPart)[0]
+    e = np.linalg.eigvals(H[np.ix_(inds,inds)])
+    E_ed = e[np.argmax(e.real)]
+
+    # DMRG in the sector
+    E_dmrg,_,_ = run_dmrg(mpo,
+                          mbd=mbd,
+                          alg='exact',
+                          nStates=1,
+                          nParticles=nPart)
+    return E_ed,E_dmrg[-1]
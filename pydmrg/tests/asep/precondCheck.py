@@ -0,0 +1,34 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that the davidson solver with the diagonal & block
+# diagonal preconditioners agrees with the exact solver
+
+def run_test():
+    N = 8
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1)
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='davidson',
+                      nStates=1,
+                      precond='diag')
+    E3,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='davidson',
+                      nStates=1,
+                      oneSite=False,
+                      precond='block')
+    return E1,E2,E3
@@ -0,0 +1,54 @@
+from dmrg import *
+import tools.env_tools as env_tools
+from mpo.asep2D import return_mpo
+from tools.mpo_tools import mpo2mat
+
+# Run a check that the charge block environments & effective hamiltonian
+# (one & two site, and its adjoint) of the closed 2D asep (periodic in y)
+# agree with the dense ones restricted to the sector, and that a dmrg
+# calculation using them gives the ground state of the sector from exact
+# diagonalization
+
+def run_test():
+    N = [2,3]
+    nPart = 3
+    mbd = 8
+    hamParams = np.array([np.random.rand(),np.random.rand(),np.random.rand(),np.random.rand(),
+                          0.,0.,0.,0.,0.,0.,0.,0.,
+                          np.random.rand()-0.5,np.random.rand()-0.5])
+    mpo = return_mpo(N,hamParams,periodicy=True)
+    nSite = len(mpo[0])
+    mpsL,qn = setup_all_qn(create_all_mps(nSite,mbd,1),nPart)
+    mpsL = make_all_mps_right_qn(mpsL,qn)
+    envDiff,hamDiff = 0.,0.
+    for site in [0,nSite//2]:
+        env_tools.QN_BLOCK_ENV = False
+        F = calc_env(mpsL[0],mpo,mbd,gaugeSite=site,qn=qn)
+        env_tools.QN_BLOCK_ENV = True
+        Fb = calc_env(mpsL[0],mpo,mbd,gaugeSite=site,qn=qn)
+        for mpoInd in range(len(mpo)):
+            for bond in range(nSite+1):
+                envDiff = max(envDiff,np.max(np.abs(env_dense(Fb[mpoInd][bond])-F[mpoInd][bond])))
+        for oneSite in [True,False]:
+            if oneSite:
+                qnMask = site_mask(qn,site).ravel()
+            else:
+                qnMask = two_site_mask(qn,site).ravel()
+            x = np.random.rand(np.sum(qnMask))+1.j*np.random.rand(np.sum(qnMask))
+            for adjoint in [False,True]:
+                Hfun,_ = make_ham_func(mpsL[0],mpo,F,site,oneSite=oneSite,qnMask=qnMask,adjoint=adjoint)
+                Hfunb,_ = make_ham_func(mpsL[0],mpo,Fb,site,oneSite=oneSite,qnMask=qnMask,adjoint=adjoint)
+                Hx = Hfun(x)
+                hamDiff = max(hamDiff,np.max(np.abs(Hfunb(x)-Hx))/np.max(np.abs(Hx)))
+    # Exact diagonalization in the sector
+    H = mpo2mat(mpo)
+    occ = np.array([bin(i).count('1') for i in range(2**nSite)])
+    inds = np.where(occ == nPart)[0]
+    e = np.linalg.eigvals(H[np.ix_(inds,inds)])
+    E_ed = e[np.argmax(e.real)]
+    # DMRG in the sector
+    E_dmrg,_,_ = run_dmrg(mpo,
+                          mbd=[4,16],
+                          alg='davidson',
+                          nParticles=nPart)
+    return envDiff,hamDiff,E_ed,E_dmrg[-1]
@@ -0,0 +1,68 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that refreshing the environments for new boundary rates
+# (or a new s) gives the same environments as recalculating them, and
+# the same energy when used to start a calculation. The same is checked
+# for the charge block environments of the periodic asep in a fixed
+# particle number sector.
+
+def run_test():
+    N = 10
+    mbd = 8
+    gaugeSite = int(N/2)+1
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    mps = create_all_mps(N,mbd,1)
+    mps = make_all_mps_right(mps)
+    mps = move_gauge(mps[0],0,gaugeSite)
+    env = calc_env(mps,mpo,mbd,gaugeSite=gaugeSite)
+
+    # Change the boundary rates, then s
+    maxDiff = 0.
+    for inds in [[0,4],[6]]:
+        newParams = hamParams.copy()
+        newParams[inds] += 0.1
+        mpoNew = return_mpo(N,newParams)
+        env1 = refresh_env(mps,mpo,mpoNew,copy.deepcopy(env),gaugeSite=gaugeSite)
+        env2 = calc_env(mps,mpoNew,mbd,gaugeSite=gaugeSite)
+        for site in range(N+1):
+            if site != gaugeSite:
+                maxDiff = max(maxDiff,np.max(np.abs(env1[0][site]-env2[0][site])))
+
+    # Use refreshed environments to start a calculation
+    E1,_,_ = run_dmrg(mpoNew,mbd=mbd,alg='exact')
+    E2,_,_ = run_dmrg(mpoNew,
+                      initGuess=[mps],
+                      initEnv=env1,
+                      guessGaugeSite=gaugeSite,
+                      mbd=mbd,
+                      alg='exact')
+
+    # Charge block environments of the periodic asep
+    N = 8
+    nPart = 4
+    hamParams = np.array([0.,0.,np.random.rand(),np.random.rand(),0.,0.,-0.5])
+    mpo = return_mpo(N,hamParams,periodic=True)
+    mpsL,qn = setup_all_qn(create_all_mps(N,mbd,1),nPart)
+    mpsL = make_all_mps_right_qn(mpsL,qn)
+    env = calc_env(mpsL[0],mpo,mbd,gaugeSite=gaugeSite,qn=qn)
+    maxDiffQN = 0.
+    for inds in [[2],[6]]:
+        newParams = hamParams.copy()
+        newParams[inds] += 0.1
+        mpoNew = return_mpo(N,newParams,periodic=True)
+        env1 = refresh_env(mpsL[0],mpo,mpoNew,copy.deepcopy(env),gaugeSite=gaugeSite)
+        env2 = calc_env(mpsL[0],mpoNew,mbd,gaugeSite=gaugeSite,qn=qn)
+        for mpoInd in range(len(mpoNew)):
+            for site in range(N+1):
+                if site != gaugeSite:
+                    maxDiffQN = max(maxDiffQN,np.max(np.abs(env_dense(env1[mpoInd][site])-
+                                                            env_dense(env2[mpoInd][site]))))
+    return maxDiff,E1,E2,maxDiffQN
@@ -0,0 +1,42 @@
+from dmrg import *
+from mpo.asep import return_mpo
+from tools.mps_tools import load_mps,mps2state
+from tools.contract import sample_configs
+
+# Run a check that configurations sampled from the right state (|psi|^2)
+# and from the left & right states (psi_L*psi_R) are drawn with the
+# probabilities found from the full state vectors
+
+def run_test():
+    N = 6
+    mbd = 8
+    nSamples = 100000
+    hamParams = np.array([np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          np.random.rand(),
+                          -0.5])
+    mpo = return_mpo(N,hamParams)
+    E,_,_ = run_dmrg(mpo,
+                     mbd=mbd,
+                     alg='exact',
+                     fname='saved_states/tests/sampling',
+                     calcLeftState=True)
+    mps = 'saved_states/tests/sampling_mbd0'
+    lmps= 'saved_states/tests/sampling_mbd0_left'
+    psi = mps2state(load_mps(mps)[0][0])
+    lpsi = mps2state(load_mps(lmps)[0][0])
+    probDiff,freqDiff = 0.,0.
+    for P,left in [(np.abs(psi)**2,None),(np.real(lpsi*psi),lmps)]:
+        P /= np.sum(P)
+        configs,prob = sample_configs(nSamples,mps=mps,lmps=left,batchSize=30000,returnProb=True)
+        inds = np.dot(configs,2**np.arange(N-1,-1,-1))
+        probDiff = max(probDiff,np.max(np.abs(prob-P[inds])))
+        # Difference of the frequencies in units of their standard errors
+        # (bounded below for rare configurations)
+        freq = np.bincount(inds,minlength=2**N)/nSamples
+        err = np.sqrt(np.maximum(P,10./nSamples)/nSamples)
+        freqDiff = max(freqDiff,np.max(np.abs(freq-P)/err))
+    return probDiff,freqDiff
@@ -0,0 +1,55 @@
+from dmrg import *
+from mpo.asep import return_mpo as return_mpo_asep
+from mpo.asep import curr_mpo as return_curr_mpo_asep
+from tools.contract import full_contract as contract
+
+# Run a check that the current from the left & right states of a two
+# sided calculation agrees with separately calculated left & right states,
+# and that the energy of its left state agrees with that of its right state.
+# The bond dimension truncates the states (to 8 of up to 32), and the
+# shared basis of the two sided calculation is truncated differently from
+# the separate ones, so these only agree to the size of the truncation.
+
+def run_test():
+    N = 10
+    mbd = 8
+    hamParams = np.array([np.random.rand(),
+                         np.random.rand(),
+                         np.random.rand(),
+                         np.random.rand(),
+                         np.random.rand(),
+                         np.random.rand(),
+                         np.random.rand()])
+
+    mpo = return_mpo_asep(N,hamParams)
+    curr_mpo = return_curr_mpo_asep(N,hamParams)
+    # Separate left state calculation
+    E1,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1,
+                      fname='saved_states/tests_leftState',
+                      calcLeftState=True)
+    curr1 = contract(mpo = curr_mpo,
+                     mps = 'saved_states/tests_leftState_mbd0',
+                     lmps= 'saved_states/tests_leftState_mbd0_left')
+    curr1 /= contract(mps = 'saved_states/tests_leftState_mbd0',
+                      lmps= 'saved_states/tests_leftState_mbd0_left')
+    # Two sided calculation
+    E2,_,_ = run_dmrg(mpo,
+                      mbd=mbd,
+                      alg='exact',
+                      nStates=1,
+                      fname='saved_states/tests_twoSided',
+                      twoSided=True)
+    curr2 = contract(mpo = curr_mpo,
+                     mps = 'saved_states/tests_twoSided_mbd0',
+                     lmps= 'saved_states/tests_twoSided_mbd0_left')
+    curr2 /= contract(mps = 'saved_states/tests_twoSided_mbd0',
+                      lmps= 'saved_states/tests_twoSided_mbd0_left')
+    # Energy of the left state (a left eigenvector of H, so its rayleigh
+    # quotient is the right state's energy)
+    El = contract(mpo = mpo,
+                  mps = 'saved_states/tests_twoSided_mbd0_left')
+    El /= contract(mps = 'saved_states/tests_twoSided_mbd0_left')
+    return E1,E2,El,curr1,curr2
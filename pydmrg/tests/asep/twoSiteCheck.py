@@ -0,0 +1,30 @@
+from dmrg import *
+from mpo.asep import return_mpo
+
+# Run a check that two site sweeps, which grow the bond dimension
+# themselves, give the same energy as one site sweeps
+
+def run_test():
+    N = 10
+    mbd = 10
+    hamParams = (np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand(),
+                 np.random.rand())
+
+    mpo = return_mpo(N,hamParams)
+    E_oneSite,_,_ = run_dmrg(mpo,
+                             mbd=mbd,
+                             alg='exact',
+                             nStates=1)
+    # Start from a small bond dimension & let it grow up to mbd
+    E_twoSite,_,_ = run_dmrg(mpo,
+                             mbd=[2,mbd],
+                             alg='exact',
+                             nStates=1,
+                             oneSite=False,
+                             fname='saved_states/tests_twoSite')
+    return E_oneSite,E_twoSite[-1]
@@ -1,49 +1,53 @@
 import numpy as np
 from tools.mps_tools import *
 from tools.contract import full_contract as contract
+from tools.contract import measure_profile
 
 def calc_entanglement_all(mps,mpo=None,orth=True):
-    # Load matrix product states
+    # Entanglement entropy at every bond of all states (the mpo is no
+    # longer needed)
+    EE,_ = calc_entanglement_spectra(mps,orth=orth)
+    return EE
+
+def calc_entanglement_spectra(mps,orth=False,gSite=None,useSaved=True):
+    # Schmidt values (spec[state][bond]) & entanglement entropy
+    # (EE[state,bond]) at every bond of all states. Each state is put in
+    # canonical form once, giving all bonds in a single sweep, unless the
+    # schmidt values of the first state were saved by run_dmrg (and the
+    # states are not orthonormalized, which changes them)
+    fname = None
     if isinstance(mps,str):
+        fname = mps
         mps,gSite = load_mps(mps)
-    N = len(mps[0])
     nStates = len(mps)
-    # Orthonormalize states if desired
-    if orth: 
-        mpsUse = orthonormalize_states(mps,mpo=mpo,gSite=gSite-1)
-    else:
-        mpsUse = mps
-    # Calculate Entanglement Entropy
-    EE = np.zeros((nStates,N-1))
+    # Orthonormalize states if desired (without changing the given mps)
+    if orth:
+        mps = orthonormalize_states([list(M) for M in mps],gSite=gSite)
+    saved = None
+    if useSaved and (not orth) and (fname is not None):
+        saved = load_spec(fname)
+        if (saved is not None) and any([S is None for S in saved]): saved = None
+    # Calculate Schmidt Values & Entanglement Entropy
+    spec = []
     for state in range(nStates):
-        for site in range(gSite-1,N-1):
-            mpstmp,EEtmp = move_gauge_right(mps[state],site,returnEE=True)
-            EE[state,site] = EEtmp
-            mps[state] = mpstmp
-        for site in range(N-1,0,-1):
-            mpstmp,EEtmp = move_gauge_left(mps[state],site,returnEE=True)
-            EE[state,site-1] = EEtmp
-            mps[state] = mpstmp
-    return EE
+        if (state == 0) and (saved is not None):
+            spec.append(saved)
+        else:
+            spec.append(mps_spectra(mps[state]))
+    EE = np.array([[np.real(calc_entanglement(S.copy())[0]) for S in specState] for specState in spec])
+    return EE,spec
 
 def calc_density_all(mps,lmps,orth=True,state=0):
     # Load matrix product states
+    gSite,glSite = None,None
     if isinstance(mps,str):
         mps,gSite = load_mps(mps)
     if isinstance(lmps,str):
         lmps,glSite = load_mps(lmps)
     N = len(mps[0])
-    nStates = len(mps)
-    # Orthonormalize first two states if needed
-    if orth:
-        mps = orthonormalize_states(mps,gSite=gSite)
-        lmps= orthonormalize_states(lmps,gSite=glSite)
-    # Calculate Density
-    density = np.zeros(N)
-    for site in range(0,N):
-        # Create mpo for density at site 
-        mpo = [[None]*N]
-        mpo[0][site] = np.array([[[[0.,0.], 
-                              [0.,1.]]]])
-        density[site] = contract(mps=mps,lmps=lmps,mpo=mpo,state=state)/contract(mps=mps,lmps=lmps,state=state)
-    return density
+    # Calculate Density (at all sites from one set of environments)
+    ops = [{site:np.array([[0.,0.],
+                           [0.,1.]])} for site in range(N)]
+    density = measure_profile({'density':ops},mps=mps,lmps=lmps,state=state,
+                              orth=orth,gSite=gSite,glSite=glSite)['density']
+    return np.real(density)
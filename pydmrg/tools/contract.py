@@ -1,8 +1,12 @@
 import numpy as np
 from tools.mps_tools import *
 from tools.env_tools import *
+from tools.mpo_tools import mpo_sum,mpo_stack,compress_mpo
+from tools.einsum_tools import einsum_cached
 
-def full_contract(mpo=None,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None):
+def load_contract_states(mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None):
+    # Return the right & left states to contract (as full_contract) and
+    # the max bond dimension of the right states
     # Load matrix product states
     if isinstance(mps,str):
         mps,gSite = load_mps(mps)
@@ -17,8 +21,6 @@ def full_contract(mpo=None,mps=None,lmps=None,state=None,lstate=None,orth=False,
     if orth:
         mps = orthonormalize_states(mps,gSite=gSite)
         lmps= orthonormalize_states(lmps,gSite=glSite)
-    # Figure out size of mps
-    N = nSites(mps)
     mbd = maxBondDim(mps)
     # Extract lowest state from mps
     if (state is None) and (lstate is None):
@@ -27,13 +29,17 @@ def full_contract(mpo=None,mps=None,lmps=None,state=None,lstate=None,orth=False,
         state = lstate
     elif lstate is None:
         lstate = state
-    lmps_ss = lmps[lstate]
-    mps_ss = mps[state]
+    return mps[state],lmps[lstate],mbd
+
+def full_contract(mpo=None,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None):
+    mps_ss,lmps_ss,mbd = load_contract_states(mps=mps,lmps=lmps,state=state,lstate=lstate,
+                                              orth=orth,gSite=gSite,glSite=glSite)
+    N = len(mps_ss)
     # Make empty mpo if none is provided
     if mpo is None:
         mpo = [[None]*N]
     # Create empty environment
-    env = alloc_env(mps_ss,mpo,mbd)
+    env = alloc_env(mps_ss,mpo,mbd,Ml=lmps_ss)
     # Calculate Environment From Right
     for site in range(int(N)-1,-1,-1):
         env = update_envL(mps_ss,mpo,env,site,Ml=lmps_ss)
@@ -42,3 +48,171 @@ def full_contract(mpo=None,mps=None,lmps=None,state=None,lstate=None,orth=False,
     for j in range(Nenv):
         result += env[j][0][0,0,0]
     return result
+
+def measure_obs(mpoDict,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None,
+                returnNorm=False,tol=1e-12,d=2):
+    # Expectation values <lmps|O|mps>/<lmps|mps> of all mpos in mpoDict
+    # (each a list of mpos, as for full_contract) from a single sweep.
+    # The mpos (and the identity, for the norm) are stacked into one mpo
+    # and compressed, so the transfer matrices they share (i.e. the
+    # identity strings & identical partial terms) are only contracted once.
+    mps_ss,lmps_ss,mbd = load_contract_states(mps=mps,lmps=lmps,state=state,lstate=lstate,
+                                              orth=orth,gSite=gSite,glSite=glSite)
+    N = len(mps_ss)
+    # Stack the identity & all mpos
+    names = list(mpoDict.keys())
+    mpoL = [[None]*N]
+    for name in names:
+        mpoL.append(mpo_sum(mpoDict[name],d=d))
+    rows = np.cumsum([0]+[1 if op[0] is None else op[0].shape[0] for op in mpoL])
+    mpo = [compress_mpo(mpo_stack(mpoL,d=d),tol=tol)]
+    # Contract from the right
+    env = alloc_env(mps_ss,mpo,mbd,Ml=lmps_ss)
+    for site in range(int(N)-1,-1,-1):
+        env = update_envL(mps_ss,mpo,env,site,Ml=lmps_ss)
+    vals = env[0][0][0,:,0]
+    norm = np.sum(vals[rows[0]:rows[1]])
+    obs = {}
+    for ind,name in enumerate(names):
+        obs[name] = np.sum(vals[rows[ind+1]:rows[ind+2]])/norm
+    if returnNorm:
+        return obs,norm
+    return obs
+
+def measure_profile(termDict,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None,
+                    returnNorm=False):
+    # Local expectation values <lmps|O|mps>/<lmps|mps> of each term in the
+    # lists of termDict (returned as arrays). A term is a dict {site:op} of
+    # one site operators (multiplied) or a list of these (summed), such as
+    # the two products of a bond current. The overlap environments from the
+    # left & right are calculated once, so each term only requires the
+    # transfer matrices of the sites it spans.
+    mps_ss,lmps_ss,mbd = load_contract_states(mps=mps,lmps=lmps,state=state,lstate=lstate,
+                                              orth=orth,gSite=gSite,glSite=glSite)
+    N = len(mps_ss)
+    envL,envR = overlap_envs(mps_ss,lmps_ss,mbd)
+    norm = envL[0][N][0,0,0]
+    # Contract each term
+    obs = {}
+    for name in termDict:
+        vals = []
+        for term in termDict[name]:
+            if isinstance(term,dict): term = [term]
+            vals.append(sum([contract_product(mps_ss,lmps_ss,envL,envR,prod) for prod in term]))
+        obs[name] = np.array(vals)/norm
+    if returnNorm:
+        return obs,norm
+    return obs
+
+def overlap_envs(M,Ml,mbd):
+    # Environments of <Ml|M> of all sites to the left (envL[0][site]) &
+    # the right (envR[0][site+1]) of each site
+    N = len(M)
+    mpo = [[None]*N]
+    envL = alloc_env(M,mpo,mbd,Ml=Ml)
+    for site in range(N):
+        envL = update_envR(M,mpo,envL,site,Ml=Ml)
+    envR = alloc_env(M,mpo,mbd,Ml=Ml)
+    for site in range(int(N)-1,-1,-1):
+        envR = update_envL(M,mpo,envR,site,Ml=Ml)
+    return envL,envR
+
+def contract_product(M,Ml,envL,envR,ops):
+    # <Ml|prod(ops)|M> from the environments of measure_profile
+    sites = sorted(ops.keys())
+    X = envL[0][sites[0]][:,0,:]
+    for site in range(sites[0],sites[-1]+1):
+        if site in ops:
+            X = einsum_cached('jp,ijk,in,npq->kq',X,Ml[site],ops[site],M[site])
+        else:
+            X = einsum_cached('jp,ijk,ipq->kq',X,Ml[site],M[site])
+    return np.sum(X*envR[0][sites[-1]+1][:,0,:])
+
+def measure_corr(opA,opB=None,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None,
+                 window=None,connected=False):
+    # Correlation matrix C[i,j] = <lmps|A_i B_j|mps>/<lmps|mps> of two one
+    # site operators (B = A if not given) for all pairs of sites, or only
+    # those with |i-j| <= window (the rest are nan). The transfer matrix
+    # opened by the operator at each site is carried to all sites on its
+    # right (O(N^2 D^3)), each closed with a precalculated right block.
+    # If connected, <A_i><B_j> is subtracted.
+    mps_ss,lmps_ss,mbd = load_contract_states(mps=mps,lmps=lmps,state=state,lstate=lstate,
+                                              orth=orth,gSite=gSite,glSite=glSite)
+    if opB is None: opB = opA
+    N = len(mps_ss)
+    if window is None: window = N-1
+    M,Ml = mps_ss,lmps_ss
+    envL,envR = overlap_envs(M,Ml,mbd)
+    norm = envL[0][N][0,0,0]
+    C = np.full((N,N),np.nan,dtype=np.result_type(complex,opA,opB))
+    # Same site
+    for site in range(N):
+        C[site,site] = contract_product(M,Ml,envL,envR,{site:np.dot(opA,opB)})
+    # i < j (A on the left) & i > j (B on the left)
+    for first,second,transpose in [(opA,opB,False),(opB,opA,True)]:
+        # Right blocks closed by the second operator
+        R = [einsum_cached('ijk,in,npq,kq->jp',Ml[site],second,M[site],envR[0][site+1][:,0,:]) for site in range(N)]
+        for i in range(N-1):
+            X = einsum_cached('jp,ijk,in,npq->kq',envL[0][i][:,0,:],Ml[i],first,M[i])
+            jmax = min(N-1,i+window)
+            for j in range(i+1,jmax+1):
+                if transpose:
+                    C[j,i] = np.sum(X*R[j])
+                else:
+                    C[i,j] = np.sum(X*R[j])
+                if j < jmax: X = einsum_cached('jp,ijk,ipq->kq',X,Ml[j],M[j])
+    C /= norm
+    if connected:
+        profA = np.array([contract_product(M,Ml,envL,envR,{site:opA}) for site in range(N)])/norm
+        profB = np.array([contract_product(M,Ml,envL,envR,{site:opB}) for site in range(N)])/norm
+        C -= np.outer(profA,profB)
+    return C
+
+def sample_configs(nSamples,mps=None,lmps=None,state=None,lstate=None,orth=False,gSite=None,glSite=None,
+                   batchSize=None,returnProb=False):
+    # Draw independent configurations (nSamples x N array of local states)
+    # from the weights <lmps|c><c|mps> normalized by <lmps|mps> (|psi|^2 if
+    # no left state is given, these must be real & non-negative). The
+    # sites are drawn in turn from the conditional probabilities, given by
+    # the sampled left part of each configuration, its possible next
+    # states & the right overlap block, so a sample costs O(N D^2).
+    # Samples are drawn batchSize at a time (all at once if None).
+    # If returnProb, the probability of each configuration is also returned.
+    mps_ss,lmps_ss,mbd = load_contract_states(mps=mps,lmps=lmps,state=state,lstate=lstate,
+                                              orth=orth,gSite=gSite,glSite=glSite)
+    N = len(mps_ss)
+    M,Ml = mps_ss,lmps_ss
+    # Overlap blocks of all sites to the right of each site
+    mpo = [[None]*N]
+    envR = alloc_env(M,mpo,mbd,Ml=Ml)
+    for site in range(int(N)-1,-1,-1):
+        envR = update_envL(M,mpo,envR,site,Ml=Ml)
+    R = [envR[0][site][:,0,:] for site in range(N+1)]
+    if batchSize is None: batchSize = nSamples
+    configs = np.zeros((nSamples,N),dtype=int)
+    prob = np.ones(nSamples)
+    for start in range(0,nSamples,batchSize):
+        nBatch = min(batchSize,nSamples-start)
+        inds = np.arange(nBatch)
+        # Left parts of the ket & bra for each sample, scaled so that the
+        # weights of the next site sum to one
+        vec = np.ones((nBatch,1))/R[0][0,0]
+        lvec = np.ones((nBatch,1))
+        for site in range(N):
+            vecNext = einsum_cached('sa,iab->sib',vec,M[site])
+            lvecNext = einsum_cached('sa,iab->sib',lvec,Ml[site])
+            w = einsum_cached('sib,bc,sic->si',lvecNext,R[site+1],vecNext)
+            p = np.real(w)
+            assert(np.all(p > -1e-10))
+            p = np.maximum(p,0.)
+            p /= np.sum(p,axis=1)[:,None]
+            # Draw the state of the site
+            cdf = np.cumsum(p,axis=1)
+            sigma = np.sum(cdf[:,:-1] < np.random.rand(nBatch)[:,None],axis=1)
+            configs[start+inds,site] = sigma
+            prob[start+inds] *= p[inds,sigma]
+            vec = vecNext[inds,sigma,:]/w[inds,sigma][:,None]
+            lvec = lvecNext[inds,sigma,:]
+    if returnProb:
+        return configs,prob
+    return configs
@@ -5,25 +5,170 @@ from pyscf.lib import eig as davidson
 from scipy.sparse.linalg import eigs as arnoldi
 from scipy.sparse.linalg import LinearOperator
 from tools.mps_tools import *
+from tools.qn_tools import *
+from tools.einsum_tools import einsum_cached
 import warnings
 import copy
+import json
+import os
 
 VERBOSE = 2
 
+# Smallest denominator allowed in the preconditioners
+PRECOND_TOL = 1e-8
+# Preconditioners tried when usePrecond='auto', the number of solves
+# used to compare them & how often the others are tried again
+PRECOND_MODES = ['none','diag','block']
+PRECOND_TRIALS = 3
+PRECOND_RETRY = 50
+# Matvecs & solves done with each preconditioner, [nMatvec,nSolve]
+PRECOND_STATS = {}
+# Largest subspace of the krylov solver before a thick restart &
+# number of ritz vectors carried to the next site
+KRYLOV_DIM = 20
+KRYLOV_RECYCLE = 4
+# Local solver used by alg='auto' for each number of states: dense for
+# dimensions up to denseDim, otherwise iterAlg. Host specific values are
+# written by scripts/profile/calibrateAlg.py to AUTO_ALG_FILE (in the user
+# cache directory, or set by PYDMRG_AUTO_ALG), which is loaded the first
+# time alg='auto' is used unless the values were already set.
+AUTO_ALG = {'nStates':[1,2,4],
+            'denseDim':[64,64,128],
+            'iterAlg':['davidson','davidson','davidson']}
+AUTO_ALG_FILE = os.environ.get('PYDMRG_AUTO_ALG',
+                               os.path.join(os.environ.get('XDG_CACHE_HOME',os.path.join(os.path.expanduser('~'),'.cache')),
+                                            'pydmrg','auto_alg.json'))
+AUTO_ALG_SET = False
+
 def calc_diag(M,W,F,site):
+    # Diagonal of the one site effective hamiltonian
     (n1,n2,n3) = M[site].shape
-    diag = np.zeros((n1*n2*n3),dtype=np.complex_)
+    diag = np.zeros((n1,n2,n3),dtype=np.complex_)
     for mpoInd in range(len(W)):
-        if W[mpoInd][site] is None:
-            mpo_diag = einsum('abnn->anb',np.array([[np.eye(2)]]))
+        Ws = W[mpoInd][site]
+        if Ws is None: Ws = np.array([[np.eye(n1)]])
+        diag += np.einsum('pn,njoo,ij->opi',env_diag(F[mpoInd][site]),Ws,env_diag(F[mpoInd][site+1]))
+    return diag.ravel()
+
+def calc_block_diag(M,W,F,site):
+    # Blocks of the one site effective hamiltonian coupling the physical
+    # index at fixed left & right indices, shape (left,right,phys,phys)
+    (n1,n2,n3) = M[site].shape
+    blocks = np.zeros((n2,n3,n1,n1),dtype=np.complex_)
+    for mpoInd in range(len(W)):
+        Ws = W[mpoInd][site]
+        if Ws is None: Ws = np.array([[np.eye(n1)]])
+        blocks += np.einsum('pn,njol,ij->piol',env_diag(F[mpoInd][site]),Ws,env_diag(F[mpoInd][site+1]))
+    return np.reshape(blocks,(n2*n3,n1,n1))
+
+def calc_diag_twoSite(M,W,F,site):
+    # Diagonal of the two site effective hamiltonian
+    envR = twoSite_env_ind(M,F,site)
+    n1 = M[site].shape[0]
+    n2 = M[site+1].shape[0]
+    (n3,_,_) = env_shape(F[0][site])
+    (n4,_,_) = env_shape(F[0][envR])
+    diag = np.zeros((n1,n2,n3,n4),dtype=np.complex_)
+    for mpoInd in range(len(W)):
+        W1,W2 = W[mpoInd][site],W[mpoInd][site+1]
+        if W1 is None: W1 = np.array([[np.eye(n1)]])
+        if W2 is None: W2 = np.array([[np.eye(n2)]])
+        diag += np.einsum('ij,jlmm,lopp,ro->mpir',env_diag(F[mpoInd][site]),W1,W2,env_diag(F[mpoInd][envR]))
+    return diag.ravel()
+
+def calc_block_diag_twoSite(M,W,F,site):
+    # Blocks of the two site effective hamiltonian coupling both physical
+    # indices at fixed left & right indices
+    envR = twoSite_env_ind(M,F,site)
+    n1 = M[site].shape[0]
+    n2 = M[site+1].shape[0]
+    (n3,_,_) = env_shape(F[0][site])
+    (n4,_,_) = env_shape(F[0][envR])
+    blocks = np.zeros((n3,n4,n1,n2,n1,n2),dtype=np.complex_)
+    for mpoInd in range(len(W)):
+        W1,W2 = W[mpoInd][site],W[mpoInd][site+1]
+        if W1 is None: W1 = np.array([[np.eye(n1)]])
+        if W2 is None: W2 = np.array([[np.eye(n2)]])
+        blocks += np.einsum('ij,jlmn,lopq,ro->irmpnq',env_diag(F[mpoInd][site]),W1,W2,env_diag(F[mpoInd][envR]))
+    return np.reshape(blocks,(n3*n4,n1*n2,n1*n2))
+
+def guard_denom(denom):
+    # Keep small denominators from blowing up the correction vector
+    return np.where(np.abs(denom) < PRECOND_TOL,PRECOND_TOL,denom)
+
+def make_diag_precond(diagOp):
+    # Davidson correction (A_ii-e)^-1 dx for operator A with diagonal diagOp
+    def precond(dx,e,x0):
+        return dx/guard_denom(diagOp-e)
+    return precond
+
+def make_block_precond(blockOp,shape,nPhys,qnMask=None):
+    # Davidson correction solving (A_b-e) y = dx for each block A_b of
+    # the operator, where blockOp is ordered with the physical indices last
+    nBlock,k,_ = blockOp.shape
+    perm = list(range(nPhys,len(shape)))+list(range(nPhys))
+    blockShape = tuple(np.array(shape)[perm])
+    invPerm = np.argsort(perm)
+    eye = np.eye(k,dtype=bool)
+    fixDiag = np.zeros(blockOp.shape,dtype=bool)
+    if qnMask is not None:
+        # Decouple the elements outside of the particle number sector
+        blockMask = np.reshape(np.transpose(np.reshape(qnMask,shape),perm),(nBlock,k))
+        blockOp = np.where(blockMask[:,:,None] & blockMask[:,None,:],blockOp,0.)
+        fixDiag = (~blockMask)[:,:,None] & eye[None,:,:]
+    def precond(dx,e,x0):
+        if qnMask is not None:
+            dx_full = np.zeros(qnMask.shape,dtype=np.complex_)
+            dx_full[qnMask] = dx
         else:
-            mpo_diag = einsum('abnn->anb',W[mpoInd][site])
-        l_diag = einsum('lal->la',F[mpoInd][site])
-        r_diag = einsum('rbr->rb',F[mpoInd][site+1])
-        tmp = einsum('la,anb->lnb',l_diag,mpo_diag)
-        diag_mis = einsum('lnb,rb->nlr',tmp,r_diag)
-        diag += diag_mis.ravel()
-    return diag
+            dx_full = dx
+        dxb = np.reshape(np.transpose(np.reshape(dx_full,shape),perm),(nBlock,k,1))
+        A = np.where(fixDiag,1.,blockOp-e*eye[None,:,:])
+        try:
+            y = np.linalg.solve(A,dxb)
+            if not np.all(np.isfinite(y)): raise np.linalg.LinAlgError
+        except np.linalg.LinAlgError:
+            y = dxb/guard_denom(np.einsum('bii->bi',A)[:,:,None])
+        y = np.reshape(np.transpose(np.reshape(y,blockShape),invPerm),-1)
+        if qnMask is not None: y = y[qnMask]
+        return y
+    return precond
+
+def make_precond(diagFun,blockFun,M,W,F,site,shape,nPhys,usePrecond=False,qnMask=None,adjoint=False):
+    # Build the preconditioner for operator A = -H (or -H^dagger) ('diag',
+    # 'block' or True for 'diag'), otherwise return the residual unchanged
+    if usePrecond is True: usePrecond = 'diag'
+    if usePrecond == 'diag':
+        diagOp = -diagFun(M,W,F,site)
+        if adjoint: diagOp = np.conj(diagOp)
+        if qnMask is not None: diagOp = diagOp[qnMask]
+        return make_diag_precond(diagOp)
+    elif usePrecond == 'block':
+        blockOp = -blockFun(M,W,F,site)
+        if adjoint: blockOp = np.conj(np.swapaxes(blockOp,1,2))
+        return make_block_precond(blockOp,shape,nPhys,qnMask=qnMask)
+    def precond(dx,e,x0):
+        return dx
+    return precond
+
+def clear_precond_stats():
+    PRECOND_STATS.clear()
+
+def choose_precond():
+    # Pick the preconditioner with the fewest matvecs per solve so far,
+    # giving each a few trial solves first & retrying them periodically
+    for mode in PRECOND_MODES:
+        if mode not in PRECOND_STATS: PRECOND_STATS[mode] = [0,0]
+    nSolve = np.array([PRECOND_STATS[mode][1] for mode in PRECOND_MODES])
+    if (np.min(nSolve) < PRECOND_TRIALS) or (np.sum(nSolve)%PRECOND_RETRY == 0):
+        return PRECOND_MODES[np.argmin(nSolve)]
+    cost = [float(PRECOND_STATS[mode][0])/PRECOND_STATS[mode][1] for mode in PRECOND_MODES]
+    return PRECOND_MODES[np.argmin(cost)]
+
+def record_precond(mode,nMatvec):
+    if mode not in PRECOND_STATS: PRECOND_STATS[mode] = [0,0]
+    PRECOND_STATS[mode][0] += nMatvec
+    PRECOND_STATS[mode][1] += 1
 
 def calc_ham_oneSite(M,W,F,site):
     (n1,n2,n3) = M[site].shape
@@ -31,33 +176,36 @@ def calc_ham_oneSite(M,W,F,site):
     H = np.zeros((dim,dim),dtype=np.complex_)
     for mpoInd in range(len(W)):
         if W[mpoInd][site] is None:
-            tmp1 = einsum('lmin,kmq->linkq',np.array([[np.eye(2)]]),F[mpoInd][site+1])
+            tmp1 = einsum('lmin,kmq->linkq',np.array([[np.eye(2)]]),env_dense(F[mpoInd][site+1]))
         else:
-            tmp1 = einsum('lmin,kmq->linkq',W[mpoInd][site],F[mpoInd][site+1])
-        Htmp = einsum('jlp,linkq->ijknpq',F[mpoInd][site],tmp1)
+            tmp1 = einsum('lmin,kmq->linkq',W[mpoInd][site],env_dense(F[mpoInd][site+1]))
+        Htmp = einsum('jlp,linkq->ijknpq',env_dense(F[mpoInd][site]),tmp1)
         H += np.reshape(Htmp,(dim,dim))
     return H
 
+def twoSite_env_ind(M,F,site):
+    # Index of the environment to the right of site+1 (infinite
+    # dmrg only stores the environments on either side of the two sites)
+    if len(F[0]) > len(M): return site+2
+    return site+1
+
 def calc_ham_twoSite(M,W,F,site):
     # Create the Hamiltonian using site & site+1
-    #H +=einsum('ijk,jlmn,lopq,ros->mpirnqks',envList[mpoInd][0],mpoList[mpoInd][0],mpoList[mpoInd][1],envList[mpoInd][2])
-    (_,_,n1,_) = W[0][0].shape
-    (_,_,n2,_) = W[0][1].shape
-    (n3,_,_) = F[0][0].shape
-    (n4,_,_) = F[0][1].shape
+    envR = twoSite_env_ind(M,F,site)
+    n1 = M[site].shape[0]
+    n2 = M[site+1].shape[0]
+    (n3,_,_) = env_shape(F[0][site])
+    (n4,_,_) = env_shape(F[0][envR])
     dim = n1*n2*n3*n4
     H = np.zeros((dim,dim),dtype=np.complex_)
     for mpoInd in range(len(W)):
         # Put in identities where None operator
-        if W[mpoInd][site+1] is None:
-            W[mpoInd][site+1] = np.array([[np.eye(n1)]])
-        if W[mpoInd][site] is None:
-            W[mpoInd][site] = np.array([[np.eye(n1)]])
+        W1,W2 = W[mpoInd][site],W[mpoInd][site+1]
+        if W1 is None: W1 = np.array([[np.eye(n1)]])
+        if W2 is None: W2 = np.array([[np.eye(n2)]])
         # Contract envs with mpos to get effective ham
-        tmp1 = einsum('lopq,ros->lpqrs',W[mpoInd][site+1],F[mpoInd][site+1])
-        tmp2 = einsum('jlmn,lpqrs->jmnpqrs',W[mpoInd][site],tmp1)
-        tmp3 = einsum('ijk,jmnpqrs->mpirnqks',F[mpoInd][site],tmp2)
-        H += np.reshape(tmp3,(dim,dim))
+        Htmp = einsum_cached('ijk,jlmn,lopq,ros->mpirnqks',env_dense(F[mpoInd][site]),W1,W2,env_dense(F[mpoInd][envR]))
+        H += np.reshape(Htmp,(dim,dim))
     return H
 
 def calc_ham(M,W,F,site,oneSite=True):
@@ -101,74 +249,229 @@ def check_overlap(Mprev,vecs,E,preserveState=False,printStates=False,allowSwap=T
                 print('{}\t{}\t{}'.format(Mprev[indices[i]],vecs[indices[i],0],vecs[indices[i],1]))
     return E,vecs,np.abs(np.dot(Mprev,np.conj(vecs[:,0])))
 
-def make_ham_func_oneSite(M,W,F,site,usePrecond=False,debug=False):
-    # Define Hamiltonian function to give Hx
+def make_ham_func_oneSite(M,W,F,site,usePrecond=False,debug=False,qnMask=None,adjoint=False):
+    # Define Hamiltonian function to give Hx (or H^dagger x if adjoint)
     def Hfun(x):
         x_reshape = np.reshape(x,M[site].shape)
         fin_sum = np.zeros(x_reshape.shape,dtype=np.complex_)
         # Loop over all MPOs
         for mpoInd in range(len(W)):
-            if W[mpoInd][site] is None:
-                in_sum1 = einsum('ijk,lmk->ijlm',F[mpoInd][site+1],x_reshape)
-                fin_sum +=einsum('pnm,inom->opi',F[mpoInd][site],in_sum1)
+            if adjoint:
+                # Contract x with the bra indices, H^dagger x = (H^T x^*)^*
+                if W[mpoInd][site] is None:
+                    fin_sum += einsum_cached('pnm,ink,opi->omk',F[mpoInd][site],F[mpoInd][site+1],np.conj(x_reshape))
+                else:
+                    fin_sum += einsum_cached('pnm,njol,ijk,opi->lmk',F[mpoInd][site],W[mpoInd][site],F[mpoInd][site+1],np.conj(x_reshape))
+            elif W[mpoInd][site] is None:
+                fin_sum += einsum_cached('pnm,ink,omk->opi',F[mpoInd][site],F[mpoInd][site+1],x_reshape)
             else:
-                in_sum1 = einsum('ijk,lmk->ijlm',F[mpoInd][site+1],x_reshape)
-                in_sum2 = einsum('njol,ijlm->noim',W[mpoInd][site],in_sum1)
-                fin_sum +=einsum('pnm,noim->opi',F[mpoInd][site],in_sum2)
+                fin_sum += einsum_cached('pnm,njol,ijk,lmk->opi',F[mpoInd][site],W[mpoInd][site],F[mpoInd][site+1],x_reshape)
+        if adjoint: fin_sum = np.conj(fin_sum)
         # If desired, compare Hx function to analytic Hx
         if debug:
             H = calc_ham(M,W,F,site)
+            if adjoint: H = np.conj(H.T)
             assert(np.isclose(np.sum(np.abs(np.reshape(fin_sum,-1)-np.dot(H,x))),0))
         # Return flattened result
         return -np.reshape(fin_sum,-1)
-    # Precond often slows convergence
-    if usePrecond:
-        diag = calc_diag(M,W,F,site)
-        # Compare analytic diagonal and calculated
-        if debug:
-            H = calc_ham(M,W,F,site)
-            assert(np.isclose(np.sum(np.abs(diag-np.diag(H))),0))
-        # Return Davidson Preconditioner
-        def precond(dx,e,x0):
-            return dx/diag-e
-    else:
-        # Return original values, often speeds convergence
-        def precond(dx,e,x0):
-            return dx
+    # Only act within the allowed particle number sector
+    if is_block_env(F[0][site]):
+        Ws = [W[mpoInd][site] for mpoInd in range(len(W))]
+        Hfun = make_block_ham_func(Ws,[Fm[site] for Fm in F],[Fm[site+1] for Fm in F],
+                                   np.arange(M[site].shape[0]),adjoint=adjoint)
+    elif qnMask is not None:
+        Hfun = restrict_ham_func(Hfun,qnMask)
+    precond = make_precond(calc_diag,calc_block_diag,M,W,F,site,M[site].shape,1,
+                           usePrecond=usePrecond,qnMask=qnMask,adjoint=adjoint)
+    # Compare analytic diagonal and calculated
+    if debug:
+        H = calc_ham(M,W,F,site)
+        assert(np.isclose(np.sum(np.abs(calc_diag(M,W,F,site)-np.diag(H))),0))
     return Hfun,precond
 
-def make_ham_func_twoSite(M,W,F,site,usePrecond=False,debug=False):
-    # Define Hamiltonian function to give Hx
-    (n1,n2,n3) = M[0].shape
-    (n4,n5,n6) = M[1].shape
+def restrict_ham_func(Hfun,qnMask):
+    # Hfun acting on only the elements of x allowed by qnMask
+    def Hfun_qn(x):
+        x_full = np.zeros(qnMask.shape,dtype=np.complex_)
+        x_full[qnMask] = x
+        return Hfun(x_full)[qnMask]
+    return Hfun_qn
+
+def expand_vecs(vecs,qnMask):
+    # Put vectors from the allowed sector back into the full space
+    if qnMask is None: return vecs
+    vecs_full = np.zeros((len(qnMask),vecs.shape[1]),dtype=np.complex_)
+    vecs_full[qnMask,:] = vecs
+    return vecs_full
+
+def make_block_ham_func(W,FL,FR,qPhys,adjoint=False):
+    # Hfun (acting on the elements allowed by the particle number labels,
+    # in the order of qnMask) for charge block environments FL & FR of each
+    # mpo term, with W the mpo tensors between them & qPhys the charges of
+    # the physical index. x is split into blocks keyed by (left charge,
+    # physical index, right charge) & each term of H only contracts the
+    # blocks its environment blocks & mpo elements connect.
+    qL,qR = FL[0]['ket'],FR[0]['ket']
+    indL,indR = charge_index(qL),charge_index(qR)
+    mask = (qL[None,:,None]+qPhys[:,None,None]) == qR[None,None,:]
+    pos = np.zeros(mask.shape,dtype=int)
+    pos[mask] = np.arange(np.sum(mask))
+    keys,blockPos = [],[]
+    for p in range(len(qPhys)):
+        for q in indL:
+            if q+qPhys[p] in indR:
+                keys.append((q,p,q+qPhys[p]))
+                blockPos.append(pos[p][np.ix_(indL[q],indR[q+qPhys[p]])])
+    blockInd = dict([(key,i) for i,key in enumerate(keys)])
+    # Each pair of vector blocks is coupled by the terms of every mpo, which
+    # are joined along the channel index. These are stored as matrices, with
+    # the left environment block contracted with the mpo elements, so a term
+    # is two matrix products: Y[out] += FLW.(X[in].FR) (or the same with the
+    # bra & ket blocks swapped for H^dagger)
+    pairs = {}
+    for mpoInd in range(len(W)):
+        Fl,Fr = FL[mpoInd],FR[mpoInd]
+        indWL,indWR = charge_index(Fl['mpo']),charge_index(Fr['mpo'])
+        Wm = W[mpoInd]
+        if Wm is None:
+            Wm = np.einsum('lm,in->lmin',np.eye(len(Fl['mpo'])),np.eye(len(qPhys)))
+        for (qa,qm),FLb in Fl['blocks'].items():
+            for i in range(len(qPhys)):
+                for n in range(len(qPhys)):
+                    outKey,inKey = (qa,i,qa+qPhys[i]),(qm,n,qm+qPhys[n])
+                    if (outKey not in blockInd) or (inKey not in blockInd): continue
+                    frKey = (outKey[2],inKey[2])
+                    if frKey not in Fr['blocks']: continue
+                    c = frKey[0]-frKey[1]
+                    if c not in indWR: continue
+                    Wsl = Wm[indWL[qa-qm]][:,indWR[c],i,n]
+                    if not np.any(Wsl): continue
+                    pair = (blockInd[outKey],blockInd[inKey])
+                    pairs.setdefault(pair,[]).append((np.tensordot(FLb,Wsl,axes=([1],[0])),Fr['blocks'][frKey]))
+    terms = []
+    for (outInd,inInd),pairTerms in pairs.items():
+        # (bra left,ket left,mpo) & (bra right,mpo,ket right)
+        FLW = np.concatenate([t[0] for t in pairTerms],axis=2)
+        FRb = np.concatenate([t[1] for t in pairTerms],axis=1)
+        (n1,n2,nW) = FLW.shape
+        (n3,_,n4) = FRb.shape
+        if adjoint:
+            FLW = np.reshape(np.transpose(FLW,(1,0,2)),(n2,n1*nW))
+            FRb = np.reshape(FRb,(n3,nW*n4))
+            terms.append((inInd,outInd,FLW,FRb,(n1*nW,n4)))
+        else:
+            FLW = np.reshape(FLW,(n1,n2*nW))
+            FRb = np.reshape(np.transpose(FRb,(2,1,0)),(n4,nW*n3))
+            terms.append((outInd,inInd,FLW,FRb,(n2*nW,n3)))
+    def Hfun(x):
+        X = [x[bpos] for bpos in blockPos]
+        if adjoint: X = [np.conj(Xb) for Xb in X]
+        Y = [np.zeros(bpos.shape,dtype=np.complex_) for bpos in blockPos]
+        for outInd,inInd,FLW,FRb,shape in terms:
+            Y[outInd] += np.dot(FLW,np.reshape(np.dot(X[inInd],FRb),shape))
+        y = np.zeros(len(x),dtype=np.complex_)
+        for bpos,Yb in zip(blockPos,Y):
+            y[bpos] = Yb
+        if adjoint: y = np.conj(y)
+        return -y
+    return Hfun
+
+def make_ham_func_twoSite(M,W,F,site,usePrecond=False,debug=False,qnMask=None,adjoint=False):
+    # Define Hamiltonian function to give Hx (or H^dagger x if adjoint),
+    # with x ordered as (n_site,n_site+1,left,right)
+    envR = twoSite_env_ind(M,F,site)
+    n1 = M[site].shape[0]
+    n2 = M[site+1].shape[0]
+    (n3,_,_) = env_shape(F[0][site])
+    (n4,_,_) = env_shape(F[0][envR])
     def Hfun(x):
-        x_reshape = np.reshape(x,(n1,n4,n2,n6)) # PH - Check ordering???
+        x_reshape = np.reshape(x,(n1,n2,n3,n4))
         fin_sum = np.zeros(x_reshape.shape,dtype=np.complex_)
         for mpoInd in range(len(W)):
-            if W[mpoInd][site] is None:
-                pass # PH Adapt to No operator
+            # Put in identities where None operator
+            W1,W2 = W[mpoInd][site],W[mpoInd][site+1]
+            if W1 is None: W1 = np.array([[np.eye(n1)]])
+            if W2 is None: W2 = np.array([[np.eye(n2)]])
+            if adjoint:
+                fin_sum += einsum_cached('ijk,jlmn,lopq,ros,mpir->nqks',F[mpoInd][site],W1,W2,F[mpoInd][envR],np.conj(x_reshape))
             else:
-                in_sum1 = einsum('ros,nqks->ronqk',F[mpoInd][site+1],x_reshape)
-                in_sum2 = einsum('lopq,ronqk->lprnk',W[mpoInd][site+1],in_sum1)
-                in_sum3 = einsum('jlmn,lprnk->jmprk',W[mpoInd][site],in_sum2)
-                in_sum4 = einsum('ijk,jmprk->mpir',F[mpoInd][site],in_sum3)
-                fin_sum += in_sum4
-                #in_sum1 =  einsum('ijk,lkmn->ijlmn',F[mpoInd][1],x_reshape)
-                #in_sum2 =  einsum('jopl,ijlmn->ipomn',W[mpoInd][0],in_sum1)
-                #in_sum3 =  einsum('oqrm,ipomn->iprqn',W[mpoInd][1],in_sum2)
-                #fin_sum += einsum('sqn,iprqn->pirs',F[mpoInd][0],in_sum3)
+                fin_sum += einsum_cached('ijk,jlmn,lopq,ros,nqks->mpir',F[mpoInd][site],W1,W2,F[mpoInd][envR],x_reshape)
+        if adjoint: fin_sum = np.conj(fin_sum)
+        # If desired, compare Hx function to analytic Hx
+        if debug:
+            H = calc_ham_twoSite(M,W,F,site)
+            if adjoint: H = np.conj(H.T)
+            assert(np.isclose(np.sum(np.abs(np.reshape(fin_sum,-1)-np.dot(H,x))),0))
         return -np.reshape(fin_sum,-1)
-    if usePrecond:
-        print('No preconditioner available yet for two site optimization')
-    def precond(dx,e,x0):
-        return dx
+    # Only act within the allowed particle number sector
+    if is_block_env(F[0][site]):
+        # Treat both sites as one with a combined physical index
+        Ws = []
+        for mpoInd in range(len(W)):
+            W1,W2 = W[mpoInd][site],W[mpoInd][site+1]
+            if W1 is None: W1 = np.array([[np.eye(n1)]])
+            if W2 is None: W2 = np.array([[np.eye(n2)]])
+            W12 = np.einsum('jlmn,lopq->jompnq',W1,W2)
+            Ws.append(np.reshape(W12,(W12.shape[0],W12.shape[1],n1*n2,n1*n2)))
+        qPhys = (np.arange(n1)[:,None]+np.arange(n2)[None,:]).ravel()
+        Hfun = make_block_ham_func(Ws,[Fm[site] for Fm in F],[Fm[envR] for Fm in F],qPhys,adjoint=adjoint)
+    elif qnMask is not None:
+        Hfun = restrict_ham_func(Hfun,qnMask)
+    precond = make_precond(calc_diag_twoSite,calc_block_diag_twoSite,M,W,F,site,(n1,n2,n3,n4),2,
+                           usePrecond=usePrecond,qnMask=qnMask,adjoint=adjoint)
+    # Compare analytic diagonal and calculated
+    if debug:
+        H = calc_ham_twoSite(M,W,F,site)
+        assert(np.isclose(np.sum(np.abs(calc_diag_twoSite(M,W,F,site)-np.diag(H))),0))
     return Hfun,precond
 
-def make_ham_func(M,W,F,site,usePrecond=False,debug=False,oneSite=True):
+def make_guess(mpsL,site,state=0,oneSite=True):
+    # Flattened initial guess from the current mps
     if oneSite:
-        return make_ham_func_oneSite(M,W,F,site,usePrecond=usePrecond,debug=debug)
+        return np.reshape(mpsL[state][site],-1)
     else:
-        return make_ham_func_twoSite(M,W,F,site,usePrecond=usePrecond,debug=debug)
+        return np.reshape(einsum('ijk,lkm->iljm',mpsL[state][site],mpsL[state][site+1]),-1)
+
+def get_deflate(eigOpts):
+    # Projections of the lower states onto the local basis & their weight,
+    # set by the steps when excited states are found by deflation
+    if eigOpts is None: return None
+    return eigOpts.get('deflate')
+
+def deflate_ham_func(Hfun,deflate,qnMask=None):
+    # Hfun for H - w sum_j |r_j><l_j|/<l_j|r_j>, which moves the lower
+    # states r_j (with left eigenvectors l_j) away from the target. As the
+    # other right eigenvectors are orthogonal to all l_j, both their
+    # eigenvalues & eigenvectors are unchanged, so the next state is found
+    # as the lowest root
+    P,Q,w = deflate
+    if qnMask is not None: P,Q = P[qnMask,:],Q[qnMask,:]
+    def Hfun_deflate(x):
+        return Hfun(x)+w*np.dot(P,np.dot(np.conj(Q.T),x))
+    return Hfun_deflate
+
+def deflate_ham(H,deflate):
+    # Dense version of deflate_ham_func (H is not negated here)
+    if deflate is None: return H
+    P,Q,w = deflate
+    return H-w*np.dot(P,np.conj(Q.T))
+
+def make_ham_func(M,W,F,site,usePrecond=False,debug=False,oneSite=True,qnMask=None,adjoint=False,deflate=None):
+    if oneSite:
+        Hfun,precond = make_ham_func_oneSite(M,W,F,site,usePrecond=usePrecond,debug=debug,qnMask=qnMask,adjoint=adjoint)
+    else:
+        Hfun,precond = make_ham_func_twoSite(M,W,F,site,usePrecond=usePrecond,debug=debug,qnMask=qnMask,adjoint=adjoint)
+    if deflate is not None: Hfun = deflate_ham_func(Hfun,deflate,qnMask=qnMask)
+    return Hfun,precond
+
+def count_matvecs(Hfun,eigOpts):
+    # Record the number of matvecs done by the solver in eigOpts
+    if eigOpts is None: return Hfun
+    eigOpts['nMatvec'] = 0
+    def Hfun_count(x):
+        eigOpts['nMatvec'] += 1
+        return Hfun(x)
+    return Hfun_count
 
 def pick_eigs(w,v,nroots,x0):
     idx = np.argsort(np.real(w))
@@ -190,9 +493,16 @@ def orthonormalize(vecs):
 
 def calc_eigs_exact(mpsL,W,F,site,
                     nStates,preserveState=False,edgePreserveState=True,
-                    orthonormalize=False,oneSite=True):
+                    orthonormalize=False,oneSite=True,qnMask=None,
+                    eigOpts=None,adjoint=False):
+    if eigOpts is not None: eigOpts['nMatvec'] = 0
     H = calc_ham(mpsL[0],W,F,site,oneSite=oneSite)
-    Mprev = mpsL[0][site].ravel()
+    if adjoint: H = np.conj(H.T)
+    H = deflate_ham(H,get_deflate(eigOpts))
+    Mprev = make_guess(mpsL,site,oneSite=oneSite)
+    if qnMask is not None:
+        H = H[np.ix_(qnMask,qnMask)]
+        Mprev = Mprev[qnMask]
     vals,vecs = sla.eig(H)
     inds = np.argsort(vals)[::-1]
     E = vals[inds[:nStates]]
@@ -203,27 +513,35 @@ def calc_eigs_exact(mpsL,W,F,site,
         vecs = sla.orth(vecs)
     # Don't preserve state at ends
     if ((site == 0) or (site == len(mpsL[0])-1)) and edgePreserveState: preserveState = True
-    if oneSite:
-        E,vecs,ovlp = check_overlap(Mprev,vecs,E,preserveState=preserveState)
-    else: # PH - We should be able to find the overlap
-        E,vecs,ovlp = E,vecs,None
+    E,vecs,ovlp = check_overlap(Mprev,vecs,E,preserveState=preserveState)
+    vecs = expand_vecs(vecs,qnMask)
     return E,vecs,ovlp
 
 def calc_eigs_arnoldi(mpsL,W,F,site,
                       nStates,nStatesCalc=None,
                       preserveState=False,orthonormalize=False,
-                      oneSite=True,edgePreserveState=True):
-    if oneSite:
-        guess = np.reshape(mpsL[0][site],-1)
-    else:
-        guess = np.reshape(einsum('ijk,lkm->iljm',mpsL[state][site],mpsL[state][site+1]),-1)
-    Hfun,_ = make_ham_func(mpsL[0],W,F,site,oneSite=oneSite)
-    (n1,n2,n3) = mpsL[0][site].shape
-    H = LinearOperator((n1*n2*n3,n1*n2*n3),matvec=Hfun)
+                      oneSite=True,edgePreserveState=True,qnMask=None,
+                      eigOpts=None,adjoint=False):
+    guess = make_guess(mpsL,site,oneSite=oneSite)
+    if qnMask is not None: guess = guess[qnMask]
+    Hfun,_ = make_ham_func(mpsL[0],W,F,site,oneSite=oneSite,qnMask=qnMask,adjoint=adjoint,
+                           deflate=get_deflate(eigOpts))
+    Hfun = count_matvecs(Hfun,eigOpts)
+    tol,maxMatvec = 1e-5,None
+    if eigOpts is not None:
+        tol = eigOpts.get('tol',tol)
+        maxMatvec = eigOpts.get('max_cycle',maxMatvec)
+    dim = len(guess)
+    H = LinearOperator((dim,dim),matvec=Hfun)
     if nStatesCalc is None: nStatesCalc = nStates
-    nStates,nStatesCalc = min(nStates,n1*n2*n3-2), min(nStatesCalc,n1*n2*n3-2)
+    nStates,nStatesCalc = min(nStates,dim-2), min(nStatesCalc,dim-2)
+    # The matvec budget is given as restarts, each of which extends the
+    # krylov space from nStatesCalc to ncv vectors
+    ncv = min(dim,max(2*nStatesCalc+1,20))
+    maxiter = None
+    if maxMatvec is not None: maxiter = max(1,int(np.ceil(float(maxMatvec)/(ncv-nStatesCalc))))
     try:
-        vals,vecs = arnoldi(H,k=nStatesCalc,which='SR',v0=guess,tol=1e-5)
+        vals,vecs = arnoldi(H,k=nStatesCalc,which='SR',v0=guess,ncv=ncv,tol=tol,maxiter=maxiter)
     except Exception as exc:
         vals = exc.eigenvalues
         vecs = exc.eigenvectors
@@ -236,26 +554,45 @@ def calc_eigs_arnoldi(mpsL,W,F,site,
     # At the ends, we do not want to switch states when preserving state is off
     if ((site == 0) or (site == len(mpsL[0])-1)) and edgePreserveState: preserveState = True
     E,vecs,ovlp = check_overlap(guess,vecs,E,preserveState=preserveState)
+    vecs = expand_vecs(vecs,qnMask)
     return E,vecs,ovlp
 
 def calc_eigs_davidson(mpsL,W,F,site,
                        nStates,nStatesCalc=None,
                        preserveState=False,orthonormalize=False,
-                       oneSite=True,edgePreserveState=True):
-    Hfun,precond = make_ham_func(mpsL[0],W,F,site,oneSite=oneSite)
-    (n1,n2,n3) = mpsL[0][site].shape
+                       oneSite=True,edgePreserveState=True,qnMask=None,
+                       eigOpts=None,adjoint=False):
+    if eigOpts is None: eigOpts = {}
+    tol = eigOpts.get('tol',1e-16)
+    max_cycle = eigOpts.get('max_cycle',1000)
+    # Select the preconditioner
+    usePrecond = eigOpts.get('precond','auto')
+    autoPrecond = (usePrecond == 'auto')
+    if autoPrecond: usePrecond = choose_precond()
+    Hfun,precond = make_ham_func(mpsL[0],W,F,site,oneSite=oneSite,qnMask=qnMask,
+                                 usePrecond=usePrecond,adjoint=adjoint,
+                                 deflate=get_deflate(eigOpts))
+    Hfun = count_matvecs(Hfun,eigOpts)
+    dim = len(make_guess(mpsL,site,oneSite=oneSite))
+    if qnMask is not None: dim = np.sum(qnMask)
     if nStatesCalc is None: nStatesCalc = nStates
-    nStates,nStatesCalc = min(nStates,n1*n2*n3-1), min(nStatesCalc,n1*n2*n3-1)
+    nStates,nStatesCalc = min(nStates,dim-1), min(nStatesCalc,dim-1)
     guess = []
     # PH - Figure out new initial guess here !!!
     for state in range(nStates):
-        if oneSite:
-            guess.append(np.reshape(mpsL[state][site],-1))
+        guess.append(make_guess(mpsL,site,state=state,oneSite=oneSite))
+        if qnMask is not None: guess[state] = guess[state][qnMask]
+        # Davidson drops guesses with (near) zero norm
+        normGuess = np.linalg.norm(guess[state])
+        if normGuess > 0.:
+            guess[state] = guess[state]/normGuess
         else:
-            guess.append(np.reshape(einsum('ijk,lkm->iljm',mpsL[state][site],mpsL[state][site+1]),-1))
+            guess[state] = np.random.rand(len(guess[state]))/np.sqrt(len(guess[state]))
     # PH - Could add some convergence check
     #print(len(guess))
-    vals,vecso = davidson(Hfun,guess,precond,nroots=nStatesCalc,pick=pick_eigs,follow_state=False,tol=1e-16,max_cycle=1000)
+    vals,vecso = davidson(Hfun,guess,precond,nroots=nStatesCalc,pick=pick_eigs,follow_state=False,tol=tol,max_cycle=max_cycle)
+    if autoPrecond: record_precond(usePrecond,eigOpts['nMatvec'])
+    if VERBOSE > 4: print('\t\tPreconditioner = {}, Matvecs = {}'.format(usePrecond,eigOpts['nMatvec']))
     #print(len(vecso))
     sort_inds = np.argsort(np.real(vals))
     try:
@@ -285,27 +622,244 @@ def calc_eigs_davidson(mpsL,W,F,site,
     # At the ends, we do not want to switch states when preserving state is off
     if ((site == 0) or (site == len(mpsL[0])-1)) and edgePreserveState: preserveState = True
     E,vecs,ovlp = check_overlap(guess[0],vecs,E,preserveState=preserveState)
+    vecs = expand_vecs(vecs,qnMask)
     return E,vecs,ovlp
 
+def orth_against(t,V):
+    # Orthogonalize t against the orthonormal columns of V (twice, for
+    # stability) and return it with its remaining norm
+    for _ in range(2):
+        if V.shape[1] > 0: t = t-np.dot(V,np.dot(np.conj(V.T),t))
+    normT = np.linalg.norm(t)
+    return t,normT
+
+def calc_eigs_krylov(mpsL,W,F,site,
+                     nStates,preserveState=False,orthonormalize=False,
+                     oneSite=True,edgePreserveState=True,qnMask=None,
+                     eigOpts=None,adjoint=False):
+    # Thick restart (Krylov-Schur) eigensolver for A = -H. The space is
+    # grown with Ritz residuals (which span the same Krylov space as
+    # arnoldi) and restarted by keeping the best Ritz vectors. Ritz vectors
+    # left by the previous site (eigOpts['krylovSpace'], moved into this
+    # site's basis by the steps) are used as the first new directions.
+    if eigOpts is None: eigOpts = {}
+    tol = eigOpts.get('tol',1e-8)
+    maxMatvec = eigOpts.get('max_cycle',1000)
+    maxDim = eigOpts.get('krylovDim',KRYLOV_DIM)
+    nRecycle = eigOpts.get('recycleDim',KRYLOV_RECYCLE)
+    Hfun,_ = make_ham_func(mpsL[0],W,F,site,oneSite=oneSite,qnMask=qnMask,adjoint=adjoint,
+                           deflate=get_deflate(eigOpts))
+    Hfun = count_matvecs(Hfun,eigOpts)
+    # Initial space from the guesses
+    guess = []
+    for state in range(min(nStates,len(mpsL))):
+        guess.append(make_guess(mpsL,site,state=state,oneSite=oneSite))
+        if qnMask is not None: guess[state] = guess[state][qnMask]
+    dim = len(guess[0])
+    nStates = min(nStates,dim)
+    maxDim = min(max(maxDim,2*nStates+2),dim)
+    V = np.zeros((dim,0),dtype=np.complex_)
+    for state in range(len(guess)):
+        t,normT = orth_against(guess[state].astype(np.complex_),V)
+        if normT > 1e-10: V = np.concatenate([V,t[:,None]/normT],axis=1)
+    if V.shape[1] == 0: V = np.random.rand(dim,1)/np.sqrt(dim)+0.j
+    AV = np.array([Hfun(V[:,i]) for i in range(V.shape[1])]).T
+    # Directions recycled from the previous site
+    queue = []
+    recycled = eigOpts.get('krylovSpace',{}).get(adjoint)
+    if (recycled is not None) and (recycled.shape[0] == len(make_guess(mpsL,site,oneSite=oneSite))):
+        if qnMask is not None: recycled = recycled[qnMask,:]
+        queue = [recycled[:,i] for i in range(recycled.shape[1])]
+    nIter = 0
+    while True:
+        # Ritz pairs ordered by real part
+        G = np.dot(np.conj(V.T),AV)
+        w,Y = sla.eig(G)
+        inds = np.argsort(np.real(w))
+        w,Y = w[inds],Y[:,inds]
+        nWant = min(nStates,len(w))
+        R = np.dot(AV,Y[:,:nWant])-np.dot(V,Y[:,:nWant])*w[None,:nWant]
+        resid = np.linalg.norm(R,axis=0)/np.linalg.norm(np.dot(V,Y[:,:nWant]),axis=0)
+        conv = (resid < tol)
+        if np.all(conv) and (nWant == nStates): break
+        if (eigOpts['nMatvec'] >= maxMatvec) or (V.shape[1] >= dim): break
+        # Thick restart, keeping the best Ritz vectors (no matvecs needed)
+        if V.shape[1] >= maxDim:
+            nKeep = max(nStates+1,maxDim//2)
+            Q,_ = np.linalg.qr(Y[:,:nKeep])
+            V,AV = np.dot(V,Q),np.dot(AV,Q)
+            nIter += 1
+        # Next direction: a recycled vector while far from convergence,
+        # otherwise the residual of the first unconverged state
+        normT = 0.
+        while (len(queue) > 0) and (normT < 1e-8) and (np.max(resid) > np.sqrt(tol)):
+            t,normT = orth_against(queue.pop(0).astype(np.complex_),V)
+        if normT < 1e-8:
+            t,normT = orth_against(R[:,np.argmin(conv)],V)
+        if normT < 1e-12:
+            t,normT = orth_against(np.random.rand(dim)+0.j,V)
+        t = t/normT
+        V = np.concatenate([V,t[:,None]],axis=1)
+        AV = np.concatenate([AV,Hfun(t)[:,None]],axis=1)
+    eigOpts['nIter'] = nIter
+    vecs = np.dot(V,Y[:,:nStates])
+    vecs = vecs/np.linalg.norm(vecs,axis=0)[None,:]
+    E = -w[:nStates]
+    if VERBOSE > 4: print('\t\tKrylov Matvecs = {}, Restarts = {}, Residual = {}'.format(eigOpts['nMatvec'],nIter,np.max(resid)))
+    # Keep the best Ritz vectors for the next site
+    if nRecycle > 0:
+        Q,_ = np.linalg.qr(Y[:,:min(nRecycle,Y.shape[1])])
+        if 'krylovSpace' not in eigOpts: eigOpts['krylovSpace'] = {}
+        eigOpts['krylovSpace'][adjoint] = expand_vecs(np.dot(V,Q),qnMask)
+    # Eigenvectors of the non-hermitian H are not orthogonal, so replace
+    # them by an orthonormal basis of their span if requested
+    if (nStates > 1) and orthonormalize:
+        vecs = sla.orth(vecs)
+    # At the ends, we do not want to switch states when preserving state is off
+    if ((site == 0) or (site == len(mpsL[0])-1)) and edgePreserveState: preserveState = True
+    E,vecs,ovlp = check_overlap(guess[0]/np.linalg.norm(guess[0]),vecs,E,preserveState=preserveState)
+    vecs = expand_vecs(vecs,qnMask)
+    return E,vecs,ovlp
+
+def set_auto_alg(nStates,denseDim,iterAlg):
+    global AUTO_ALG_SET
+    AUTO_ALG['nStates'] = list(nStates)
+    AUTO_ALG['denseDim'] = list(denseDim)
+    AUTO_ALG['iterAlg'] = list(iterAlg)
+    AUTO_ALG_SET = True
+
+def save_auto_alg(fname=None):
+    if fname is None: fname = AUTO_ALG_FILE
+    if os.path.dirname(fname) != '': os.makedirs(os.path.dirname(fname),exist_ok=True)
+    with open(fname,'w') as f:
+        json.dump(AUTO_ALG,f)
+
+def load_auto_alg(fname=None):
+    if fname is None: fname = AUTO_ALG_FILE
+    with open(fname,'r') as f:
+        calib = json.load(f)
+    set_auto_alg(calib['nStates'],calib['denseDim'],calib['iterAlg'])
+
+def init_auto_alg():
+    # Load the calibrated thresholds if not yet set (keeping the defaults
+    # without a calibration file)
+    global AUTO_ALG_SET
+    if AUTO_ALG_SET: return
+    if os.path.isfile(AUTO_ALG_FILE):
+        load_auto_alg()
+    AUTO_ALG_SET = True
+
+def choose_alg(dim,nStates):
+    # Pick the local solver from the local dimension, using the thresholds
+    # calibrated for the closest number of states not above nStates
+    ind = 0
+    for i in range(len(AUTO_ALG['nStates'])):
+        if AUTO_ALG['nStates'][i] <= nStates: ind = i
+    if dim <= AUTO_ALG['denseDim'][ind]: return 'exact'
+    return AUTO_ALG['iterAlg'][ind]
+
 def calc_eigs(mpsL,W,F,site,nStates,
               alg='davidson',preserveState=False,edgePreserveState=True,
-              orthonormalize=False,oneSite=True):
+              orthonormalize=False,oneSite=True,qnMask=None,
+              eigOpts=None,adjoint=False,twoSided=False):
+    # eigOpts can hold the solver tolerance ('tol'), iteration
+    # limit ('max_cycle'), davidson preconditioner ('precond') & krylov
+    # subspace sizes ('krylovDim','recycleDim'), lower states to deflate
+    # ('deflate', see deflate_ham_func), and returns the number of
+    # matvecs ('nMatvec') & krylov restarts ('nIter')
+    # With adjoint, the eigenvectors of H^dagger (left eigenvectors of H)
+    # are found, with twoSided, those of both (see calc_eigs_twoSided)
+    if twoSided:
+        return calc_eigs_twoSided(mpsL,W,F,site,nStates,
+                                  alg=alg,
+                                  preserveState=preserveState,
+                                  edgePreserveState=edgePreserveState,
+                                  orthonormalize=orthonormalize,
+                                  oneSite=oneSite,
+                                  qnMask=qnMask,
+                                  eigOpts=eigOpts)
+    # Choose the solver for this site's dimension
+    if alg == 'auto':
+        init_auto_alg()
+        if qnMask is not None:
+            dim = np.sum(qnMask)
+        else:
+            dim = len(make_guess(mpsL,site,oneSite=oneSite))
+        alg = choose_alg(dim,nStates)
+        if VERBOSE > 4: print('\t\tLocal Dimension = {}, Solver = {}'.format(dim,alg))
+    # The sector may be too small for iterative solvers
+    if (qnMask is not None) and (np.sum(qnMask) <= nStates+2): alg = 'exact'
     if alg == 'davidson':
         E,vecs,ovlp = calc_eigs_davidson(mpsL,W,F,site,nStates,
                                          preserveState=preserveState,
                                          edgePreserveState=edgePreserveState,
                                          orthonormalize=orthonormalize,
-                                         oneSite=oneSite)
+                                         oneSite=oneSite,
+                                         qnMask=qnMask,
+                                         eigOpts=eigOpts,
+                                         adjoint=adjoint)
     elif alg == 'exact':
         E,vecs,ovlp = calc_eigs_exact(mpsL,W,F,site,nStates,
                                       preserveState=preserveState,
                                       edgePreserveState=edgePreserveState,
                                       orthonormalize=orthonormalize,
-                                      oneSite=oneSite)
+                                      oneSite=oneSite,
+                                      qnMask=qnMask,
+                                      eigOpts=eigOpts,
+                                      adjoint=adjoint)
     elif alg == 'arnoldi':
         E,vecs,ovlp = calc_eigs_arnoldi(mpsL,W,F,site,nStates,
                                         preserveState=preserveState,
                                         edgePreserveState=edgePreserveState,
                                         orthonormalize=orthonormalize,
-                                        oneSite=oneSite)
+                                        oneSite=oneSite,
+                                        qnMask=qnMask,
+                                        eigOpts=eigOpts,
+                                        adjoint=adjoint)
+    elif alg == 'krylov':
+        E,vecs,ovlp = calc_eigs_krylov(mpsL,W,F,site,nStates,
+                                       preserveState=preserveState,
+                                       edgePreserveState=edgePreserveState,
+                                       orthonormalize=orthonormalize,
+                                       oneSite=oneSite,
+                                       qnMask=qnMask,
+                                       eigOpts=eigOpts,
+                                       adjoint=adjoint)
+    return E,vecs,ovlp
+
+def calc_eigs_twoSided(mpsL,W,F,site,nStates,
+                       alg='davidson',preserveState=False,edgePreserveState=True,
+                       orthonormalize=False,oneSite=True,qnMask=None,
+                       eigOpts=None):
+    # Right & left eigenvectors of the effective hamiltonian of a right &
+    # left mps sharing the same basis, with mpsL holding the nStates right
+    # states followed by the nStates left states. Returns the right
+    # energies & the right vectors followed by the left vectors.
+    E,vecsR,ovlp = calc_eigs(mpsL[:nStates],W,F,site,nStates,
+                             alg=alg,
+                             preserveState=preserveState,
+                             edgePreserveState=edgePreserveState,
+                             orthonormalize=orthonormalize,
+                             oneSite=oneSite,
+                             qnMask=qnMask,
+                             eigOpts=eigOpts)
+    nMatvec = 0
+    if eigOpts is not None: nMatvec = eigOpts.get('nMatvec',0)
+    El,vecsL,_ = calc_eigs(mpsL[nStates:],W,F,site,nStates,
+                           alg=alg,
+                           preserveState=preserveState,
+                           edgePreserveState=edgePreserveState,
+                           orthonormalize=orthonormalize,
+                           oneSite=oneSite,
+                           qnMask=qnMask,
+                           eigOpts=eigOpts,
+                           adjoint=True)
+    if eigOpts is not None: eigOpts['nMatvec'] = eigOpts.get('nMatvec',0)+nMatvec
+    if VERBOSE > 4: print('\t\tRight E = {}, Left E = {}'.format(E,np.conj(El)))
+    # Keep one vector for every state even if the solver returned fewer
+    (_,nR),(_,nL) = vecsR.shape,vecsL.shape
+    vecs = np.zeros((vecsR.shape[0],2*nStates),dtype=np.complex_)
+    for state in range(nStates):
+        vecs[:,state] = vecsR[:,min(state,nR-1)]
+        vecs[:,nStates+state] = vecsL[:,min(state,nL-1)]
     return E,vecs,ovlp
@@ -0,0 +1,129 @@
+import numpy as np
+import threading
+
+# Contraction paths already planned, keyed by the subscripts and
+# the shapes of the operands. The subscripts used in the sweeps are
+# fixed, so this holds one plan per set of bond dimensions.
+PATH_CACHE = {}
+MAX_CACHE_SIZE = 10000
+# Largest intermediate (in elements) the planner may create
+MAX_INTERMEDIATE = 2**34
+# Work arrays for the intermediates of einsum_into, one per slot & dtype,
+# grown as needed and reused between calls (separately for each thread)
+WORKSPACE = threading.local()
+
+def plan_einsum(subscripts,*shapes):
+    key = (subscripts,)+tuple(shapes)
+    path = PATH_CACHE.get(key)
+    if path is None:
+        # Only the shapes are needed to find the cheapest ordering
+        ops = [np.broadcast_to(0.,shape) for shape in shapes]
+        path,_ = np.einsum_path(subscripts,*ops,optimize=('optimal',MAX_INTERMEDIATE))
+        if len(PATH_CACHE) >= MAX_CACHE_SIZE: PATH_CACHE.clear()
+        PATH_CACHE[key] = path
+    return path
+
+def einsum_cached(subscripts,*operands):
+    # Pairwise contractions along the planned path are done with
+    # tensordot (i.e. BLAS gemm) where possible
+    path = plan_einsum(subscripts,*[op.shape for op in operands])
+    return np.einsum(subscripts,*operands,optimize=path)
+
+def get_workspace(slot,shape,dtype):
+    # Array of the given shape backed by the work array of a slot
+    pool = WORKSPACE.__dict__
+    size = int(np.prod(shape))
+    key = (slot,np.dtype(dtype).char)
+    buf = pool.get(key)
+    if (buf is None) or (buf.size < size):
+        buf = np.empty(size,dtype=dtype)
+        pool[key] = buf
+    return buf[:size].reshape(shape)
+
+def clear_workspace():
+    WORKSPACE.__dict__.clear()
+
+def plan_pairwise(subscripts,*shapes):
+    # Turn the planned path into a list of matrix products, each given as
+    # the operands it takes, how to transpose them into matrices & the shape
+    # of the result. Returns None if a step is not a plain product
+    # (i.e. it has an index kept from both operands or summed in only one).
+    key = ('pairwise',subscripts)+tuple(shapes)
+    if key in PATH_CACHE: return PATH_CACHE[key]
+    path = plan_einsum(subscripts,*shapes)
+    inputs,output = subscripts.split('->')
+    terms = inputs.split(',')
+    dims = {}
+    for term,shape in zip(terms,shapes):
+        dims.update(zip(term,shape))
+    steps = []
+    for contract in path[1:]:
+        if len(contract) != 2:
+            steps = None
+            break
+        i,j = sorted(contract)
+        termB = terms.pop(j)
+        termA = terms.pop(i)
+        rest = ''.join(terms)+output
+        keptA = [c for c in termA if c in rest]
+        keptB = [c for c in termB if c in rest]
+        summed = [c for c in termA if c not in rest]
+        if (set(keptA) & set(keptB)) or (set(summed) != set(c for c in termB if c not in rest)):
+            steps = None
+            break
+        permA = tuple(termA.index(c) for c in keptA+summed)
+        permB = tuple(termB.index(c) for c in summed+keptB)
+        nA = int(np.prod([dims[c] for c in keptA]))
+        nS = int(np.prod([dims[c] for c in summed]))
+        nB = int(np.prod([dims[c] for c in keptB]))
+        shapeC = tuple(dims[c] for c in keptA+keptB)
+        steps.append((i,j,permA,(nA,nS),permB,(nS,nB),shapeC))
+        terms.append(''.join(keptA+keptB))
+    if steps is not None:
+        outPerm = tuple(terms[0].index(c) for c in output)
+        steps = (steps,outPerm)
+    if len(PATH_CACHE) >= MAX_CACHE_SIZE: PATH_CACHE.clear()
+    PATH_CACHE[key] = steps
+    return steps
+
+def workspace_matrix(A,perm,shape,slot,dtype):
+    # A transposed by perm & reshaped into a matrix, copied into the
+    # workspace unless it is already laid out that way
+    if (perm == tuple(range(A.ndim))) and (A.dtype == dtype) and A.flags.c_contiguous:
+        return A.reshape(shape)
+    buf = get_workspace(slot,tuple(A.shape[k] for k in perm),dtype)
+    np.copyto(buf,np.transpose(A,perm))
+    return buf.reshape(shape)
+
+def einsum_into(subscripts,*operands,out=None):
+    # Same as einsum_cached, but the intermediates are held in the
+    # workspace and the result is written into out (if given, with the
+    # shape & dtype of the result) instead of new arrays
+    plan = plan_pairwise(subscripts,*[op.shape for op in operands])
+    if plan is None:
+        result = einsum_cached(subscripts,*operands)
+        if out is None: return result
+        np.copyto(out,result)
+        return out
+    steps,outPerm = plan
+    dtype = np.result_type(*operands)
+    ops = list(operands)
+    for stepInd,(i,j,permA,shapeA,permB,shapeB,shapeC) in enumerate(steps):
+        B = ops.pop(j)
+        A = ops.pop(i)
+        A = workspace_matrix(A,permA,shapeA,('A',stepInd),dtype)
+        B = workspace_matrix(B,permB,shapeB,('B',stepInd),dtype)
+        if (stepInd == len(steps)-1) and (outPerm == tuple(range(len(outPerm)))):
+            # Last product written straight into the result
+            if out is None: out = np.empty(shapeC,dtype=dtype)
+            np.dot(A,B,out=out.reshape((shapeA[0],shapeB[1])))
+            return out
+        C = get_workspace(('C',stepInd),shapeC,dtype)
+        np.dot(A,B,out=C.reshape((shapeA[0],shapeB[1])))
+        ops.append(C)
+    if out is None: out = np.empty(tuple(ops[0].shape[k] for k in outPerm),dtype=dtype)
+    np.copyto(out,np.transpose(ops[0],outPerm))
+    return out
+
+def clear_einsum_cache():
+    PATH_CACHE.clear()
@@ -0,0 +1,224 @@
+import numpy as np
+import os
+import pickle
+import copy
+import shutil
+import tempfile
+import weakref
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+############################################################################
+# Disk Backed Environment Store
+#
+# When ENV_RAM_BUDGET (in bytes) is set, alloc_env holds the environment
+# blocks of each mpo in a DiskEnvList instead of a list. This is still a
+# list indexed by site (so the sweeps are unchanged), but whenever the
+# blocks held in memory by all such lists exceed the budget, those
+# farthest from the site last used in their list are written to .npy
+# files in a scratch directory. Spilled blocks are read back (memory
+# mapped, then copied) when used, and the next ENV_PREFETCH blocks in the
+# direction of the sweep are read in a background thread ahead of time.
+# Charge block environments (see qn_tools) are spilled the same way, with
+# their blocks pickled to a single file while the charge labels stay in
+# memory.
+###########################################################################
+
+ENV_RAM_BUDGET = None
+# Directory for scratch files (None uses the default temporary directory)
+ENV_SCRATCH_DIR = None
+# Number of blocks read ahead of the sweep
+ENV_PREFETCH = 2
+# Blocks smaller than this are never spilled
+ENV_MIN_SPILL = 2**16
+
+# Placeholder for a block that has been written to disk
+SpilledBlock = collections.namedtuple('SpilledBlock',['path'])
+
+# All live disk backed lists (sharing the budget) & the most memory
+# their blocks have held after enforcing the budget
+ENV_STORES = []
+ENV_PEAK_BYTES = 0
+PREFETCH_POOL = None
+
+def set_env_budget(budget,scratchDir=None,prefetch=2):
+    # Set the RAM budget (in bytes, None to keep everything in memory) &
+    # where environments created from now on spill to
+    global ENV_RAM_BUDGET,ENV_SCRATCH_DIR,ENV_PREFETCH
+    ENV_RAM_BUDGET = budget
+    ENV_SCRATCH_DIR = scratchDir
+    ENV_PREFETCH = prefetch
+
+def env_list():
+    # Container for the blocks of a new environment
+    if ENV_RAM_BUDGET is None:
+        return []
+    return DiskEnvList()
+
+def read_block(path):
+    if path.endswith('.pkl'):
+        with open(path,'rb') as f:
+            return pickle.load(f)
+    return np.array(np.load(path,mmap_mode='r'))
+
+def spilled_path(item):
+    # File holding a spilled block (or the blocks of a charge block
+    # environment), None if held in memory
+    if isinstance(item,SpilledBlock):
+        return item.path
+    if isinstance(item,dict) and isinstance(item['blocks'],SpilledBlock):
+        return item['blocks'].path
+    return None
+
+def item_bytes(item):
+    # Memory held by a block (or the blocks of a charge block environment)
+    if isinstance(item,np.ndarray):
+        return item.nbytes
+    if isinstance(item,dict) and isinstance(item['blocks'],dict):
+        return sum([blk.nbytes for blk in item['blocks'].values()])
+    return 0
+
+def prefetch_pool():
+    global PREFETCH_POOL
+    if PREFETCH_POOL is None: PREFETCH_POOL = ThreadPoolExecutor(max_workers=1)
+    return PREFETCH_POOL
+
+def live_stores():
+    stores = [ref() for ref in ENV_STORES]
+    ENV_STORES[:] = [ref for ref,store in zip(ENV_STORES,stores) if store is not None]
+    return [store for store in stores if store is not None]
+
+def env_resident_bytes():
+    # Memory held by the blocks of all disk backed environments
+    return sum([store.resident_bytes() for store in live_stores()])
+
+def enforce_env_budget():
+    # Spill the blocks farthest from the active sites until the budget is met
+    global ENV_PEAK_BYTES
+    if ENV_RAM_BUDGET is None: return
+    stores = live_stores()
+    total = sum([store.resident_bytes() for store in stores])
+    if total <= ENV_RAM_BUDGET:
+        ENV_PEAK_BYTES = max(ENV_PEAK_BYTES,total)
+        return
+    candidates = []
+    for store in stores:
+        for site in range(len(store)):
+            item = list.__getitem__(store,site)
+            dist = abs(site-store.active)
+            if (not isinstance(item,(np.ndarray,dict))) or (spilled_path(item) is not None): continue
+            nbytes = item_bytes(item)
+            if (dist > 1) and (nbytes >= ENV_MIN_SPILL):
+                candidates.append((dist,nbytes,store,site))
+    candidates.sort(key=lambda x: (x[0],x[1]),reverse=True)
+    for dist,nbytes,store,site in candidates:
+        if total <= ENV_RAM_BUDGET: break
+        store.spill(site)
+        total -= nbytes
+    ENV_PEAK_BYTES = max(ENV_PEAK_BYTES,total)
+
+class DiskEnvList(list):
+    # List of environment blocks which spills to disk (see above)
+
+    def __init__(self,*args):
+        list.__init__(self,*args)
+        self.scratch = tempfile.mkdtemp(prefix='env_',dir=ENV_SCRATCH_DIR)
+        weakref.finalize(self,shutil.rmtree,self.scratch,True)
+        self.nFiles = 0
+        self.active = 0
+        self.direction = 0
+        self.recent = [0]
+        self.pending = {}
+        ENV_STORES.append(weakref.ref(self))
+
+    def resident_bytes(self):
+        return sum([item_bytes(item) for item in list.__iter__(self)])
+
+    def spill(self,site):
+        item = list.__getitem__(self,site)
+        if isinstance(item,dict):
+            path = os.path.join(self.scratch,str(self.nFiles)+'.pkl')
+            with open(path,'wb') as f:
+                pickle.dump(item['blocks'],f,protocol=pickle.HIGHEST_PROTOCOL)
+            spilled = dict(item,blocks=SpilledBlock(path))
+        else:
+            path = os.path.join(self.scratch,str(self.nFiles)+'.npy')
+            np.save(path,item)
+            spilled = SpilledBlock(path)
+        self.nFiles += 1
+        list.__setitem__(self,site,spilled)
+
+    def load(self,site):
+        # Read a spilled block (waiting for its prefetch if started)
+        item = list.__getitem__(self,site)
+        path = spilled_path(item)
+        future = self.pending.pop(path,None)
+        if future is None:
+            block = read_block(path)
+        else:
+            block = future.result()
+        os.remove(path)
+        if isinstance(item,dict): block = dict(item,blocks=block)
+        list.__setitem__(self,site,block)
+        return block
+
+    def peek(self,site):
+        # Block at site without reading it back if spilled (i.e. for the
+        # charge labels of a block environment)
+        return list.__getitem__(self,site)
+
+    def discard(self,item):
+        # Remove the file of a spilled block that is no longer needed
+        path = spilled_path(item)
+        if path is not None:
+            future = self.pending.pop(path,None)
+            if (future is not None) and (not future.cancel()): future.result()
+            os.remove(path)
+
+    def prefetch(self):
+        for step in range(1,ENV_PREFETCH+1):
+            site = self.active+self.direction*step
+            if (self.direction == 0) or (site < 0) or (site >= len(self)): break
+            path = spilled_path(list.__getitem__(self,site))
+            if (path is not None) and (path not in self.pending):
+                self.pending[path] = prefetch_pool().submit(read_block,path)
+
+    def set_active(self,site):
+        # The local solves alternate between the blocks on both sides of a
+        # site, so the direction only changes when a new site is reached
+        if site not in self.recent:
+            self.direction = int(np.sign(site-self.active))
+            self.recent = [self.recent[-1],site]
+        self.active = site
+
+    def __getitem__(self,site):
+        if isinstance(site,slice):
+            return [self[i] for i in range(*site.indices(len(self)))]
+        if site < 0: site += len(self)
+        item = list.__getitem__(self,site)
+        self.set_active(site)
+        if spilled_path(item) is not None: item = self.load(site)
+        self.prefetch()
+        enforce_env_budget()
+        return item
+
+    def __setitem__(self,site,value):
+        if site < 0: site += len(self)
+        self.discard(list.__getitem__(self,site))
+        list.__setitem__(self,site,value)
+        self.set_active(site)
+        enforce_env_budget()
+
+    def __iter__(self):
+        for site in range(len(self)):
+            yield self[site]
+
+    def pop(self,site=-1):
+        if site < 0: site += len(self)
+        # Read the block back first if it was spilled
+        self[site]
+        return list.pop(self,site)
+
+    def __deepcopy__(self,memo):
+        # Copies are held in memory
+        return [copy.deepcopy(self[site],memo) for site in range(len(self))]
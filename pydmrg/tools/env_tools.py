@@ -1,51 +1,188 @@
 import numpy as np
 from pyscf.lib import einsum
-from tools.mps_tools import conj_mps
+from tools.einsum_tools import einsum_cached,einsum_into
+from tools.env_store import env_list,DiskEnvList,SpilledBlock
+from tools.qn_tools import *
 
-def alloc_env(M,W,mbd):
+# Write environment updates into the existing blocks (when their shape &
+# dtype match) with intermediates held in the einsum workspace, instead
+# of allocating new arrays at every step
+REUSE_ENV_BUFFERS = True
+# Store the environments of a calculation in a fixed particle number sector
+# as charge blocks (when the mpo conserves particle number, see qn_tools)
+QN_BLOCK_ENV = True
+
+def env_dtype(M,W,Ml=None):
+    # Type of the environment blocks of M (with bra Ml) for the mpo W
+    arrs = [M[site] for site in range(len(M))]
+    if Ml is not None: arrs += [Ml[site] for site in range(len(Ml)) if Ml[site] is not None]
+    for mpoInd in range(len(W)):
+        arrs += [W[mpoInd][site] for site in range(len(W[mpoInd])) if W[mpoInd][site] is not None]
+    return np.result_type(*arrs)
+
+def alloc_env(M,W,mbd,Ml=None):
+    # Blocks sized from the bond dimensions of M (and Ml, whose bonds are
+    # the first index) & the mpo. mbd is kept for the calling convention.
+    # Disk backed blocks (see env_store) are left empty until calculated,
+    # so the budget is not spent on zeros.
     N = len(M)
+    dtype = env_dtype(M,W,Ml=Ml)
+    if Ml is None: Ml = M
     # Initialize Empty FL to hold all F lists
     env_lst = []
     for mpoInd in range(len(W)):
-        if W[mpoInd][0] is not None:
-            _,mbdW,_,_ = W[mpoInd][0].shape
-        else: 
-            mbdW = 1
-        F = []
+        F = env_list()
         F.append(np.array([[[1]]]))
-        for site in range(int(N/2)):
-            F.append(np.zeros((min(2**(site+1),mbd),mbdW,min(2**(site+1),mbd))))
-        if N%2 is 1:
-            F.append(np.zeros((min(2**(int(N/2)+1),mbd),mbdW,min(2**(int(N/2)+1),mbd))))
-        for site in range(int(N/2)-1,0,-1):
-            F.append(np.zeros((min(2**(site),mbd),mbdW,min(2**site,mbd))))
+        for site in range(1,N):
+            if W[mpoInd][site-1] is not None:
+                mbdW = W[mpoInd][site-1].shape[1]
+            elif W[mpoInd][site] is not None:
+                mbdW = W[mpoInd][site].shape[0]
+            else:
+                mbdW = 1
+            Mlsite = M[site-1] if Ml[site-1] is None else Ml[site-1]
+            if isinstance(F,DiskEnvList):
+                F.append(np.zeros((0,mbdW,0),dtype=dtype))
+            else:
+                F.append(np.zeros((Mlsite.shape[2],mbdW,M[site-1].shape[2]),dtype=dtype))
         F.append(np.array([[[1]]]))
         # Add environment to env list
         env_lst.append(F)
     return env_lst
 
-def update_envL(M,W,F,site,Ml=None):
-    if Ml is None: Ml=conj_mps(M)
+def env_peek(F,site):
+    # Block at site of F, without reading it back if spilled to disk
+    if isinstance(F,DiskEnvList):
+        return F.peek(site)
+    return F[site]
+
+def env_buffer(F,site,shape,dtype):
+    # Existing block at site if it can hold the update, otherwise a new one
+    if isinstance(F,DiskEnvList):
+        # Do not read a spilled block back only to overwrite it
+        buf = list.__getitem__(F,site)
+        if isinstance(buf,SpilledBlock):
+            F.discard(buf)
+            list.__setitem__(F,site,np.zeros((0,0,0),dtype=dtype))
+            return np.empty(shape,dtype=dtype)
+    else:
+        buf = F[site]
+    if isinstance(buf,np.ndarray) and (buf.shape == shape) and (buf.dtype == dtype) and \
+       buf.flags.c_contiguous and buf.flags.writeable:
+        return buf
+    return np.empty(shape,dtype=dtype)
+
+def env_contract(subscripts,F,site,shape,*operands):
+    # Environment update to be stored as block site of F
+    if not REUSE_ENV_BUFFERS:
+        return einsum_cached(subscripts,*operands)
+    out = env_buffer(F,site,shape,np.result_type(*operands))
+    return einsum_into(subscripts,*operands,out=out)
+
+def block_mpo_slice(slices,Wsite,indRow,indCol,cRow,cCol,i,n):
+    # Elements of Wsite between the channels with charges cRow & cCol (None
+    # if all zero), kept in slices as the same ones are used for many blocks
+    key = (cRow,cCol,i,n)
+    if key not in slices:
+        Wsl = None
+        if (cRow in indRow) and (cCol in indCol):
+            Wsl = Wsite[indRow[cRow]][:,indCol[cCol],i,n]
+            if not np.any(Wsl): Wsl = None
+        slices[key] = Wsl
+    return slices[key]
+
+def add_block(blocks,key,T):
+    if key in blocks:
+        blocks[key] += T
+    else:
+        blocks[key] = T
+
+def block_envL(Mb,Mlb,Wsite,Fin,Fout):
+    # Right environment at site from the one at site+1, block by block,
+    # with Mb & Mlb the site blocks of the ket & (conjugated) bra and
+    # Wsite None for the identity
+    indIn,indOut = charge_index(Fin['mpo']),charge_index(Fout['mpo'])
+    blocks,slices = {},{}
+    for (qc,qf),Fb in Fin['blocks'].items():
+        (n1,n2,n3) = Fb.shape
+        for (qa,e,_),Mblk in [(key,blk) for key,blk in Mb.items() if key[2] == qf]:
+            # (bra,mpo*ket) of Fin contracted with the ket block
+            FM = np.reshape(np.dot(np.reshape(Fb,(n1*n2,n3)),Mblk.T),(n1,-1))
+            for (qx,b,_),Mlblk in [(key,blk) for key,blk in Mlb.items() if key[2] == qc]:
+                if Wsite is None:
+                    if b != e: continue
+                else:
+                    Wsl = block_mpo_slice(slices,Wsite,indOut,indIn,qx-qa,qc-qf,b,e)
+                    if Wsl is None: continue
+                T = np.reshape(np.dot(Mlblk,FM),(Mlblk.shape[0],n2,-1))
+                if Wsite is not None: T = np.matmul(Wsl,T)
+                add_block(blocks,(qx,qa),T)
+    return block_env(Fout['bra'],Fout['mpo'],Fout['ket'],blocks)
+
+def block_envR(Mb,Mlb,Wsite,Fin,Fout):
+    # Left environment at site+1 from the one at site, block by block
+    indIn,indOut = charge_index(Fin['mpo']),charge_index(Fout['mpo'])
+    blocks,slices = {},{}
+    for (qj,qp),Fb in Fin['blocks'].items():
+        (n1,n2,n3) = Fb.shape
+        for (_,n,qq),Mblk in [(key,blk) for key,blk in Mb.items() if key[0] == qp]:
+            FM = np.reshape(np.dot(np.reshape(Fb,(n1*n2,n3)),Mblk),(n1,-1))
+            for (_,i,qk),Mlblk in [(key,blk) for key,blk in Mlb.items() if key[0] == qj]:
+                if Wsite is None:
+                    if i != n: continue
+                else:
+                    Wsl = block_mpo_slice(slices,Wsite,indIn,indOut,qj-qp,qk-qq,i,n)
+                    if Wsl is None: continue
+                T = np.reshape(np.dot(Mlblk.T,FM),(Mlblk.shape[1],n2,-1))
+                if Wsite is not None: T = np.matmul(Wsl.T,T)
+                add_block(blocks,(qk,qq),T)
+    return block_env(Fout['bra'],Fout['mpo'],Fout['ket'],blocks)
+
+def update_envL(M,W,F,site,Ml=None,qn=None):
+    # Only conjugate the site being contracted
+    if Ml is None:
+        Mlsite = np.conj(M[site])
+    else:
+        Mlsite = Ml[site]
+    Mb = None
     for mpoInd in range(len(W)):
-        if W[mpoInd][site] is None:
-            tmp1 = einsum('eaf,cdf->eacd',M[site],F[mpoInd][site+1])
-            F[mpoInd][site] = einsum('bacy,bxc->xya',tmp1,Ml[site])
+        Fs = F[mpoInd][site+1]
+        if (qn is not None) and is_block_env(Fs):
+            # Charge block environments (bra & ket sharing the labels qn)
+            if Mb is None:
+                Mb = site_blocks(M[site],qn[site],qn[site+1])
+                Mlb = site_blocks(Mlsite,qn[site],qn[site+1])
+            Fout = block_env(qn[site],env_peek(F[mpoInd],site)['mpo'],qn[site])
+            F[mpoInd][site] = block_envL(Mb,Mlb,W[mpoInd][site],Fs,Fout)
+        elif W[mpoInd][site] is None:
+            shape = (Mlsite.shape[1],Fs.shape[1],M[site].shape[1])
+            F[mpoInd][site] = env_contract('baf,cyf,bxc->xya',F[mpoInd],site,shape,M[site],Fs,Mlsite)
         else:
-            tmp1 = einsum('eaf,cdf->eacd',M[site],F[mpoInd][site+1])
-            tmp2 = einsum('eacd,ydbe->acyb',tmp1,W[mpoInd][site])
-            F[mpoInd][site] = einsum('acyb,bxc->xya',tmp2,Ml[site])
+            shape = (Mlsite.shape[1],W[mpoInd][site].shape[0],M[site].shape[1])
+            F[mpoInd][site] = env_contract('eaf,cdf,ydbe,bxc->xya',F[mpoInd],site,shape,M[site],Fs,W[mpoInd][site],Mlsite)
     return F
 
-def update_envR(M,W,F,site,Ml=None):
-    if Ml is None: Ml=conj_mps(M)
+def update_envR(M,W,F,site,Ml=None,qn=None):
+    # Only conjugate the site being contracted
+    if Ml is None:
+        Mlsite = np.conj(M[site])
+    else:
+        Mlsite = Ml[site]
+    Mb = None
     for mpoInd in range(len(W)):
-        if W[mpoInd][site] is None:
-            tmp1 = einsum('jlp,ijk->lpik',F[mpoInd][site],Ml[site])
-            F[mpoInd][site+1] = einsum('npq,mpnk->kmq',M[site],tmp1)
+        Fs = F[mpoInd][site]
+        if (qn is not None) and is_block_env(Fs):
+            if Mb is None:
+                Mb = site_blocks(M[site],qn[site],qn[site+1])
+                Mlb = site_blocks(Mlsite,qn[site],qn[site+1])
+            Fout = block_env(qn[site+1],env_peek(F[mpoInd],site+1)['mpo'],qn[site+1])
+            F[mpoInd][site+1] = block_envR(Mb,Mlb,W[mpoInd][site],Fs,Fout)
+        elif W[mpoInd][site] is None:
+            shape = (Mlsite.shape[2],Fs.shape[1],M[site].shape[2])
+            F[mpoInd][site+1] = env_contract('jmp,njk,npq->kmq',F[mpoInd],site+1,shape,Fs,Mlsite,M[site])
         else:
-            tmp1 = einsum('jlp,ijk->lpik',F[mpoInd][site],Ml[site])
-            tmp2 = einsum('lmin,lpik->mpnk',W[mpoInd][site],tmp1)
-            F[mpoInd][site+1] = einsum('npq,mpnk->kmq',M[site],tmp2)
+            shape = (Mlsite.shape[2],W[mpoInd][site].shape[1],M[site].shape[2])
+            F[mpoInd][site+1] = env_contract('jlp,ijk,lmin,npq->kmq',F[mpoInd],site+1,shape,Fs,Mlsite,W[mpoInd][site],M[site])
     return F
 
 def update_env_inf(mps,mpo,env,mpsl=None):
@@ -56,6 +193,8 @@ def update_env_inf(mps,mpo,env,mpsl=None):
     env = update_envL(mps,mpo,env,1,Ml=mpsl)
     for mpoInd in range(len(mpo)):
         env[mpoInd][2] = env[mpoInd][1]
+        # Keep the update below from writing into the new right block
+        env[mpoInd][1] = []
     # Update Left Environment (moving right)
     env = update_envR(mps,mpo,env,0,Ml=mpsl)
     for mpoInd in range(len(mpo)):
@@ -75,14 +214,190 @@ def calc_env_inf(M,W,mbd,Ml=None,gaugeSite=0):
         env_lst.append(F)
     return env_lst
 
-def calc_env(M,W,mbd,Ml=None,gaugeSite=0):
+def pad_env(M,W,F):
+    # Zero pad environments to match an mps whose bond dimensions were
+    # increased by zero padding (the padded blocks contract to zero)
+    N = len(M)
+    for mpoInd in range(len(W)):
+        for site in range(N+1):
+            if site == 0:
+                (_,D,_) = M[0].shape
+            else:
+                (_,_,D) = M[site-1].shape
+            (n1,_,n3) = F[mpoInd][site].shape
+            F[mpoInd][site] = np.pad(F[mpoInd][site],((0,max(D-n1,0)),(0,0),(0,max(D-n3,0))),'constant')
+    return F
+
+def alloc_block_env(W,qn,charges):
+    # Empty charge block environments, with the boundary blocks set
+    N = len(qn)-1
+    env_lst = []
+    for mpoInd in range(len(W)):
+        F = env_list()
+        for bond in range(N+1):
+            F.append(block_env(qn[bond],charges[mpoInd][bond],qn[bond]))
+        F[0]['blocks'][(qn[0][0],qn[0][0])] = np.ones((1,1,1))
+        F[N]['blocks'][(qn[N][0],qn[N][0])] = np.ones((1,1,1))
+        env_lst.append(F)
+    return env_lst
+
+def calc_env(M,W,mbd,Ml=None,gaugeSite=0,qn=None):
     # PH - What to do with this gauge site stuff
+    # With particle number labels qn (and an mpo conserving particle number)
+    # the environments are stored as charge blocks
     N = len(M)
-    env_lst = alloc_env(M,W,mbd)
+    charges = None
+    if (qn is not None) and (Ml is None) and QN_BLOCK_ENV:
+        charges = [mpo_charges(W[mpoInd]) for mpoInd in range(len(W))]
+        if any([c is None for c in charges]): charges = None
+    if charges is None:
+        env_lst = alloc_env(M,W,mbd,Ml=Ml)
+    else:
+        env_lst = alloc_block_env(W,qn,charges)
     # Calculate Environment From Right
     for site in range(int(N)-1,gaugeSite,-1):
-        env_lst = update_envL(M,W,env_lst,site,Ml=Ml)
+        env_lst = update_envL(M,W,env_lst,site,Ml=Ml,qn=qn)
     # Calculate Environment from Left
     for site in range(gaugeSite):
-        env_lst = update_envR(M,W,env_lst,site,Ml=Ml)
+        env_lst = update_envR(M,W,env_lst,site,Ml=Ml,qn=qn)
     return env_lst
+
+def calc_ovlp_env(M,Mbra,gaugeSite=0):
+    # Environments of the overlap <Mbra|M> between two mps (which can have
+    # different bond dimensions), stored as the environments of an identity
+    # mpo with index order (Mbra bond, 1, M bond)
+    N = len(M)
+    Ml = [np.conj(Mbra[site]) for site in range(N)]
+    return calc_env(M,[[None]*N],1,Ml=Ml,gaugeSite=gaugeSite)
+
+def update_ovlp_envR(M,Mbra,F,site):
+    Ml = [None]*len(M)
+    Ml[site] = np.conj(Mbra[site])
+    return update_envR(M,[[None]*len(M)],F,site,Ml=Ml)
+
+def update_ovlp_envL(M,Mbra,F,site):
+    Ml = [None]*len(M)
+    Ml[site] = np.conj(Mbra[site])
+    return update_envL(M,[[None]*len(M)],F,site,Ml=Ml)
+
+def mpo_changed_sites(W,Wnew):
+    # Boolean array for each mpo term marking the sites whose tensor
+    # differs between the mpos W and Wnew
+    changed = []
+    for mpoInd in range(len(Wnew)):
+        N = len(Wnew[mpoInd])
+        siteChanged = np.zeros(N,dtype=bool)
+        for site in range(N):
+            Wold,Wsite = W[mpoInd][site],Wnew[mpoInd][site]
+            if (Wold is None) and (Wsite is None): continue
+            siteChanged[site] = (Wold is None) or (Wsite is None) or \
+                                (Wold.shape != Wsite.shape) or \
+                                (not np.array_equal(Wold,Wsite))
+        changed.append(siteChanged)
+    return changed
+
+def env_site_mpo(W,site,d):
+    # Mpo tensor at a site (with an identity in place of None)
+    if W[site] is None:
+        return np.reshape(np.eye(d),(1,1,d,d))
+    return W[site]
+
+def env_block_R(Fsite,Mlsite,Wsite,Msite):
+    # Left block at site+1 from the one at site
+    return einsum_cached('jlp,ijk,lmin,npq->kmq',Fsite,Mlsite,Wsite,Msite)
+
+def env_block_L(Fsite,Mlsite,Wsite,Msite):
+    # Right block at site from the one at site+1 (with the bond indices of
+    # Wsite swapped so both functions take the incoming channel first)
+    return einsum_cached('eaf,cdf,dybe,bxc->xya',Msite,Fsite,Wsite,Mlsite)
+
+def refresh_env_blocks(M,W,Wnew,F,changed,sites,moveRight,Ml=None):
+    # Update the blocks of a single mpo term, moving through sites in order.
+    # From the first changed site only the change in each block is carried,
+    # in the mpo bond channels it has reached, until it reaches every
+    # channel or another changed site, after which the blocks are updated
+    # in full.
+    full = False
+    chan,dF = None,None
+    for site in sites:
+        if chan is None and (not full) and (not changed[site]): continue
+        d = M[site].shape[0]
+        Mlsite = np.conj(M[site]) if Ml is None else Ml[site]
+        Wsite = env_site_mpo(Wnew,site,d)
+        Wold = env_site_mpo(W,site,d)
+        if moveRight:
+            inInd,outInd,block = site,site+1,env_block_R
+        else:
+            inInd,outInd,block = site+1,site,env_block_L
+            Wsite = np.swapaxes(Wsite,0,1)
+            Wold = np.swapaxes(Wold,0,1)
+        if full:
+            pass
+        elif (chan is None) and (Wsite.shape == Wold.shape):
+            # Contribution of the changed tensor elements
+            dW = Wsite-Wold
+            inChan = np.where(np.any(dW != 0.,axis=(1,2,3)))[0]
+            chan = np.where(np.any(dW != 0.,axis=(0,2,3)))[0]
+            dF = block(F[inInd][:,inChan,:],Mlsite,dW[np.ix_(inChan,chan)],M[site])
+        elif (chan is not None) and (not changed[site]):
+            # Carry the change through an unchanged site
+            Wsite_chan = Wsite[chan]
+            chan = np.where(np.any(Wsite_chan != 0.,axis=(0,2,3)))[0]
+            dF = block(dF,Mlsite,Wsite_chan[:,chan],M[site])
+            if len(chan) == 0:
+                chan = None
+                continue
+        else:
+            full = True
+        if full or (len(chan) == Wsite.shape[1]):
+            full = True
+            F[outInd] = block(F[inInd],Mlsite,Wsite,M[site])
+        else:
+            F[outInd] = F[outInd].astype(np.result_type(F[outInd],dF))
+            F[outInd][:,chan,:] += dF
+    return F
+
+def refresh_block_env(M,W,Wnew,F,gaugeSite=0):
+    # Charge block environments (with the particle number labels of M held
+    # in their charges) are recalculated from the first (last) changed site
+    # of each mpo term, unless the mpo channel charges change
+    N = len(M)
+    qn = [env_peek(F[0],bond)['ket'] for bond in range(N+1)]
+    charges = [mpo_charges(Wnew[mpoInd]) for mpoInd in range(len(Wnew))]
+    sameCharges = (len(W) == len(Wnew)) and all([c is not None for c in charges])
+    if sameCharges:
+        sameCharges = all([np.array_equal(charges[mpoInd][bond],env_peek(F[mpoInd],bond)['mpo'])
+                           for mpoInd in range(len(Wnew)) for bond in range(N+1)])
+    if not sameCharges:
+        return calc_env(M,Wnew,max([M[site].shape[2] for site in range(N)]),gaugeSite=gaugeSite,qn=qn)
+    changed = mpo_changed_sites(W,Wnew)
+    for mpoInd in range(len(Wnew)):
+        sites = np.where(changed[mpoInd])[0]
+        if len(sites) == 0: continue
+        Wm,Fm = [Wnew[mpoInd]],[F[mpoInd]]
+        for site in range(sites[0],gaugeSite):
+            Fm = update_envR(M,Wm,Fm,site,qn=qn)
+        for site in range(sites[-1],gaugeSite,-1):
+            Fm = update_envL(M,Wm,Fm,site,qn=qn)
+        F[mpoInd] = Fm[0]
+    return F
+
+def refresh_env(M,W,Wnew,F,gaugeSite=0,Ml=None):
+    # Update the environments F of M (gauged at gaugeSite) from the mpo W
+    # to Wnew, recomputing only the blocks that depend on changed sites.
+    # Left blocks are updated moving right from the first changed site and
+    # right blocks moving left from the last one, so a local change (i.e.
+    # new boundary rates of the asep, which only reach the channel of
+    # completed terms) costs far less than calc_env.
+    N = len(M)
+    if is_block_env(env_peek(F[0],0)):
+        return refresh_block_env(M,W,Wnew,F,gaugeSite=gaugeSite)
+    if len(W) != len(Wnew):
+        return calc_env(M,Wnew,max([M[site].shape[2] for site in range(N)]),Ml=Ml,gaugeSite=gaugeSite)
+    changed = mpo_changed_sites(W,Wnew)
+    for mpoInd in range(len(Wnew)):
+        F[mpoInd] = refresh_env_blocks(M,W[mpoInd],Wnew[mpoInd],F[mpoInd],changed[mpoInd],
+                                       range(gaugeSite),True,Ml=Ml)
+        F[mpoInd] = refresh_env_blocks(M,W[mpoInd],Wnew[mpoInd],F[mpoInd],changed[mpoInd],
+                                       range(N-1,gaugeSite,-1),False,Ml=Ml)
+    return F
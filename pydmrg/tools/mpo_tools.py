@@ -30,3 +30,144 @@ def mpo_conj_trans(mpo):
                 print('mpo shape = {}'.format(mpo[opind][site].shape))
                 mpoct[opind][site] = np.transpose(mpo[opind][site],(0,1,3,2)).conj()
     return mpoct
+
+def mpo_sum(mpoL,d=2):
+    # Combine a list of mpos into a single mpo (as a direct sum of
+    # their virtual bonds), putting identities at None sites
+    N = len(mpoL[0])
+    dtype = np.result_type(float,*[W.dtype for op in mpoL for W in op if W is not None])
+    mpo = []
+    for site in range(N):
+        ops = []
+        for op in mpoL:
+            if op[site] is None:
+                ops.append(np.array([[np.eye(d)]],dtype=dtype))
+            else:
+                ops.append(op[site])
+        if N == 1:
+            W = np.sum(ops,axis=0)
+        elif site == 0:
+            W = np.concatenate(ops,axis=1)
+        elif site == N-1:
+            W = np.concatenate(ops,axis=0)
+        else:
+            # Block diagonal in virtual bonds
+            nL = sum([op.shape[0] for op in ops])
+            nR = sum([op.shape[1] for op in ops])
+            W = np.zeros((nL,nR,d,d),dtype=dtype)
+            indL,indR = 0,0
+            for op in ops:
+                (n1,n2,_,_) = op.shape
+                W[indL:indL+n1,indR:indR+n2,:,:] = op
+                indL += n1
+                indR += n2
+        mpo.append(W)
+    return mpo
+
+def mpo_stack(mpoL,d=2):
+    # Combine a list of mpos into a single mpo whose left bond at the first
+    # site has one index per mpo (block diagonal at every site but the
+    # last), so contracting it gives the expectation value of each mpo
+    N = len(mpoL[0])
+    dtype = np.result_type(float,*[W.dtype for op in mpoL for W in op if W is not None])
+    mpo = []
+    for site in range(N):
+        ops = []
+        for op in mpoL:
+            if op[site] is None:
+                ops.append(np.array([[np.eye(d)]],dtype=dtype))
+            else:
+                ops.append(op[site])
+        if site == N-1:
+            W = np.concatenate(ops,axis=0)
+        else:
+            nL = sum([op.shape[0] for op in ops])
+            nR = sum([op.shape[1] for op in ops])
+            W = np.zeros((nL,nR,d,d),dtype=dtype)
+            indL,indR = 0,0
+            for op in ops:
+                (n1,n2,_,_) = op.shape
+                W[indL:indL+n1,indR:indR+n2,:,:] = op
+                indL += n1
+                indR += n2
+        mpo.append(W)
+    return mpo
+
+def unique_channels(M):
+    # Indices of the distinct nonzero columns of M & the index of each
+    # column among them (-1 for zero columns). Columns are compared through
+    # a random projection, which only coincides for identical columns.
+    proj = np.dot(np.random.RandomState(0).rand(M.shape[0]),M)
+    nonzero = np.any(M != 0,axis=0)
+    _,first,inv = np.unique(proj[nonzero],return_index=True,return_inverse=True)
+    cols = np.where(nonzero)[0]
+    order = np.argsort(first)
+    keep = cols[first[order]]
+    inds = -np.ones(M.shape[1],dtype=int)
+    inds[cols] = np.argsort(order)[inv.ravel()]
+    return keep,inds
+
+def merge_mpo_channels(mpo):
+    # Exactly merge identical (& drop zero) virtual bond states of an mpo,
+    # such as the identity strings shared by stacked or summed mpos
+    N = len(mpo)
+    mpo = [W.copy() for W in mpo]
+    # Sweep left to right
+    for site in range(N-1):
+        (n1,n2,n3,n4) = mpo[site].shape
+        M = np.reshape(np.transpose(mpo[site],(0,2,3,1)),(n1*n3*n4,n2))
+        keep,inds = unique_channels(M)
+        mpo[site] = mpo[site][:,keep,:,:]
+        W = np.zeros((len(keep),)+mpo[site+1].shape[1:],dtype=mpo[site+1].dtype)
+        np.add.at(W,inds[inds >= 0],mpo[site+1][inds >= 0])
+        mpo[site+1] = W
+    # Sweep right to left
+    for site in range(N-1,0,-1):
+        (n1,n2,n3,n4) = mpo[site].shape
+        M = np.reshape(mpo[site],(n1,n2*n3*n4))
+        keep,inds = unique_channels(M.T)
+        mpo[site] = mpo[site][keep,:,:,:]
+        W = np.zeros((mpo[site-1].shape[0],len(keep))+mpo[site-1].shape[2:],dtype=mpo[site-1].dtype)
+        np.add.at(W,(slice(None),inds[inds >= 0]),mpo[site-1][:,inds >= 0])
+        mpo[site-1] = W
+    return mpo
+
+def compress_mpo(mpo,tol=1e-12):
+    # Remove redundant virtual bond states of a single mpo with svds,
+    # dropping singular values smaller than tol (relative to the largest).
+    # Identical states are merged first, so the svds are of smaller matrices
+    N = len(mpo)
+    mpo = merge_mpo_channels(mpo)
+    # Sweep left to right
+    for site in range(N-1):
+        (n1,n2,n3,n4) = mpo[site].shape
+        M = np.reshape(np.transpose(mpo[site],(0,2,3,1)),(n1*n3*n4,n2))
+        (U,S,V) = np.linalg.svd(M,full_matrices=False)
+        nKeep = max(np.sum(S > tol*S[0]),1)
+        mpo[site] = np.transpose(np.reshape(U[:,:nKeep],(n1,n3,n4,nKeep)),(0,3,1,2))
+        mpo[site+1] = np.einsum('ij,jklm->iklm',S[:nKeep,None]*V[:nKeep,:],mpo[site+1])
+    # Sweep right to left
+    for site in range(N-1,0,-1):
+        (n1,n2,n3,n4) = mpo[site].shape
+        M = np.reshape(mpo[site],(n1,n2*n3*n4))
+        (U,S,V) = np.linalg.svd(M,full_matrices=False)
+        nKeep = max(np.sum(S > tol*S[0]),1)
+        mpo[site] = np.reshape(V[:nKeep,:],(nKeep,n2,n3,n4))
+        mpo[site-1] = np.einsum('ijkl,jm->imkl',mpo[site-1],U[:,:nKeep]*S[None,:nKeep])
+    return mpo
+
+def fuse_mpo(mpoL,tol=1e-12,d=2):
+    # Merge a list of mpos into a list with one compressed mpo
+    return [compress_mpo(mpo_sum(mpoL,d=d),tol=tol)]
+
+def mpo_bond_dims(mpoL):
+    # Virtual bond dimension to the right of each site, summed over all mpos
+    N = len(mpoL[0])
+    dims = np.zeros(N-1,dtype=int)
+    for op in mpoL:
+        for site in range(N-1):
+            if op[site] is None:
+                dims[site] += 1
+            else:
+                dims[site] += op[site].shape[1]
+    return dims
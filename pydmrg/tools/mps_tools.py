@@ -9,10 +9,38 @@ def calc_entanglement(S):
     # Ensure correct normalization
     S /= np.sqrt(np.dot(S,np.conj(S)))
     #assert(np.isclose(np.abs(np.sum(S*np.conj(S))),1.))
-    EEspec = -S*np.conj(S)*np.log2(S*np.conj(S))
+    S2 = S*np.conj(S)
+    # Zero singular values (i.e. from empty symmetry blocks) do not contribute
+    EEspec = -S2*np.log2(S2,out=np.zeros(S2.shape,dtype=S2.dtype),where=(np.abs(S2)>0.))
     EE = np.sum(EEspec)
     return EE,EEspec
 
+def calc_nkeep(S,mbd,truncTol=None):
+    # Number of (descending) singular values to keep, never more than mbd.
+    # If truncTol is given, keep only as many as are needed for the
+    # discarded weight to be below truncTol
+    nKeep = min(mbd,len(S))
+    if truncTol is not None:
+        S2 = np.real(S*np.conj(S))
+        normS = np.sum(S2)
+        if normS > 0.:
+            # Discarded weight when keeping the first i+1 values
+            discarded = np.append(np.cumsum(S2[::-1])[::-1][1:],0.)/normS
+            nKeep = min(nKeep,np.argmax(discarded <= truncTol)+1)
+    return max(nKeep,1)
+
+def truncated_svd(psi,mbd,truncTol=None):
+    # Do svd and keep only the mbd largest singular values
+    (U,S,V) = np.linalg.svd(psi,full_matrices=False)
+    nKeep = calc_nkeep(S,mbd,truncTol=truncTol)
+    # Calculate the discarded weight
+    normS = np.dot(S,S)
+    if normS > 0.:
+        truncErr = np.dot(S[nKeep:],S[nKeep:])/normS
+    else:
+        truncErr = 0.
+    return U[:,:nKeep],S[:nKeep],V[:nKeep,:],truncErr
+
 def calc_ent_right(M,v,site):
     (n1,n2,n3) = M[site].shape
     Mtmp = np.reshape(v,(n1,n2,n3))
@@ -159,6 +187,14 @@ def state2mps(N,psi,mbd,return_ee=True):
     else:
         return mps
 
+def mps2state(M):
+    # Contract an mps into the full state vector (first site slowest)
+    psi = M[0][:,0,:]
+    for site in range(1,len(M)):
+        psi = np.einsum('ak,ikj->aij',psi,M[site])
+        psi = np.reshape(psi,(-1,M[site].shape[2]))
+    return psi[:,0]
+
 def move_gauge_left(mps,site,returnEE=False):
     M_reshape = np.swapaxes(mps[site],0,1)
     (n1,n2,n3) = M_reshape.shape
@@ -360,7 +396,7 @@ def save_mps_npz(mpsL,fname,gaugeSite=0):
             Mdict['M'+str(site)] = mpsL[state][site]
         np.savez(fname+'state'+str(state)+'.npz',site=gaugeSite,**Mdict)
 
-def save_mps_hdf5(mpsL,fname,gaugeSite=0,comp_opts=4):
+def save_mps_hdf5(mpsL,fname,gaugeSite=0,comp_opts=4,qn=None,spec=None):
     nStates = len(mpsL)
     nSites = len(mpsL[0])
     with h5py.File(fname+'.hdf5','w') as f:
@@ -370,14 +406,48 @@ def save_mps_hdf5(mpsL,fname,gaugeSite=0,comp_opts=4):
             for site in range(nSites):
                 stateGroup.create_dataset('M'+str(site)+'/real',data=np.real(mpsL[state][site]),compression='gzip',compression_opts=comp_opts)
                 stateGroup.create_dataset('M'+str(site)+'/imag',data=np.imag(mpsL[state][site]),compression='gzip',compression_opts=comp_opts)
-            
+        # Save particle number labels of the bonds
+        if qn is not None:
+            for bond in range(len(qn)):
+                f.create_dataset('qn/bond'+str(bond),data=qn[bond])
+        # Save schmidt values of the first state at each bond
+        if spec is not None:
+            for bond in range(len(spec)):
+                if spec[bond] is not None:
+                    f.create_dataset('spec/bond'+str(bond),data=np.real(spec[bond]))
+
+def load_qn(fname):
+    # Load bond particle number labels (None if not saved)
+    qn = None
+    with h5py.File(fname+'.hdf5','r') as f:
+        if f.get('qn') is not None:
+            qn = []
+            bond = 0
+            while f.get('qn/bond'+str(bond)) is not None:
+                qn.append(np.array(f.get('qn/bond'+str(bond))))
+                bond += 1
+    return qn
 
-def save_mps(mpsL,fname,gaugeSite=0,fformat='hdf5',comp_opts=4):
+def load_spec(fname):
+    # Load schmidt values of the first state at each bond (None if not
+    # saved, or for bonds without them)
+    spec = None
+    with h5py.File(fname+'.hdf5','r') as f:
+        if f.get('spec') is not None:
+            # state0 holds the N sites & the gauge site
+            nBond = len(f.get('state0'))-2
+            spec = [None]*nBond
+            for bond in range(nBond):
+                if f.get('spec/bond'+str(bond)) is not None:
+                    spec[bond] = np.array(f.get('spec/bond'+str(bond)))
+    return spec
+
+def save_mps(mpsL,fname,gaugeSite=0,fformat='hdf5',comp_opts=4,qn=None,spec=None):
     if fname is not None:
         if fformat == 'npz':
             save_mps_npz(mpsL,fname,gaugeSite=gaugeSite)
         elif fformat == 'hdf5':
-            save_mps_hdf5(mpsL,fname,gaugeSite=gaugeSite,comp_opts=comp_opts)
+            save_mps_hdf5(mpsL,fname,gaugeSite=gaugeSite,comp_opts=comp_opts,qn=qn,spec=spec)
 
 def nSites(mpsL):
     return len(mpsL[0])
@@ -388,6 +458,45 @@ def maxBondDim(mpsL):
         mbd = np.max(np.array([mbd,np.max(mpsL[0][site].shape)]))
     return mbd
 
+def mps_spectra(M):
+    # Schmidt values at each bond of an mps (in any gauge), from a qr sweep
+    # to the right (so all sites are left canonical) & an svd sweep back
+    N = len(M)
+    M = [site.copy() for site in M]
+    for site in range(N-1):
+        (n1,n2,n3) = M[site].shape
+        (q,r) = np.linalg.qr(np.reshape(M[site],(n1*n2,n3)))
+        M[site] = np.reshape(q,(n1,n2,-1))
+        M[site+1] = np.tensordot(r,M[site+1],axes=(1,1)).swapaxes(0,1)
+    spec = [None]*(N-1)
+    for site in range(N-1,0,-1):
+        M_reshape = np.swapaxes(M[site],0,1)
+        (n1,n2,n3) = M_reshape.shape
+        (u,s) = sla.svd(np.reshape(M_reshape,(n1,n2*n3)),full_matrices=False)[:2]
+        spec[site-1] = s/np.linalg.norm(s)
+        M[site-1] = np.tensordot(M[site-1],u*s[None,:],axes=(2,0))
+    return spec
+
+def center_spectra(M,gaugeSite):
+    # Schmidt values at each bond of an mps in mixed canonical form with its
+    # center at gaugeSite, from svd sweeps out from the center to each end
+    N = len(M)
+    spec = [None]*(N-1)
+    C = M[gaugeSite]
+    for site in range(gaugeSite,N-1):
+        (n1,n2,n3) = C.shape
+        (s,v) = sla.svd(np.reshape(C,(n1*n2,n3)),full_matrices=False)[1:]
+        spec[site] = s/np.linalg.norm(s)
+        C = np.tensordot(s[:,None]*v,M[site+1],axes=(1,1)).swapaxes(0,1)
+    C = M[gaugeSite]
+    for site in range(gaugeSite,0,-1):
+        M_reshape = np.swapaxes(C,0,1)
+        (n1,n2,n3) = M_reshape.shape
+        (u,s) = sla.svd(np.reshape(M_reshape,(n1,n2*n3)),full_matrices=False)[:2]
+        spec[site-1] = s/np.linalg.norm(s)
+        C = np.tensordot(M[site-1],u*s[None,:],axes=(2,0))
+    return spec
+
 def orthonormalize_states(mps,mpo=None,gSite=None,printEnergies=False):
     from tools.contract import full_contract as contract
     # Load matrix product states
@@ -444,15 +553,59 @@ def contract_config(mps,config,norm='L1',state=0,gSite=None):
         res = np.dot(res,mps[state][site][config[site],:,:])
     return res[0,0]
 
+def contract_configs(mps,configs,norm=None,state=0,gSite=None):
+    # Amplitudes <c|mps> of all rows c of an (M x N) array of configurations
+    # (normalized so the amplitudes of all configurations sum to one if
+    # norm='L1' or their squares do if 'L2'). The configurations are sorted
+    # so those sharing their first sites follow each other, forming the
+    # paths of a trie, & each distinct prefix is contracted only once.
+    if isinstance(mps,str):
+        mps,gSite = load_mps(mps)
+    M = mps[state]
+    configs = np.asarray(configs,dtype=int)
+    if configs.ndim == 1: configs = configs[None,:]
+    (nConfig,N) = configs.shape
+    order = np.lexsort(configs.T[::-1])
+    configs = configs[order]
+    # New prefixes start where a configuration differs from the previous one
+    newPrefix = np.ones(configs.shape,dtype=bool)
+    newPrefix[1:] = np.logical_or.accumulate(configs[1:] != configs[:-1],axis=1)
+    # Contract the distinct prefixes site by site
+    vec = np.ones((1,1))
+    prefix = np.zeros(nConfig,dtype=int)
+    for site in range(N):
+        first = np.where(newPrefix[:,site])[0]
+        parent = prefix[first]
+        sigma = configs[first,site]
+        vecNext = np.zeros((len(first),M[site].shape[2]),dtype=np.result_type(vec,M[site]))
+        for i in range(M[site].shape[0]):
+            inds = np.where(sigma == i)[0]
+            if len(inds) > 0: vecNext[inds] = np.dot(vec[parent[inds]],M[site][i])
+        vec = vecNext
+        prefix = np.cumsum(newPrefix[:,site])-1
+    amp = np.zeros(nConfig,dtype=vec.dtype)
+    amp[order] = vec[prefix,0]
+    # Normalize
+    if norm == 'L1':
+        res = np.ones((1,1))
+        for site in range(N):
+            res = np.dot(res,np.sum(M[site],axis=0))
+        amp /= res[0,0]
+    elif norm == 'L2':
+        res = np.ones((1,1))
+        for site in range(N):
+            res = np.einsum('ab,iac,ibd->cd',res,np.conj(M[site]),M[site])
+        amp /= np.sqrt(np.real(res[0,0]))
+    return amp
+
 def all_config_prob(mps,norm='L2',state=0):
     # Load MPS
     if isinstance(mps,str):
         mps,gSite = load_mps(mps)
     N = len(mps[0])
     nStates = len(mps)
-    prob = np.zeros(2**N,dtype=np.complex_)
+    configs = (np.arange(2**N)[:,None] >> np.arange(N-1,-1,-1)[None,:]) & 1
+    prob = contract_configs(mps,configs,norm=norm,state=state)
     for i in range(2**N):
-        config = np.asarray(list(map(lambda x: int(x),'0'*(N-len(bin(i)[2:]))+bin(i)[2:])))
-        prob[i] = contract_config(mps,config,norm=norm,state=state,gSite=gSite)
         print(str(i)+"\t'"+'0'*(N-len(bin(i)[2:]))+bin(i)[2:]+'\t'+str(np.real(prob[i]))+'\t'+str(np.imag(prob[i])))
     return prob
@@ -0,0 +1,277 @@
+import numpy as np
+from tools.mps_tools import calc_nkeep
+
+############################################################################
+# U(1) (Particle Number) Symmetry Tools
+#
+# Each bond of an mps carries a list of charges, one for every index
+# of that bond, with qn[bond][i] the number of particles to the left of
+# the bond in basis state i. An mps site tensor M[n,a,b] can then only be
+# nonzero if qn[site][a] + n == qn[site+1][b]. The mps is still stored
+# densely, but the charges are used to:
+#   - restrict the local eigenproblem to the allowed elements
+#   - do the renormalization svd one charge block at a time
+#   - keep the calculation in a fixed particle number sector
+# When the mpo conserves particle number, each channel of its bonds also
+# carries a charge (the change in particle number of the terms it
+# belongs to) and the environments are stored as charge blocks, a dict
+# keyed by (bra charge, ket charge) holding the (bra,mpo,ket) elements
+# with those charges & mpo channel charge equal to their difference.
+# The environment updates & the effective hamiltonian then contract
+# only the nonzero blocks, with the site tensors split into blocks keyed
+# by (left charge, physical index, right charge). Otherwise the dense
+# environments are used, with the local problem restricted by a mask.
+###########################################################################
+
+def allowed_charges(N,nPart,bond):
+    # Particle numbers possible to the left of a bond
+    qmin = max(0,nPart-(N-bond))
+    qmax = min(bond,nPart)
+    q = np.arange(qmin,qmax+1)
+    # Order them by distance from uniform filling
+    inds = np.argsort(np.abs(q-float(bond*nPart)/float(N)),kind='stable')
+    return q[inds]
+
+def label_bond(N,nPart,bond,dim):
+    # Cycle through the allowed charges to label a bond
+    q = allowed_charges(N,nPart,bond)
+    return q[np.arange(dim)%len(q)]
+
+def create_qn(mps,nPart):
+    N = len(mps)
+    assert((nPart >= 0) and (nPart <= N))
+    qn = [np.array([0])]
+    for site in range(N):
+        qn.append(label_bond(N,nPart,site+1,mps[site].shape[2]))
+    return qn
+
+def pad_qn(qn,mps,nPart):
+    # Label indices added when the bond dimension is increased
+    N = len(mps)
+    for bond in range(1,N):
+        (_,_,n3) = mps[bond-1].shape
+        if len(qn[bond]) < n3:
+            qn[bond] = np.append(qn[bond],label_bond(N,nPart,bond,n3)[len(qn[bond]):])
+    return qn
+
+def site_mask(qn,site,d=2):
+    # Boolean array of the allowed elements of a site tensor
+    n = np.arange(d)
+    return (qn[site][None,:,None]+n[:,None,None]) == qn[site+1][None,None,:]
+
+def two_site_mask(qn,site,d=2):
+    # Boolean array of the allowed elements of a two site tensor,
+    # ordered as (n_site,n_site+1,left,right)
+    n = np.arange(d)
+    return (qn[site][None,None,:,None]+n[:,None,None,None]+n[None,:,None,None]) == qn[site+2][None,None,None,:]
+
+def apply_qn(mps,qn):
+    # Zero all elements that do not conserve particle number
+    for site in range(len(mps)):
+        (d,_,_) = mps[site].shape
+        mps[site] = mps[site]*site_mask(qn,site,d=d)
+    return mps
+
+def apply_all_qn(mpsL,qn):
+    for state in range(len(mpsL)):
+        mpsL[state] = apply_qn(mpsL[state],qn)
+    return mpsL
+
+def setup_all_qn(mpsL,nPart,qn=None):
+    # Create (or extend) the bond labels and remove disallowed elements
+    if qn is None:
+        qn = create_qn(mpsL[0],nPart)
+    else:
+        qn = pad_qn(qn,mpsL[0],nPart)
+    mpsL = apply_all_qn(mpsL,qn)
+    return mpsL,qn
+
+def qn_split_cols(P,rowQ):
+    # Split each column of P into its parts with a single row charge,
+    # returning the new columns and their charges
+    cols,colQ = [],[]
+    for q in np.unique(rowQ):
+        Pq = np.zeros(P.shape,dtype=P.dtype)
+        Pq[rowQ == q,:] = P[rowQ == q,:]
+        cols.append(Pq)
+        colQ.append(q*np.ones(P.shape[1],dtype=int))
+    return np.concatenate(cols,axis=1),np.concatenate(colQ)
+
+def qn_svd(psi,rowQ,colQ,nKeep,truncTol=None):
+    # Do an svd of a matrix that is block diagonal in the charges
+    # (rowQ and colQ), keeping the nKeep largest singular values
+    # (or fewer if truncTol is given).
+    # Extra left vectors in each block are kept (with zero singular
+    # value) so that there are always nKeep orthonormal columns in U.
+    (nRow,nCol) = psi.shape
+    vals,charges,rows,uvecs,cols,vvecs = [],[],[],[],[],[]
+    for q in np.unique(rowQ):
+        rInds = np.where(rowQ == q)[0]
+        cInds = np.where(colQ == q)[0]
+        if len(cInds) == 0:
+            u,s,v = np.eye(len(rInds)),np.zeros(0),np.zeros((0,0))
+        else:
+            u,s,v = np.linalg.svd(psi[np.ix_(rInds,cInds)],full_matrices=True)
+        for j in range(len(rInds)):
+            if j < len(s):
+                vals.append(s[j])
+                vvecs.append(v[j,:])
+            else:
+                vals.append(0.)
+                vvecs.append(np.zeros(len(cInds)))
+            charges.append(q)
+            rows.append(rInds)
+            uvecs.append(u[:,j])
+            cols.append(cInds)
+    # Keep largest singular values from all blocks
+    vals = np.array(vals)
+    inds = np.argsort(-vals,kind='stable')
+    inds = inds[:calc_nkeep(vals[inds],nKeep,truncTol=truncTol)]
+    U = np.zeros((nRow,len(inds)),dtype=psi.dtype)
+    V = np.zeros((len(inds),nCol),dtype=psi.dtype)
+    for i,ind in enumerate(inds):
+        U[rows[ind],i] = uvecs[ind]
+        V[i,cols[ind]] = vvecs[ind]
+    S = vals[inds]
+    Q = np.array(charges)[inds]
+    # Calculate the discarded weight
+    normS = np.dot(vals,vals)
+    if normS > 0.:
+        truncErr = 1.-np.dot(S,S)/normS
+    else:
+        truncErr = 0.
+    return U,S,V,truncErr,Q
+
+def make_mps_right_qn(M,qn):
+    # Right canonicalize an mps one charge block at a time. This keeps
+    # the bond labels fixed, so all states can share the same qn.
+    N = len(M)
+    for i in range(int(N)-1,0,-1):
+        M_reshape = np.swapaxes(M[i],0,1)
+        (n1,n2,n3) = M_reshape.shape
+        M_reshape = np.reshape(M_reshape,(n1,n2*n3))
+        colQ = (qn[i+1][None,:]-np.arange(n2)[:,None]).ravel()
+        B = np.zeros(M_reshape.shape,dtype=M_reshape.dtype)
+        X = np.zeros((n1,n1),dtype=M_reshape.dtype)
+        for q in np.unique(qn[i]):
+            rInds = np.where(qn[i] == q)[0]
+            cInds = np.where(colQ == q)[0]
+            if len(cInds) == 0: continue
+            # LQ decomposition of the block
+            Qb,Rb = np.linalg.qr(M_reshape[np.ix_(rInds,cInds)].T)
+            (_,k) = Qb.shape
+            B[np.ix_(rInds[:k],cInds)] = Qb.T
+            X[np.ix_(rInds,rInds[:k])] = Rb.T
+        M[i] = np.swapaxes(np.reshape(B,(n1,n2,n3)),0,1)
+        M[i-1] = np.einsum('klj,ji->kli',M[i-1],X)
+    return M
+
+def make_all_mps_right_qn(mpsL,qn):
+    for state in range(len(mpsL)):
+        mpsL[state] = make_mps_right_qn(mpsL[state],qn)
+    return mpsL
+
+def charge_index(labels):
+    # Indices of a bond with each charge
+    return dict([(q,np.where(labels == q)[0]) for q in np.unique(labels)])
+
+def mpo_bond_dims(W):
+    # Bond dimensions of an mpo (as used for its environments)
+    N = len(W)
+    dims = [1]
+    for site in range(1,N):
+        if W[site-1] is not None:
+            dims.append(W[site-1].shape[1])
+        elif W[site] is not None:
+            dims.append(W[site].shape[0])
+        else:
+            dims.append(1)
+    dims.append(1)
+    return dims
+
+def follow_mpo_charges(W):
+    # Charges of the mpo channels reached from the left boundary, following
+    # the nonzero elements W[l,r,i,n] (which change the particle number by
+    # i-n), & which channels are reached. Returns None if a channel is
+    # reached with two different charges.
+    N = len(W)
+    dims = mpo_bond_dims(W)
+    charges = [np.zeros(1,dtype=int)]
+    reached = [np.ones(1,dtype=bool)]
+    for site in range(N):
+        cOut = np.zeros(dims[site+1],dtype=int)
+        rOut = np.zeros(dims[site+1],dtype=bool)
+        if W[site] is None:
+            if dims[site] != dims[site+1]: return None
+            cOut[:],rOut[:] = charges[site],reached[site]
+        else:
+            for (l,r,i,n) in zip(*np.nonzero(W[site])):
+                if not reached[site][l]: continue
+                q = charges[site][l]+i-n
+                if rOut[r] and (cOut[r] != q): return None
+                cOut[r],rOut[r] = q,True
+        charges.append(cOut)
+        reached.append(rOut)
+    return charges,reached
+
+def mpo_charges(W):
+    # Charges of the channels on each bond of the mpo W, from the left for
+    # channels reached from the left boundary & from the right for the
+    # rest (the others only hold zeros in the environments, so are set
+    # to 0). Returns None if the mpo does not conserve particle number.
+    left = follow_mpo_charges(W)
+    # Following the mpo from the right, with bra & ket swapped
+    Wrev = [None if Ws is None else np.transpose(Ws,(1,0,3,2)) for Ws in W[::-1]]
+    right = follow_mpo_charges(Wrev)
+    if (left is None) or (right is None): return None
+    (cL,rL),(cR,rR) = left,(right[0][::-1],right[1][::-1])
+    charges = []
+    for bond in range(len(W)+1):
+        if np.any(rL[bond] & rR[bond] & (cL[bond] != cR[bond])): return None
+        charges.append(np.where(rL[bond],cL[bond],np.where(rR[bond],cR[bond],0)))
+    return charges
+
+def site_blocks(Msite,qL,qR):
+    # Split a site tensor M[n,a,b] into its allowed blocks, keyed by
+    # (left charge, physical index, right charge)
+    indL,indR = charge_index(qL),charge_index(qR)
+    blocks = {}
+    for n in range(Msite.shape[0]):
+        for q in indL:
+            if q+n not in indR: continue
+            blocks[(q,n,q+n)] = Msite[n][np.ix_(indL[q],indR[q+n])]
+    return blocks
+
+def block_env(qBra,qMpo,qKet,blocks=None):
+    # Environment stored as charge blocks (see above)
+    if blocks is None: blocks = {}
+    return {'bra':qBra,'mpo':qMpo,'ket':qKet,'blocks':blocks}
+
+def is_block_env(Fs):
+    return isinstance(Fs,dict)
+
+def env_shape(Fs):
+    if is_block_env(Fs):
+        return (len(Fs['bra']),len(Fs['mpo']),len(Fs['ket']))
+    return Fs.shape
+
+def env_dense(Fs):
+    # Environment as a dense (bra,mpo,ket) array
+    if not is_block_env(Fs): return Fs
+    indB,indW,indK = charge_index(Fs['bra']),charge_index(Fs['mpo']),charge_index(Fs['ket'])
+    dtype = np.result_type(*([np.float_]+list(Fs['blocks'].values())))
+    F = np.zeros(env_shape(Fs),dtype=dtype)
+    for (qa,qk),blk in Fs['blocks'].items():
+        F[np.ix_(indB[qa],indW[qa-qk],indK[qk])] = blk
+    return F
+
+def env_diag(Fs):
+    # Elements F[a,w,a] of an environment, shape (bond,mpo)
+    if not is_block_env(Fs): return np.einsum('pnp->pn',Fs)
+    (n1,n2,_) = env_shape(Fs)
+    indB,indW = charge_index(Fs['bra']),charge_index(Fs['mpo'])
+    diag = np.zeros((n1,n2),dtype=np.complex_)
+    for (qa,qk),blk in Fs['blocks'].items():
+        if qa != qk: continue
+        diag[np.ix_(indB[qa],indW[0])] = np.einsum('awa->aw',blk)
+    return diag